@@ -0,0 +1,335 @@
+"""
+Headless bulk rendering: python -m app.cli render manifest.csv [--processes N]
+
+Renders every row of a CSV manifest in a warm pool of render processes
+(app/services/render_pool.py), without the API or a browser. Columns (header
+row required, only `audio` is mandatory):
+
+    audio      track to render (relative paths are resolved against the manifest)
+    cover      cover image (empty: plain disc)
+    artist     default "Unknown Artist"
+    title      default: the audio file name
+    start_sec  default 0
+    end_sec    default start_sec + 30
+    output     output file name (default "{artist} - {title}.mp4")
+
+Each finished row is appended to a results CSV (default: next to the manifest,
+`<manifest>.results.csv`) as soon as it completes. On a re-run, rows whose
+render parameters match a `done` result and whose output still exists are
+skipped, so an interrupted run resumes where it stopped. Rows are rendered
+grouped by cover, and each render process keeps the rotation cycles it built
+(generate_video(..., keep_cycle=True)), so a cover is pre-rendered once per
+process rather than once per row.
+
+Renders run in the BATCH priority class (niced FFmpeg, see scheduler.py).
+Ctrl-C / SIGTERM stops starting rows and waits for running renders; a second
+signal terminates them (they are rendered again on the next run).
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+from app.services.render_pool import PROCESSES, RenderPool
+from app.services.scheduler import BATCH, render_options
+from app.services.video_generator import RenderCancelled
+
+
+DEFAULT_SEGMENT_SECONDS = 30
+POLL_SECONDS = 0.2
+# A running row's progress is printed at most this often
+PROGRESS_PRINT_SECONDS = 5
+
+RESULT_FIELDS = [
+    "key", "status", "output", "audio", "cover", "artist", "title",
+    "start_sec", "end_sec", "seconds", "finished_at", "error",
+]
+
+
+class ManifestError(ValueError):
+    """The manifest cannot be rendered as a whole (missing column, duplicate outputs)."""
+
+
+def _safe_name(text: str) -> str:
+    # Same file name rules as the API's outputs
+    return "".join(c if c.isalnum() or c in " -_" else "" for c in text).strip()
+
+
+def load_manifest(manifest_path: Path, output_dir: Path) -> list:
+    """Validated render rows: {"line", "key", "params", "error"} (error set for unusable rows)."""
+    base = manifest_path.parent
+    with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or "audio" not in [n.strip() for n in reader.fieldnames]:
+            raise ManifestError(f"{manifest_path}: header row with an 'audio' column required")
+        rows = []
+        for line, raw in enumerate(reader, start=2):
+            row = {(k or "").strip(): (v or "").strip() for k, v in raw.items()}
+            rows.append(_parse_row(row, line, base, output_dir))
+
+    outputs = {}
+    for row in rows:
+        output = row["params"]["output_path"]
+        if output in outputs:
+            raise ManifestError(f"lines {outputs[output]} and {row['line']} both write {output}")
+        outputs[output] = row["line"]
+    return rows
+
+
+def _parse_row(row: dict, line: int, base: Path, output_dir: Path) -> dict:
+    audio = Path(row.get("audio", ""))
+    if not audio.is_absolute():
+        audio = base / audio
+    cover = None
+    if row.get("cover"):
+        cover = Path(row["cover"])
+        if not cover.is_absolute():
+            cover = base / cover
+
+    artist = row.get("artist") or "Unknown Artist"
+    title = row.get("title") or audio.stem
+    output = row.get("output") or f"{_safe_name(artist)} - {_safe_name(title)}.mp4"
+    params = {
+        "audio_path": str(audio),
+        "cover_path": str(cover) if cover else None,
+        "artist": artist,
+        "title": title,
+        "start_sec": 0.0,
+        "end_sec": 0.0,
+        "output_path": str(output_dir / output),
+    }
+
+    error = None
+    try:
+        params["start_sec"] = float(row.get("start_sec") or 0)
+        params["end_sec"] = float(row.get("end_sec") or params["start_sec"] + DEFAULT_SEGMENT_SECONDS)
+    except ValueError:
+        error = "start_sec/end_sec must be numbers"
+    if error is None and not params["end_sec"] > params["start_sec"] >= 0:
+        error = "end_sec must be after start_sec"
+    if not row.get("audio") or not audio.is_file():
+        error = f"audio not found: {audio}"
+    elif cover is not None and not cover.is_file():
+        error = f"cover not found: {cover}"
+
+    # Identifies the render: a changed row is rendered again even if its output exists
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return {"line": line, "key": key, "params": params, "error": error}
+
+
+def load_done(results_path: Path) -> set:
+    """Keys of rows recorded as done in an earlier run."""
+    done = set()
+    try:
+        with open(results_path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                if record.get("status") == "done":
+                    done.add(record.get("key"))
+                else:
+                    done.discard(record.get("key"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+class ResultsWriter:
+    """Appends one line per finished row and flushes it, so a crash loses nothing recorded."""
+
+    def __init__(self, path: Path):
+        new = not path.exists() or path.stat().st_size == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+        if new:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, row: dict, status: str, seconds: float = 0.0, error: str = ""):
+        params = row["params"]
+        self._writer.writerow({
+            "key": row["key"],
+            "status": status,
+            "output": params["output_path"],
+            "audio": params["audio_path"],
+            "cover": params["cover_path"] or "",
+            "artist": params["artist"],
+            "title": params["title"],
+            "start_sec": params["start_sec"],
+            "end_sec": params["end_sec"],
+            "seconds": round(seconds, 2),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "error": error,
+        })
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class BulkRender:
+    def __init__(self, rows: list, results: ResultsWriter, processes: int):
+        self.rows = rows
+        self.results = results
+        self.processes = processes
+        self.running: dict = {}  # key -> (row, Future, submitted at)
+        self.progress: dict = {}  # key -> (percent, encoder stats, render started at)
+        self.printed: dict = {}  # key -> percent last printed
+        self.counts = {"done": 0, "error": 0, "not_rendered": 0}
+        self.stopping = False
+        self.aborting = False
+
+    def handle_signal(self, signum, frame):
+        if self.stopping:
+            self.aborting = True
+        else:
+            print("Stopping after running renders (signal again to abort)")
+        self.stopping = True
+
+    def run(self) -> dict:
+        total = len(self.rows)
+        pending = list(self.rows)
+        pool = RenderPool(self.processes)
+        last_print = time.monotonic()
+        try:
+            while pending or self.running:
+                self._reap(total)
+                if self.aborting:
+                    break
+                if self.stopping and not self.running:
+                    break
+                # One queued row per process, so a worker never waits for the next submit
+                while pending and not self.stopping and len(self.running) < 2 * self.processes:
+                    row = pending.pop(0)
+                    self.running[row["key"]] = (row, pool.submit(
+                        progress_callback=self._progress_recorder(row["key"]),
+                        keep_cycle=True,
+                        **row["params"],
+                        **render_options(BATCH, False),
+                    ), time.monotonic())
+                if time.monotonic() - last_print >= PROGRESS_PRINT_SECONDS:
+                    self._print_progress()
+                    last_print = time.monotonic()
+                time.sleep(POLL_SECONDS)
+        finally:
+            pool.shutdown(wait=not self.aborting)
+        self._reap(total)
+        self.counts["not_rendered"] += len(pending) + len(self.running)
+        return self.counts
+
+    def _progress_recorder(self, key: str):
+        def on_progress(pct, stats=None):
+            started_at = self.progress[key][2] if key in self.progress else time.monotonic()
+            self.progress[key] = (pct, stats or {}, started_at)
+
+        return on_progress
+
+    def _print_progress(self):
+        for key, (row, future, _) in self.running.items():
+            pct, stats, _ = self.progress.get(key, (0, {}, None))
+            if not pct or self.printed.get(key) == pct:
+                continue
+            self.printed[key] = pct
+            detail = ""
+            if stats.get("eta_seconds") is not None:
+                detail = f" (eta {stats['eta_seconds']:.0f}s)"
+            print(f"    {pct:3d}% {Path(row['params']['output_path']).name}{detail}")
+
+    def _reap(self, total: int):
+        for key, (row, future, started_at) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[key]
+            # Render time, without the time spent queued in the pool
+            started_at = self.progress.pop(key, (0, {}, started_at))[2]
+            self.printed.pop(key, None)
+            name = Path(row["params"]["output_path"]).name
+            seconds = time.monotonic() - started_at
+            error = future.exception()
+            if error is None:
+                self.counts["done"] += 1
+                self.results.write(row, "done", seconds)
+                status = "✓"
+            elif isinstance(error, RenderCancelled) or self.aborting:
+                # Not recorded: rendered again on the next run
+                self.counts["not_rendered"] += 1
+                continue
+            else:
+                self.counts["error"] += 1
+                self.results.write(row, "error", seconds, str(error))
+                status = "✗"
+            finished = self.counts["done"] + self.counts["error"]
+            print(f"  {status} [{finished}/{total}] {name} ({seconds:.1f}s)")
+
+
+def render(args) -> int:
+    manifest = Path(args.manifest)
+    output_dir = Path(args.output_dir) if args.output_dir else manifest.with_name(f"{manifest.stem}-renders")
+    results_path = Path(args.results) if args.results else manifest.with_name(f"{manifest.stem}.results.csv")
+    try:
+        rows = load_manifest(manifest, output_dir.resolve())
+    except (OSError, ManifestError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return 2
+
+    done = set() if args.force else load_done(results_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = ResultsWriter(results_path)
+    todo, skipped, invalid = [], 0, 0
+    for row in rows:
+        if row["error"]:
+            invalid += 1
+            results.write(row, "error", error=row["error"])
+            print(f"  ✗ line {row['line']}: {row['error']}")
+        elif row["key"] in done and os.path.exists(row["params"]["output_path"]):
+            skipped += 1
+        else:
+            todo.append(row)
+    # Rows sharing a cover follow each other, so render processes reuse its rotation cycle
+    todo.sort(key=lambda r: r["params"]["cover_path"] or "")
+
+    print(
+        f"{len(rows)} rows: {len(todo)} to render, {skipped} already rendered, {invalid} invalid; "
+        f"{args.processes} process(es), outputs in {output_dir}, results in {results_path}"
+    )
+    bulk = BulkRender(todo, results, max(1, args.processes))
+    signal.signal(signal.SIGINT, bulk.handle_signal)
+    signal.signal(signal.SIGTERM, bulk.handle_signal)
+    try:
+        counts = bulk.run()
+    finally:
+        results.close()
+    print(
+        f"Rendered {counts['done']}, failed {counts['error'] + invalid}, "
+        f"skipped {skipped}, not rendered {counts['not_rendered']}"
+    )
+    if counts["not_rendered"]:
+        return 130
+    return 1 if counts["error"] or invalid else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Sonivo command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = commands.add_parser("render", help="Render every row of a CSV manifest")
+    render_parser.add_argument("manifest", help="CSV with audio, cover, artist, title, start_sec, end_sec, output columns")
+    render_parser.add_argument(
+        "--processes", type=int, default=PROCESSES,
+        help="Concurrent renders (default: SONIVO_POOL_PROCESSES or 1)",
+    )
+    render_parser.add_argument("--output-dir", help="Directory for the videos (default: <manifest>-renders/)")
+    render_parser.add_argument("--results", help="Results CSV (default: <manifest>.results.csv)")
+    render_parser.add_argument("--force", action="store_true", help="Render every row, even ones already done")
+    render_parser.set_defaults(handler=render)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 """
 FastAPI main application for Sonivo.
 """
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routes import video
+from app.services import job_queue, metrics, storage
 
 # Directories
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,7 +27,29 @@ TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-app = FastAPI(title="Sonivo", description="Music Video Generator for Instagram")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if job_queue.RENDER_MODE == "queue":
+        video.render_queue()
+    elif job_queue.RENDER_MODE == "pool":
+        # Start the workers now so they are warm before the first job
+        await asyncio.to_thread(video.render_processes)
+    # Periodic quota/age eviction for uploads/ and outputs/
+    storage.start()
+    # Ingest audio dropped into SONIVO_WATCH_DIR; the API still serves without it
+    try:
+        video.start_watch_folder()
+    except OSError as e:
+        print(f"Watch folder disabled: {e}")
+    yield
+    video.stop_watch_folder()
+    if job_queue.RENDER_MODE == "pool":
+        # Like thread mode, renders do not outlive the API
+        await asyncio.to_thread(video.render_processes().shutdown, wait=False)
+
+
+app = FastAPI(title="Sonivo", description="Music Video Generator for Instagram", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -51,3 +77,9 @@ app.include_router(video.router, prefix="/api")
 @app.get("/")
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Render/API metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -2,19 +2,31 @@
 API routes for video generation.
 Uses background threads for video generation so progress polling works.
 """
+import asyncio
+import math
 import os
+import shutil
 import uuid
 import json
-import zipfile
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Optional
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
-from app.services.audio_processor import extract_metadata, generate_waveform_peaks, extract_audio_segment
-from app.services.video_generator import generate_video, generate_video_batch
+from app.services import eta, job_queue, metrics, precompute, render_pool, scheduler, storage, watch_folder
+from app.services.image_processor import normalize_cover
+from app.services.audio_processor import (
+    create_preview_proxy, extract_metadata, generate_waveform_peaks, extract_audio_segment,
+)
+from app.services.timing import SpanRecorder, current_recorder, mark, recording, span
+from app.services.video_generator import RenderCancelled, generate_video
+from app.services.zip_stream import stream_zip
 
 router = APIRouter()
 
@@ -24,9 +36,78 @@ OUTPUT_DIR = BASE_DIR / "outputs"
 
 # In-memory progress tracking: job_id -> {progress: int, status: str, result: dict|None}
 _jobs = {}
+# Guards status changes between render threads and cancels
+_jobs_lock = threading.Lock()
+
+# Per-job timelines (Chrome trace JSON via /api/trace/{id}); opt in per request
+# with trace=true, or for every job with SONIVO_TRACE_JOBS=1. Oldest dropped first.
+TRACE_JOBS = os.environ.get("SONIVO_TRACE_JOBS", "0") == "1"
+MAX_TRACES = 100
+_traces: "OrderedDict[str, SpanRecorder]" = OrderedDict()
+
+# SONIVO_RENDER_MODE=queue: jobs go to the SQLite queue and are rendered by app.worker
+QUEUE_POLL_SECONDS = 1.0
+_queue: Optional[job_queue.JobQueue] = None
+# SONIVO_RENDER_MODE=pool: jobs render in the warm process pool of this API
+_pool: Optional[render_pool.RenderPool] = None
+
+# Concurrent renders in this process (thread and pool modes); interactive singles are
+# scheduled ahead of batch tracks (app/services/scheduler.py)
+RENDER_SLOTS = int(os.environ.get(
+    "SONIVO_RENDER_SLOTS", str(render_pool.PROCESSES if job_queue.RENDER_MODE == "pool" else 2)
+))
+_renders = scheduler.Scheduler(RENDER_SLOTS)
+if job_queue.RENDER_MODE != "queue":
+    metrics.JOBS_QUEUED.set_function(_renders.waiting)
+
+# New renders are refused with 503 + Retry-After while a job of their class would wait
+# longer than this for a slot (predicted from the eta.py throughput model); 0 disables
+MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("SONIVO_MAX_QUEUE_WAIT", "600"))
+
+# Single jobs nobody has polled /api/progress for this long (tab closed, client gone)
+# are cancelled; 0 disables. Generous because browsers throttle timers in background tabs.
+ABANDON_SECONDS = float(os.environ.get("SONIVO_ABANDON_SECONDS", "120"))
+ABANDON_CHECK_SECONDS = 5
+_abandon_watcher: Optional[threading.Thread] = None
+# Queue-mode jobs started by this API that may still be running: job_id -> last poll (monotonic)
+_queue_polls: dict = {}
+
+# Finished batches whose ZIP is streamed on demand: batch_id -> {files, tracklist, recorder}
+MAX_BATCHES = 100
+_batches: "OrderedDict[str, dict]" = OrderedDict()
+
+# SONIVO_WATCH_DIR: audio files dropped there are ingested like uploads (watch_folder.py).
+# With SONIVO_WATCH_RENDER=1 each one also renders its first SONIVO_WATCH_SEGMENT seconds
+# as a BATCH job, at most SONIVO_WATCH_CONCURRENCY of them at a time.
+WATCH_RENDER = os.environ.get("SONIVO_WATCH_RENDER", "0") == "1"
+WATCH_SEGMENT_SECONDS = float(os.environ.get("SONIVO_WATCH_SEGMENT", "30"))
+WATCH_CONCURRENCY = int(os.environ.get("SONIVO_WATCH_CONCURRENCY", "1"))
+MAX_WATCHED = 100
+_watcher: Optional[watch_folder.WatchFolder] = None
+_watch_renders: Optional[ThreadPoolExecutor] = None
+# Recent watch-folder ingestions: file_id -> record (oldest dropped first)
+_watched: "OrderedDict[str, dict]" = OrderedDict()
 
 # Supported audio formats
 AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".ogg", ".aac", ".wma", ".aif", ".aiff"}
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg", ".wav": "audio/wav", ".flac": "audio/flac", ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg", ".aac": "audio/aac", ".wma": "audio/x-ms-wma", ".aif": "audio/aiff",
+    ".aiff": "audio/aiff",
+}
+
+# Files derived from an upload that share its file_id prefix (never the render source)
+PREVIEW_SUFFIX = "_preview.m4a"
+DERIVED_SUFFIXES = ("_cover.jpg", "_cover.png", "_cover_thumb.jpg", PREVIEW_SUFFIX)
+
+# Preview proxies are transcoded in the background after upload: file_id -> done event.
+# The preview endpoint waits this long for a pending proxy before falling back to the original.
+PREVIEW_WAIT_SECONDS = float(os.environ.get("SONIVO_PREVIEW_WAIT", "10"))
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"  # file_ids are never reused
+_previews: dict = {}
+# file_ids whose original was served for preview; they keep getting it so a player's
+# follow-up range requests never switch to a different file mid-stream
+_original_previews: set = set()
 
 
 @router.post("/upload")
@@ -36,6 +117,8 @@ async def upload_audio(file: UploadFile = File(...)):
     if ext not in AUDIO_EXTENSIONS:
         raise HTTPException(400, f"Unsupported format: {ext}. Supported: {', '.join(AUDIO_EXTENSIONS)}")
 
+    await asyncio.to_thread(storage.ensure_free_space)
+
     file_id = str(uuid.uuid4())[:8]
     safe_name = f"{file_id}{ext}"
     filepath = UPLOAD_DIR / safe_name
@@ -44,18 +127,10 @@ async def upload_audio(file: UploadFile = File(...)):
         content = await file.read()
         f.write(content)
 
-    try:
-        metadata = extract_metadata(str(filepath))
-
-        cover_url = None
-        if metadata.get("cover_path"):
-            cover_file = Path(metadata["cover_path"])
-            new_cover = UPLOAD_DIR / f"{file_id}_cover{cover_file.suffix}"
-            if cover_file != new_cover:
-                cover_file.rename(new_cover)
-            cover_url = f"/uploads/{new_cover.name}"
-            metadata["cover_path"] = str(new_cover)
+    metrics.UPLOAD_BYTES.observe(len(content))
 
+    try:
+        metadata = await asyncio.to_thread(_ingest_audio, file_id, filepath)
         return {
             "file_id": file_id,
             "filename": file.filename,
@@ -65,7 +140,8 @@ async def upload_audio(file: UploadFile = File(...)):
             "album": metadata["album"],
             "duration": metadata["duration"],
             "bpm": metadata.get("bpm"),
-            "cover_url": cover_url,
+            "cover_url": metadata["cover_url"],
+            "thumbnail_url": metadata["thumbnail_url"],
             "cover_path": metadata.get("cover_path"),
         }
 
@@ -80,25 +156,55 @@ async def get_waveform(file_id: str):
     filepath = _find_upload(file_id)
     if not filepath:
         raise HTTPException(404, "File not found")
+    storage.touch("uploads", file_id)
 
-    peaks = generate_waveform_peaks(str(filepath))
+    start = time.perf_counter()
+    peaks = await asyncio.to_thread(precompute.waveform_peaks, file_id)
+    if peaks is None:
+        peaks = await asyncio.to_thread(generate_waveform_peaks, str(filepath))
+    metrics.WAVEFORM_SECONDS.observe(time.perf_counter() - start)
     return {"peaks": peaks}
 
 
 @router.get("/preview-audio/{file_id}")
 async def preview_audio(file_id: str):
-    """Serve the uploaded audio file for preview playback."""
+    """
+    Serve audio for preview playback: the low-bitrate AAC proxy made at upload,
+    or the original upload if the proxy is unavailable. Range requests are supported.
+    """
+    proxy_path = UPLOAD_DIR / f"{file_id}{PREVIEW_SUFFIX}"
+    storage.touch("uploads", file_id)
+    if file_id not in _original_previews:
+        pending = _previews.get(file_id)
+        if pending is not None and not pending.is_set():
+            await asyncio.to_thread(pending.wait, PREVIEW_WAIT_SECONDS)
+        if proxy_path.exists():
+            return FileResponse(
+                str(proxy_path),
+                media_type="audio/mp4",
+                headers={"Cache-Control": PREVIEW_CACHE_CONTROL},
+            )
+
     filepath = _find_upload(file_id)
     if not filepath:
         raise HTTPException(404, "File not found")
 
+    _original_previews.add(file_id)
     return FileResponse(
         str(filepath),
-        media_type="audio/mpeg",
-        headers={"Accept-Ranges": "bytes"},
+        media_type=AUDIO_MEDIA_TYPES.get(filepath.suffix.lower(), "application/octet-stream"),
+        headers={"Cache-Control": "no-cache"},
     )
 
 
+def _forget_evicted(area: str, unit: str):
+    if area == "uploads":
+        _original_previews.discard(unit)
+
+
+storage.add_evict_listener(_forget_evicted)
+
+
 @router.post("/generate")
 async def generate_single_video(
     file_id: str = Form(...),
@@ -108,69 +214,104 @@ async def generate_single_video(
     end_sec: float = Form(30),
     cover_path: Optional[str] = Form(None),
     cover_file: Optional[UploadFile] = File(None),
+    trace: bool = Form(False),
 ):
     """Start video generation in a background thread. Returns job_id for progress polling."""
-    # Find audio file
-    audio_path = _find_upload(file_id)
-    if not audio_path:
-        raise HTTPException(404, "Audio file not found")
-
-    # Handle custom cover upload
-    actual_cover_path = cover_path
-    if cover_file and cover_file.filename:
-        cover_ext = Path(cover_file.filename).suffix.lower()
-        cover_save_path = UPLOAD_DIR / f"{file_id}_custom_cover{cover_ext}"
-        with open(cover_save_path, "wb") as f:
-            content = await cover_file.read()
-            f.write(content)
-        actual_cover_path = str(cover_save_path)
-
-    # Generate output filename
-    safe_title = "".join(c if c.isalnum() or c in " -_" else "" for c in title).strip()
-    safe_artist = "".join(c if c.isalnum() or c in " -_" else "" for c in artist).strip()
-    output_filename = f"{safe_artist} - {safe_title}.mp4"
+    recorder = SpanRecorder(trace=True) if trace or TRACE_JOBS else None
+
+    with recording(recorder):
+        # Find audio file
+        audio_path = _find_upload(file_id)
+        if not audio_path:
+            raise HTTPException(404, "Audio file not found")
+        await asyncio.to_thread(_check_capacity, scheduler.INTERACTIVE)
+
+        # Handle custom cover upload
+        actual_cover_path = cover_path
+        if cover_file and cover_file.filename:
+            # The precomputed cycle is for the embedded cover
+            precompute.cancel(file_id)
+            with span("cover_upload_save"):
+                cover_ext = Path(cover_file.filename).suffix.lower()
+                cover_save_path = UPLOAD_DIR / f"{file_id}_custom_cover_upload{cover_ext}"
+                with open(cover_save_path, "wb") as f:
+                    content = await cover_file.read()
+                    f.write(content)
+            try:
+                actual_cover_path, _ = await asyncio.to_thread(
+                    _ingest_cover, cover_save_path, f"{file_id}_custom_cover"
+                )
+            except (ValueError, OSError) as e:
+                raise HTTPException(400, f"Unusable cover image: {e}")
+
+    output_filename = _output_filename(artist, title)
     output_path = OUTPUT_DIR / output_filename
 
-    # Create job for tracking
+    await asyncio.to_thread(storage.ensure_free_space)
     job_id = str(uuid.uuid4())[:8]
-    _jobs[job_id] = {"progress": 0, "status": "processing", "result": None}
+    result = {"filename": output_filename, "download_url": f"/outputs/{output_filename}"}
 
-    def on_progress(pct):
-        _jobs[job_id]["progress"] = pct
+    if job_queue.RENDER_MODE == "queue":
+        # Rendered by a worker process; timelines are not recorded across processes
+        queue = await asyncio.to_thread(render_queue)
+        await asyncio.to_thread(queue.enqueue, job_id, {
+            "audio_path": str(audio_path),
+            "cover_path": actual_cover_path,
+            "artist": artist,
+            "title": title,
+            "start_sec": start_sec,
+            "end_sec": end_sec,
+            "output_path": str(output_path),
+            "result": result,
+        })
+        _queue_polls[job_id] = time.monotonic()
+        _watch_abandoned()
+        return {"job_id": job_id, "status": "queued"}
 
-    def run_generation():
-        try:
-            generate_video(
-                audio_path=str(audio_path),
-                cover_path=actual_cover_path,
-                artist=artist,
-                title=title,
-                start_sec=start_sec,
-                end_sec=end_sec,
-                output_path=str(output_path),
-                progress_callback=on_progress,
-            )
-            _jobs[job_id]["status"] = "done"
-            _jobs[job_id]["progress"] = 100
-            _jobs[job_id]["result"] = {
-                "filename": output_filename,
-                "download_url": f"/outputs/{output_filename}",
-            }
-        except Exception as e:
-            _jobs[job_id]["status"] = "error"
-            _jobs[job_id]["result"] = {"error": str(e)}
+    # Keep the upload and the output from being evicted until the job is over
+    lease = storage.Lease(uploads=[file_id], outputs=[output_filename])
+
+    # Create job for tracking
+    _jobs[job_id] = {
+        "progress": 0, "status": "processing", "result": None,
+        "cancel": threading.Event(), "polled_at": time.monotonic(),
+    }
+    if recorder is not None:
+        _store_trace(job_id, recorder)
+    _watch_abandoned()
+
+    run_generation = _job_runner(job_id, scheduler.INTERACTIVE, {
+        "audio_path": str(audio_path),
+        "cover_path": actual_cover_path,
+        "artist": artist,
+        "title": title,
+        "start_sec": start_sec,
+        "end_sec": end_sec,
+        "output_path": str(output_path),
+    }, result, lease, recorder)
 
     # Start generation in background thread
     thread = threading.Thread(target=run_generation, daemon=True)
     thread.start()
 
-    return {"job_id": job_id, "status": "started"}
+    response = {"job_id": job_id, "status": "started"}
+    if recorder is not None:
+        response["trace_url"] = f"/api/trace/{job_id}"
+    return response
 
 
 @router.get("/progress/{job_id}")
 async def get_progress(job_id: str):
-    """Get generation progress for a job."""
+    """Get generation progress for a job. Polling keeps the job from being cancelled as abandoned."""
     job = _jobs.get(job_id)
+    if job:
+        job["polled_at"] = time.monotonic()
+    elif job_queue.RENDER_MODE == "queue":
+        job = await asyncio.to_thread(_queued_job, job_id)
+        if job and job["status"] == "processing" and job_id in _queue_polls:
+            _queue_polls[job_id] = time.monotonic()
+        else:
+            _queue_polls.pop(job_id, None)
     if not job:
         return {"progress": -1, "status": "not_found"}
 
@@ -179,6 +320,16 @@ async def get_progress(job_id: str):
         "status": job["status"],
     }
 
+    # Live encoder stats from FFmpeg's -progress output
+    encoder = job.get("encoder")
+    if encoder and job["status"] == "processing":
+        response["fps"] = encoder.get("fps")
+        response["speed"] = encoder.get("speed")
+
+    # Time until the video is ready: encoder ETA while encoding, else the throughput model
+    if job["status"] == "processing":
+        response["queued"], response["eta_seconds"] = await asyncio.to_thread(_job_eta, job_id, job)
+
     # Include result if done or errored
     if job["status"] in ("done", "error") and job["result"]:
         response["result"] = job["result"]
@@ -187,8 +338,36 @@ async def get_progress(job_id: str):
     return response
 
 
+@router.get("/capacity")
+async def capacity():
+    """Render throughput model of this machine and the expected wait for new jobs by class."""
+    def measure():
+        return {
+            "render_model": eta.snapshot(),
+            "expected_wait_seconds": {
+                scheduler.CLASS_NAMES[c]: round(_expected_wait(c), 1)
+                for c in (scheduler.INTERACTIVE, scheduler.BATCH)
+            },
+            "max_queue_wait_seconds": MAX_QUEUE_WAIT_SECONDS or None,
+        }
+
+    return await asyncio.to_thread(measure)
+
+
+@router.post("/cancel/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a single-video job: its render stops at the next frame, FFmpeg is
+    terminated and the partial output removed. Finished jobs keep their status.
+    """
+    status = await asyncio.to_thread(_cancel_job, job_id, "user")
+    if status is None:
+        raise HTTPException(404, "Job not found")
+    return {"job_id": job_id, "status": status}
+
+
 @router.post("/batch/generate")
-async def generate_batch(data: str = Form(...)):
+async def generate_batch(data: str = Form(...), trace: bool = Form(False)):
     """Generate multiple videos."""
     try:
         tracks = json.loads(data)
@@ -197,54 +376,122 @@ async def generate_batch(data: str = Form(...)):
 
     if len(tracks) > 10:
         raise HTTPException(400, "Maximum 10 tracks allowed")
-
-    tasks = []
-    for track in tracks:
-        file_id = track.get("file_id")
-        audio_path = _find_upload(file_id)
-        if not audio_path:
-            continue
-
-        safe_title = "".join(c if c.isalnum() or c in " -_" else "" for c in track.get("title", "Unknown")).strip()
-        safe_artist = "".join(c if c.isalnum() or c in " -_" else "" for c in track.get("artist", "Unknown")).strip()
-        filename = f"{safe_artist} - {safe_title}.mp4"
-
-        tasks.append({
-            "audio_path": str(audio_path),
-            "cover_path": track.get("cover_path"),
-            "artist": track.get("artist", "Unknown"),
-            "title": track.get("title", "Unknown"),
-            "start_sec": track.get("start_sec", 0),
-            "end_sec": track.get("end_sec", 30),
-            "filename": filename,
-        })
-
-    results = generate_video_batch(tasks, str(OUTPUT_DIR))
+    await asyncio.to_thread(_check_capacity, scheduler.BATCH)
+
+    recorder = SpanRecorder(trace=True) if trace or TRACE_JOBS else None
+    trace_id = None
+    if recorder is not None:
+        trace_id = f"batch-{str(uuid.uuid4())[:8]}"
+        _store_trace(trace_id, recorder)
+
+    with recording(recorder):
+        tasks = []
+        filenames = set()
+        for track in tracks:
+            file_id = track.get("file_id")
+            audio_path = _find_upload(file_id)
+            if not audio_path:
+                continue
+
+            # Tracks render in parallel, so two with the same artist/title must not share an output
+            filename = _output_filename(track.get("artist", "Unknown"), track.get("title", "Unknown"))
+            n = 1
+            while filename in filenames:
+                suffix = file_id if n == 1 else f"{file_id}-{n}"
+                filename = _output_filename(track.get("artist", "Unknown"), track.get("title", "Unknown"), suffix)
+                n += 1
+            filenames.add(filename)
+
+            tasks.append({
+                "file_id": file_id,
+                "audio_path": str(audio_path),
+                "cover_path": track.get("cover_path"),
+                "artist": track.get("artist", "Unknown"),
+                "title": track.get("title", "Unknown"),
+                "start_sec": track.get("start_sec", 0),
+                "end_sec": track.get("end_sec", 30),
+                "filename": filename,
+            })
+
+        await asyncio.to_thread(storage.ensure_free_space)
+        if job_queue.RENDER_MODE == "queue":
+            results = await _run_batch_queued(tasks)
+        else:
+            with storage.Lease(
+                uploads=[t["file_id"] for t in tasks],
+                outputs=[t["filename"] for t in tasks],
+            ):
+                results = await _run_batch_local(tasks, recorder)
 
     successful = [r for r in results if r["status"] == "success"]
-    zip_filename = None
+    zip_url = None
 
     if len(successful) > 1:
-        zip_filename = "Sonivo_batch.zip"
-        zip_path = OUTPUT_DIR / zip_filename
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for r in successful:
-                zf.write(r["path"], os.path.basename(r["path"]))
-            tracklist = "\n".join(
+        # The archive is streamed from the output files when downloaded (see batch_zip)
+        batch_id = str(uuid.uuid4())[:8]
+        _batches[batch_id] = {
+            "files": [r["path"] for r in successful],
+            "tracklist": "\n".join(
                 f"{i+1}. {os.path.splitext(os.path.basename(r['path']))[0]}"
                 for i, r in enumerate(successful)
-            )
-            zf.writestr("tracklist.txt", tracklist)
+            ),
+            "recorder": recorder,
+        }
+        while len(_batches) > MAX_BATCHES:
+            _batches.popitem(last=False)
+        zip_url = f"/api/batch/{batch_id}/zip"
 
-    return {
+    response = {
         "results": [
             {"filename": r["filename"], "status": r["status"],
              "download_url": f"/outputs/{r['filename']}" if r["status"] == "success" else None,
              "error": r.get("error")}
             for r in results
         ],
-        "zip_url": f"/outputs/{zip_filename}" if zip_filename else None,
+        "zip_url": zip_url,
     }
+    if trace_id:
+        response["trace_url"] = f"/api/trace/{trace_id}"
+    return response
+
+
+@router.get("/batch/{batch_id}/zip")
+async def batch_zip(batch_id: str):
+    """Download a batch as a stored ZIP (videos + tracklist.txt) built while streaming."""
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(404, "Batch not found")
+
+    files = [Path(p) for p in batch["files"] if os.path.exists(p)]
+    if not files:
+        raise HTTPException(404, "Batch files no longer available")
+
+    recorder = batch["recorder"]
+
+    def body():
+        with recorder.span("zip_stream") if recorder is not None else nullcontext():
+            yield from stream_zip(
+                [(path, path.name) for path in files],
+                [("tracklist.txt", batch["tracklist"])],
+            )
+
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="Sonivo_batch_{batch_id}.zip"'},
+    )
+
+
+@router.get("/trace/{trace_id}")
+async def get_trace(trace_id: str):
+    """Timeline of a traced job or batch as Chrome/Perfetto trace JSON."""
+    recorder = _traces.get(trace_id)
+    if recorder is None:
+        raise HTTPException(404, "Trace not found")
+    return JSONResponse(
+        recorder.to_chrome_trace(f"sonivo {trace_id}"),
+        headers={"Content-Disposition": f'inline; filename="sonivo_{trace_id}.trace.json"'},
+    )
 
 
 @router.get("/download/{filename}")
@@ -253,13 +500,499 @@ async def download_file(filename: str):
     filepath = OUTPUT_DIR / filename
     if not filepath.exists():
         raise HTTPException(404, "File not found")
+    storage.touch("outputs", filename)
     return FileResponse(str(filepath), filename=filename)
 
 
+@router.get("/storage")
+async def storage_usage():
+    """Disk usage of uploads/ and outputs/, quotas, pins and eviction counts."""
+    return await asyncio.to_thread(storage.usage)
+
+
+@router.post("/storage/pin/{filename}")
+async def pin_output(filename: str):
+    """Exempt a generated video from storage eviction."""
+    if not storage.pin(Path(filename).name):
+        raise HTTPException(404, "File not found")
+    return {"pinned": filename}
+
+
+@router.delete("/storage/pin/{filename}")
+async def unpin_output(filename: str):
+    storage.unpin(Path(filename).name)
+    return {"unpinned": filename}
+
+
+@router.get("/watch")
+async def watch_status():
+    """Watch-folder state and the files it ingested recently, with their render status."""
+    if _watcher is None:
+        return {"enabled": False}
+    files = []
+    for record in reversed(list(_watched.values())):
+        record = dict(record)
+        if record["job_id"]:
+            job = _jobs.get(record["job_id"])
+            if job is None and job_queue.RENDER_MODE == "queue":
+                job = await asyncio.to_thread(_queued_job, record["job_id"])
+            if job is not None:
+                record["render_status"] = job["status"]
+                record["progress"] = job["progress"]
+        files.append(record)
+    return {"enabled": True, "render": WATCH_RENDER, **_watcher.stats(), "files": files}
+
+
 def _find_upload(file_id: str) -> Optional[Path]:
     """Find an uploaded file by its ID prefix."""
-    for f in UPLOAD_DIR.iterdir():
-        if f.name.startswith(file_id) and not f.name.endswith(("_cover.jpg", "_cover.png", "_custom_cover.jpg", "_custom_cover.png")):
-            if f.suffix.lower() in AUDIO_EXTENSIONS:
-                return f
+    with span("upload_lookup"):
+        for f in UPLOAD_DIR.iterdir():
+            if f.name.startswith(file_id) and not f.name.endswith(DERIVED_SUFFIXES):
+                if f.suffix.lower() in AUDIO_EXTENSIONS:
+                    return f
     return None
+
+
+def _ingest_audio(file_id: str, filepath: Path, with_preview: bool = True, with_precompute: bool = True) -> dict:
+    """
+    Everything an upload gets once its file is in uploads/: metadata, the normalized
+    embedded cover and thumbnail, the preview proxy and precomputation. Returns the
+    metadata with cover_path, cover_url and thumbnail_url.
+
+    The preview proxy and precomputation only pay off while someone edits the
+    upload; files nobody opens (watch folder) skip them with the flags.
+    """
+    metadata = extract_metadata(str(filepath))
+    if metadata["duration"]:
+        metrics.UPLOAD_AUDIO_SECONDS.observe(metadata["duration"])
+
+    if with_preview:
+        _start_preview(file_id, filepath)
+
+    metadata["cover_url"] = None
+    metadata["thumbnail_url"] = None
+    if metadata.get("cover_path"):
+        try:
+            cover_path, thumbnail_path = _ingest_cover(Path(metadata["cover_path"]), f"{file_id}_cover")
+            metadata["cover_url"] = f"/uploads/{Path(cover_path).name}"
+            metadata["thumbnail_url"] = f"/uploads/{Path(thumbnail_path).name}"
+            metadata["cover_path"] = cover_path
+        except (ValueError, OSError) as e:
+            # Oversized or unreadable embedded art: continue without a cover
+            print(f"Ignoring embedded cover of {file_id}: {e}")
+            metadata["cover_path"] = None
+
+    # Use the idle time while the user picks a segment: peaks, vinyl and rotation cycle
+    if with_precompute:
+        precompute.schedule(file_id, str(filepath), metadata.get("cover_path"))
+    return metadata
+
+
+def start_watch_folder() -> Optional[watch_folder.WatchFolder]:
+    """Watch SONIVO_WATCH_DIR, if set (idempotent). Raises OSError if it cannot be watched."""
+    global _watcher, _watch_renders
+    if not watch_folder.WATCH_DIR or _watcher is not None:
+        return _watcher
+    if WATCH_RENDER and job_queue.RENDER_MODE != "queue":
+        # Queue mode is bounded by the workers instead
+        _watch_renders = ThreadPoolExecutor(max(1, WATCH_CONCURRENCY), thread_name_prefix="sonivo-watch-render")
+    watcher = watch_folder.WatchFolder(watch_folder.WATCH_DIR, _ingest_watched, AUDIO_EXTENSIONS)
+    watcher.start()
+    _watcher = watcher
+    return _watcher
+
+
+def stop_watch_folder():
+    if _watcher is not None:
+        _watcher.stop()
+
+
+def _ingest_watched(source: Path):
+    """Watch-folder callback: copy a completed file into uploads/ and ingest it like an upload."""
+    storage.ensure_free_space()
+    file_id = str(uuid.uuid4())[:8]
+    filepath = UPLOAD_DIR / f"{file_id}{source.suffix.lower()}"
+    # The drop folder keeps its files; eviction only ever removes the copy
+    shutil.copyfile(source, filepath)
+    metrics.UPLOAD_BYTES.observe(filepath.stat().st_size)
+    try:
+        # Unattended: no preview proxy or speculative work competing with interactive uploads
+        metadata = _ingest_audio(file_id, filepath, with_preview=False, with_precompute=False)
+    except Exception:
+        filepath.unlink(missing_ok=True)
+        raise
+    if metadata["title"] == filepath.stem:
+        # Untagged: name it after the dropped file, not the upload copy
+        metadata["title"] = source.stem
+
+    record = {
+        "file_id": file_id,
+        "source": source.name,
+        "artist": metadata["artist"],
+        "title": metadata["title"],
+        "duration": metadata["duration"],
+        "cover_url": metadata["cover_url"],
+        "ingested_at": time.time(),
+        "job_id": None,
+    }
+    if WATCH_RENDER:
+        record["job_id"], record["download_url"] = _render_watched(file_id, filepath, metadata)
+    _watched[file_id] = record
+    while len(_watched) > MAX_WATCHED:
+        _watched.popitem(last=False)
+    print(f"Ingested {source.name} as {file_id}" + (f", render job {record['job_id']}" if record["job_id"] else ""))
+
+
+def _render_watched(file_id: str, filepath: Path, metadata: dict) -> tuple:
+    """Start the default-segment render of a watch-folder file. Returns (job_id, download URL)."""
+    duration = metadata["duration"] or WATCH_SEGMENT_SECONDS
+    output_filename = _output_filename(metadata["artist"], metadata["title"])
+    params = {
+        "audio_path": str(filepath),
+        "cover_path": metadata.get("cover_path"),
+        "artist": metadata["artist"],
+        "title": metadata["title"],
+        "start_sec": 0,
+        "end_sec": min(duration, WATCH_SEGMENT_SECONDS),
+        "output_path": str(OUTPUT_DIR / output_filename),
+    }
+    job_id = str(uuid.uuid4())[:8]
+    result = {"filename": output_filename, "download_url": f"/outputs/{output_filename}"}
+
+    if job_queue.RENDER_MODE == "queue":
+        render_queue().enqueue(job_id, {**params, "result": result}, scheduler.BATCH)
+        return job_id, result["download_url"]
+
+    lease = storage.Lease(uploads=[file_id], outputs=[output_filename])
+    # Nobody polls unattended jobs, so they are never cancelled as abandoned
+    _jobs[job_id] = {
+        "progress": 0, "status": "processing", "result": None,
+        "cancel": threading.Event(), "polled_at": math.inf,
+    }
+    _watch_renders.submit(_job_runner(job_id, scheduler.BATCH, params, result, lease))
+    return job_id, result["download_url"]
+
+
+def _ingest_cover(src: Path, stem: str) -> tuple:
+    """Normalize a cover into uploads/{stem}.jpg|png + thumbnail; the source file is removed."""
+    try:
+        cover_path, thumbnail_path = normalize_cover(str(src), str(UPLOAD_DIR / stem))
+    except BaseException:
+        src.unlink(missing_ok=True)
+        raise
+    if str(src) != cover_path:
+        src.unlink(missing_ok=True)
+    return cover_path, thumbnail_path
+
+
+def _start_preview(file_id: str, filepath: Path):
+    """Transcode the browser preview proxy in a background thread."""
+    done = threading.Event()
+    _previews[file_id] = done
+
+    def run():
+        scheduler.lower_thread_priority(scheduler.PREVIEW)
+        try:
+            create_preview_proxy(str(filepath), str(UPLOAD_DIR / f"{file_id}{PREVIEW_SUFFIX}"))
+        except Exception as e:
+            print(f"Preview proxy failed for {file_id}: {e}")
+        finally:
+            done.set()
+            _previews.pop(file_id, None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _output_filename(artist: str, title: str, suffix: str = "") -> str:
+    safe_title = "".join(c if c.isalnum() or c in " -_" else "" for c in title).strip()
+    safe_artist = "".join(c if c.isalnum() or c in " -_" else "" for c in artist).strip()
+    if suffix:
+        return f"{safe_artist} - {safe_title} ({suffix}).mp4"
+    return f"{safe_artist} - {safe_title}.mp4"
+
+
+def _job_runner(
+    job_id: str, priority: int, params: dict, result: dict,
+    lease: storage.Lease, recorder: Optional[SpanRecorder] = None,
+):
+    """The body of a local job registered in _jobs: render params, record the outcome, release the lease."""
+    job = _jobs[job_id]
+    job["video_seconds"] = params["end_sec"] - params["start_sec"]
+
+    def on_progress(pct, stats=None):
+        # The first report comes as the render starts, after any wait for a slot
+        job.setdefault("started_at", time.monotonic())
+        job["progress"] = pct
+        if stats:
+            job["encoder"] = stats
+
+    def finish(status: str, outcome: Optional[dict] = None):
+        # _cancel_job reports "cancelled" right away; a cancel is final, so a render
+        # that completes or fails before it sees the event does not overwrite it
+        with _jobs_lock:
+            if job["status"] != "processing":
+                return
+            job["status"] = status
+            if status == "done":
+                job["progress"] = 100
+            if outcome is not None:
+                job["result"] = outcome
+
+    def run():
+        try:
+            # Threads start with an empty context, so activate the job's recorder here
+            with recording(recorder):
+                _render(priority, progress_callback=on_progress, cancel_event=job["cancel"], job_id=job_id, **params)
+            finish("done", result)
+        except RenderCancelled:
+            finish("cancelled")
+        except Exception as e:
+            finish("error", {"error": str(e)})
+        finally:
+            lease.release()
+
+    return run
+
+
+def render_processes() -> render_pool.RenderPool:
+    """The warm render pool (pool mode), started on first use."""
+    global _pool
+    if _pool is None:
+        _pool = render_pool.get_pool()
+        # Jobs run in the pool's processes, so the pool is the source of truth
+        metrics.JOBS_RUNNING.set_function(lambda: _pool.counts()["running"])
+    return _pool
+
+
+def _render(priority: int, progress_callback=None, cancel_event=None, job_id=None, **kwargs) -> str:
+    """
+    Render one video once the scheduler grants its class a slot: on the calling
+    thread, or in the render pool in pool mode. Blocks until done.
+    """
+    estimate = eta.predict(kwargs["end_sec"] - kwargs["start_sec"])
+    with _renders.slot(priority, cancel_event, estimate=estimate, key=job_id):
+        kwargs.update(scheduler.render_options(priority, _renders.interactive_active()))
+        if job_queue.RENDER_MODE == "pool":
+            future = render_processes().submit(
+                progress_callback=progress_callback, cancel_event=cancel_event,
+                recorder=current_recorder(), **kwargs
+            )
+            return future.result()
+        return generate_video(progress_callback=progress_callback, cancel_event=cancel_event, **kwargs)
+
+
+def _expected_wait(priority: int) -> float:
+    """Predicted wait for a slot of a job of this class submitted now."""
+    if job_queue.RENDER_MODE == "queue":
+        return render_queue().expected_wait(priority=priority)
+    return _renders.expected_wait(priority)
+
+
+def _check_capacity(priority: int):
+    """Refuse a new job with 503 and Retry-After while its class would wait over SONIVO_MAX_QUEUE_WAIT."""
+    if not MAX_QUEUE_WAIT_SECONDS:
+        return
+    wait = _expected_wait(priority)
+    if wait > MAX_QUEUE_WAIT_SECONDS:
+        metrics.JOBS_REJECTED.inc(priority=scheduler.CLASS_NAMES[priority])
+        raise HTTPException(
+            503,
+            f"All render slots are busy; a new job would wait about {_format_seconds(wait)}. Try again later.",
+            # By then enough of the backlog has drained for a new job to be accepted
+            headers={"Retry-After": str(max(1, math.ceil(wait - MAX_QUEUE_WAIT_SECONDS)))},
+        )
+
+
+def _format_seconds(seconds: float) -> str:
+    return f"{math.ceil(seconds)} s" if seconds < 90 else f"{round(seconds / 60)} min"
+
+
+def _job_eta(job_id: str, job: dict) -> tuple:
+    """(queued, estimated seconds until the video is ready) for a processing job."""
+    encoder = job.get("encoder") or {}
+    if encoder.get("eta_seconds") is not None:
+        return False, encoder["eta_seconds"]
+    predicted = eta.predict(job.get("video_seconds", 0))
+    if job_queue.RENDER_MODE == "queue":
+        wait = render_queue().expected_wait(job_id) if job.get("queued") else None
+        elapsed = job.get("elapsed")
+    else:
+        wait = _renders.expected_wait(key=job_id)
+        elapsed = time.monotonic() - job["started_at"] if "started_at" in job else None
+    if elapsed is not None:
+        # Rendering, before FFmpeg reports: the part of the prediction not used up yet
+        return False, round(max(0.0, predicted - elapsed), 1)
+    return wait is not None and wait > 0, round((wait or 0.0) + predicted, 1)
+
+
+def _cancel_job(job_id: str, reason: str) -> Optional[str]:
+    """Cancel a job started by this API. Returns its resulting status, None if unknown."""
+    job = _jobs.get(job_id)
+    if job is not None:
+        with _jobs_lock:
+            cancelled = job["status"] == "processing"
+            if cancelled:
+                # The render thread sees the event at its next frame; report the outcome right away
+                job["status"] = "cancelled"
+        if cancelled:
+            job["cancel"].set()
+            metrics.JOBS_CANCELLED.inc(reason=reason)
+        return job["status"]
+
+    if job_queue.RENDER_MODE == "queue":
+        _queue_polls.pop(job_id, None)
+        if render_queue().cancel(job_id):
+            metrics.JOBS_CANCELLED.inc(reason=reason)
+            return "cancelled"
+        job = render_queue().get(job_id)
+        return job["status"] if job is not None else None
+    return None
+
+
+def _watch_abandoned():
+    """Start the thread that cancels jobs whose client stopped polling (idempotent)."""
+    global _abandon_watcher
+    if not ABANDON_SECONDS or (_abandon_watcher is not None and _abandon_watcher.is_alive()):
+        return
+
+    def run():
+        while True:
+            time.sleep(ABANDON_CHECK_SECONDS)
+            cutoff = time.monotonic() - ABANDON_SECONDS
+            abandoned = [
+                job_id for job_id, job in list(_jobs.items())
+                if job["status"] == "processing" and job["polled_at"] < cutoff
+            ]
+            abandoned += [job_id for job_id, polled_at in list(_queue_polls.items()) if polled_at < cutoff]
+            for job_id in abandoned:
+                try:
+                    if _cancel_job(job_id, "abandoned") == "cancelled":
+                        print(f"Cancelled abandoned job {job_id}")
+                except Exception as e:
+                    print(f"Cancelling abandoned job {job_id} failed: {e}")
+
+    _abandon_watcher = threading.Thread(target=run, name="sonivo-abandoned", daemon=True)
+    _abandon_watcher.start()
+
+
+async def _run_batch_local(tasks: list, recorder: Optional[SpanRecorder]) -> list:
+    """
+    Render batch tracks as BATCH-class jobs, each on its own thread waiting for a
+    scheduler slot, and wait for all of them without blocking the event loop.
+    """
+    def render_task(index: int, task: dict) -> str:
+        # Threads start with an empty context, so activate the batch's recorder here
+        with recording(recorder), span("batch_task"):
+            mark("batch_task", index=index, filename=task["filename"])
+            return _render(
+                scheduler.BATCH,
+                audio_path=task["audio_path"],
+                cover_path=task["cover_path"],
+                artist=task["artist"],
+                title=task["title"],
+                start_sec=task["start_sec"],
+                end_sec=task["end_sec"],
+                output_path=str(OUTPUT_DIR / task["filename"]),
+            )
+
+    futures = [_in_thread(render_task, i, task) for i, task in enumerate(tasks)]
+    results = []
+    for task, future in zip(tasks, futures):
+        try:
+            path = await asyncio.wrap_future(future)
+            results.append({"filename": task["filename"], "status": "success", "path": path})
+        except Exception as e:
+            results.append({"filename": task["filename"], "status": "error", "error": str(e)})
+    return results
+
+
+def _in_thread(function, *args) -> Future:
+    """Run function on a new daemon thread; the Future holds its result."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def render_queue() -> job_queue.JobQueue:
+    """The render queue (queue mode), set up on first use."""
+    global _queue
+    if _queue is None:
+        _queue = job_queue.JobQueue()
+        # Queued and running jobs keep their files; the API holds no leases for them
+        storage.add_lease_source(_queued_files)
+        # Jobs run in worker processes, so the queue is the source of truth
+        metrics.JOBS_QUEUED.set_function(lambda: _queue.counts().get("queued", 0))
+        metrics.JOBS_RUNNING.set_function(lambda: _queue.counts().get("running", 0))
+    return _queue
+
+
+def _queued_files() -> list:
+    keys = []
+    for params in render_queue().active_params():
+        for area, key in (("uploads", "audio_path"), ("uploads", "cover_path"), ("outputs", "output_path")):
+            if params.get(key):
+                keys.append((area, Path(params[key]).name))
+    return keys
+
+
+def _queued_job(job_id: str) -> Optional[dict]:
+    """A queue job in the shape of _jobs entries (queued and running both report "processing")."""
+    job = render_queue().get(job_id)
+    if job is None:
+        return None
+    status = {"queued": "processing", "running": "processing"}.get(job["status"], job["status"])
+    return {
+        "progress": job["progress"], "status": status, "encoder": job["encoder"], "result": job["result"],
+        "queued": job["status"] == "queued",
+        "elapsed": time.time() - job["started_at"] if job["status"] == "running" else None,
+        "video_seconds": job["params"].get("end_sec", 30) - job["params"].get("start_sec", 0),
+    }
+
+
+async def _run_batch_queued(tasks: list) -> list:
+    """Enqueue every batch task and wait (without blocking the event loop) for all of them."""
+    queue = await asyncio.to_thread(render_queue)
+    job_ids = []
+    for task in tasks:
+        job_id = str(uuid.uuid4())[:8]
+        await asyncio.to_thread(queue.enqueue, job_id, {
+            "audio_path": task["audio_path"],
+            "cover_path": task["cover_path"],
+            "artist": task["artist"],
+            "title": task["title"],
+            "start_sec": task["start_sec"],
+            "end_sec": task["end_sec"],
+            "output_path": str(OUTPUT_DIR / task["filename"]),
+        }, scheduler.BATCH)
+        job_ids.append(job_id)
+
+    results = []
+    for task, job_id in zip(tasks, job_ids):
+        while True:
+            job = await asyncio.to_thread(queue.get, job_id)
+            if job is None or job["status"] in ("done", "error", "cancelled"):
+                break
+            await asyncio.sleep(QUEUE_POLL_SECONDS)
+        if job is None:
+            results.append({"filename": task["filename"], "status": "error", "error": "job not found"})
+        elif job["status"] == "done":
+            results.append({
+                "filename": task["filename"], "status": "success",
+                "path": str(OUTPUT_DIR / task["filename"]),
+            })
+        else:
+            results.append({"filename": task["filename"], "status": "error", "error": (job.get("result") or {}).get("error", job["status"])})
+    return results
+
+
+def _store_trace(trace_id: str, recorder: SpanRecorder):
+    _traces[trace_id] = recorder
+    while len(_traces) > MAX_TRACES:
+        _traces.popitem(last=False)
@@ -15,6 +15,18 @@ from mutagen.oggvorbis import OggVorbis
 from mutagen.id3 import ID3
 from mutagen import File as MutagenFile
 
+from app.services import metrics
+
+
+# Browser preview proxies (see create_preview_proxy)
+PREVIEW_BITRATE = "96k"
+PREVIEW_TIMEOUT = 600
+
+# AAC LC in an MP4/M4A at one of these rates and up to stereo is copied into
+# rendered videos instead of re-encoded (see video_generator.generate_video)
+AUDIO_PASSTHROUGH = os.environ.get("SONIVO_AUDIO_PASSTHROUGH", "1") == "1"
+PASSTHROUGH_SAMPLE_RATES = (44100, 48000)
+
 
 def extract_metadata(filepath: str) -> dict:
     """
@@ -40,17 +52,18 @@ def extract_metadata(filepath: str) -> dict:
     if audio.info:
         metadata["duration"] = round(audio.info.length, 2)
 
-    # Extract tags based on file type
-    if isinstance(audio, MP3) or hasattr(audio, 'tags') and audio.tags:
-        tags = audio.tags
-        if tags:
-            _extract_id3_tags(tags, metadata, filepath)
-    elif isinstance(audio, MP4):
+    # Extract tags based on file type (container-specific first: MP4/FLAC/OGG
+    # objects also have .tags and would otherwise be read as ID3)
+    if isinstance(audio, MP4):
         _extract_mp4_tags(audio, metadata, filepath)
     elif isinstance(audio, FLAC):
         _extract_vorbis_tags(audio, metadata, filepath)
     elif isinstance(audio, OggVorbis):
         _extract_vorbis_tags(audio, metadata, filepath)
+    elif isinstance(audio, MP3) or hasattr(audio, 'tags') and audio.tags:
+        tags = audio.tags
+        if tags:
+            _extract_id3_tags(tags, metadata, filepath)
 
     return metadata
 
@@ -162,6 +175,7 @@ def generate_waveform_peaks(filepath: str, num_points: int = 800) -> list:
         )
 
         if result.returncode != 0:
+            metrics.FFMPEG_ERRORS.inc(kind="waveform")
             return [0.5] * num_points
 
         import numpy as np
@@ -190,11 +204,66 @@ def generate_waveform_peaks(filepath: str, num_points: int = 800) -> list:
 
         return peaks
 
+    except subprocess.TimeoutExpired as e:
+        metrics.FFMPEG_ERRORS.inc(kind="waveform")
+        print(f"Error generating waveform: {e}")
+        return [0.5] * num_points
     except Exception as e:
         print(f"Error generating waveform: {e}")
         return [0.5] * num_points
 
 
+def create_preview_proxy(filepath: str, output_path: str, bitrate: str = PREVIEW_BITRATE) -> str:
+    """
+    Transcode an upload to a small stereo AAC (.m4a, moov atom first) for browser
+    playback and scrubbing. Written to a temp name and renamed, so a half-written
+    proxy is never served. Raises CalledProcessError/TimeoutExpired on failure.
+    """
+    tmp_path = f"{output_path}.part"
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(filepath),
+        "-vn",
+        "-ac", "2",
+        "-c:a", "aac",
+        "-b:a", bitrate,
+        "-threads", "1",              # background work: leave the cores to renders
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        tmp_path,
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True, timeout=PREVIEW_TIMEOUT)
+        os.replace(tmp_path, output_path)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        metrics.FFMPEG_ERRORS.inc(kind="preview")
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def passthrough_sample_rate(filepath: str) -> Optional[int]:
+    """
+    Sample rate of the file's audio if it can be stream-copied into a video
+    (AAC LC in an MP4 container, 44.1/48 kHz, mono or stereo), else None.
+    """
+    if not AUDIO_PASSTHROUGH:
+        return None
+    try:
+        info = MP4(str(filepath)).info
+    except Exception:
+        return None
+    if (
+        getattr(info, "codec", "") == "mp4a.40.2"
+        and info.sample_rate in PASSTHROUGH_SAMPLE_RATES
+        and info.channels in (1, 2)
+    ):
+        return info.sample_rate
+    return None
+
+
 def extract_audio_segment(filepath: str, start_sec: float, end_sec: float, output_path: str) -> str:
     """
     Extract a segment of audio using FFmpeg.
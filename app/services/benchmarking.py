@@ -16,9 +16,15 @@ from typing import Optional
 
 import psutil
 
+from app.services.memory_profile import MemoryProfiler
+from app.services.timing import SpanRecorder, activate, deactivate
+
 
 BENCHMARKS_DIR = Path(__file__).resolve().parent.parent.parent / "benchmarks"
 RESULTS_DIR = BENCHMARKS_DIR / "results"
+TRACES_DIR = RESULTS_DIR / "traces"
+# Fixture-matrix runs are kept apart so they don't mix into the per-duration stats
+MATRIX_RESULTS_DIR = RESULTS_DIR / "matrix"
 
 
 class BenchmarkSession:
@@ -30,6 +36,14 @@ class BenchmarkSession:
             session.set_ffmpeg_pid(proc.pid)
             # ... generation work ...
         metrics = session.metrics
+
+    While active, timing spans (app.services.timing.span) in the same context
+    are recorded into session.spans and saved under "stages"; the timeline is
+    written as Chrome trace JSON to benchmarks/results/traces/. Pass results_dir
+    to save somewhere else (the trace goes to its traces/ subfolder).
+
+    With profile_memory=True, tracemalloc snapshots are taken at span boundaries
+    and Python vs. child RSS/PSS is attributed per stage ("memory_profile").
     """
 
     def __init__(
@@ -38,19 +52,45 @@ class BenchmarkSession:
         audio_duration: float = 0.0,
         label: str = "",
         save_results: bool = True,
+        fixture: Optional[dict] = None,
+        profile_memory: bool = False,
+        results_dir: Optional[Path] = None,
     ):
         self.segment_duration = segment_duration
         self.audio_duration = audio_duration or segment_duration
         self.label = label
         self.save_results = save_results
+        self.results_dir = results_dir or RESULTS_DIR
+        # Input description (codec, cover size, ...) for grouping in aggregate_results.py
+        self.fixture = dict(fixture) if fixture else None
 
         self._ffmpeg_pid: Optional[int] = None
         self._ffmpeg_cmdline: str = ""
         self._exit_code: Optional[int] = None
 
+        # Rotation cycle footprint (bytes, layout, shared between jobs)
+        self._cycle_bytes = 0
+        self._cycle_layout = ""
+        self._cycle_shared = False
+
+        # Render vs. pipe-write timing from the frame pipeline
+        self._pipeline_stats: dict = {}
+
+        # Per-stage timing spans recorded while the session is active
+        self.spans = SpanRecorder(trace=True)
+        self._spans_token = None
+
+        # Opt-in memory attribution (tracemalloc + /proc smaps per stage)
+        self._profiler: Optional[MemoryProfiler] = None
+        if profile_memory:
+            self._profiler = MemoryProfiler()
+            self.spans.observe(self._profiler.on_span)
+
         # Monitoring state
         self._samples_cpu: list[float] = []
         self._samples_mem: list[float] = []  # RSS in MB
+        self._mem_before_mb = 0.0
+        self._mem_after_mb = 0.0
         self._stop_event = threading.Event()
         self._monitor_thread: Optional[threading.Thread] = None
 
@@ -86,6 +126,16 @@ class BenchmarkSession:
     def set_output_path(self, path: str):
         self.output_path = path
 
+    def set_rotation_cycle(self, nbytes: int, layout: str = "", shared: bool = False):
+        """Record the size and storage of the job's pre-rendered rotation cycle."""
+        self._cycle_bytes = nbytes
+        self._cycle_layout = layout
+        self._cycle_shared = shared
+
+    def set_pipeline_stats(self, stats: dict):
+        """Record render/write timing of the frame pipeline (render- vs encode-bound)."""
+        self._pipeline_stats = dict(stats)
+
     def __enter__(self):
         # Capture baseline I/O for current process
         proc = psutil.Process(os.getpid())
@@ -96,6 +146,12 @@ class BenchmarkSession:
         except (psutil.AccessDenied, AttributeError):
             pass
 
+        # Resident memory before the job, so the per-job increment can be reported
+        self._mem_before_mb = proc.memory_info().rss / (1024 * 1024)
+
+        if self._profiler:
+            self._profiler.start()
+        self._spans_token = activate(self.spans)
         self._start_time = time.monotonic()
         self._stop_event.clear()
         self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
@@ -104,12 +160,18 @@ class BenchmarkSession:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._end_time = time.monotonic()
+        if self._spans_token is not None:
+            deactivate(self._spans_token)
+            self._spans_token = None
         self._stop_event.set()
         if self._monitor_thread:
             self._monitor_thread.join(timeout=5)
+        if self._profiler:
+            self._profiler.stop()
 
-        # Capture final I/O
+        # Capture final I/O and resident memory after the job
         proc = psutil.Process(os.getpid())
+        self._mem_after_mb = proc.memory_info().rss / (1024 * 1024)
         try:
             io = proc.io_counters()
             self._io_read_end = io.read_bytes
@@ -157,6 +219,9 @@ class BenchmarkSession:
                         pass
                 self._samples_mem.append(mem / (1024 * 1024))  # MB
 
+                if self._profiler:
+                    self._profiler.sample(proc.pid, [child.pid for child in children])
+
                 # GPU if available
                 if self._has_nvidia:
                     self._sample_gpu()
@@ -217,6 +282,16 @@ class BenchmarkSession:
             )
             if self._samples_mem
             else 0,
+            "memory_before_mb": round(self._mem_before_mb, 1),
+            "memory_after_mb": round(self._mem_after_mb, 1),
+            "peak_memory_delta_mb": round(
+                max(self._samples_mem) - self._mem_before_mb, 1
+            )
+            if self._samples_mem
+            else 0,
+            "rotation_cycle_mb": round(self._cycle_bytes / (1024 * 1024), 1),
+            "rotation_cycle_layout": self._cycle_layout,
+            "rotation_cycle_shared": self._cycle_shared,
             "disk_read_mb": round(
                 (self._io_read_end - self._io_read_start) / (1024 * 1024), 2
             ),
@@ -229,6 +304,23 @@ class BenchmarkSession:
             "samples_collected": len(self._samples_cpu),
         }
 
+        if self.fixture:
+            self.metrics["fixture"] = self.fixture
+
+        if self._profiler:
+            self.metrics["memory_profile"] = self._profiler.report()
+
+        if self._pipeline_stats:
+            self.metrics["pipeline"] = self._pipeline_stats
+
+        # Per-stage durations, frame-loop fps and time the loop was blocked on the pipe
+        stages = self.spans.summary()
+        if stages:
+            values = self.spans.values()
+            self.metrics["stages"] = stages
+            self.metrics["frame_loop_fps"] = values.get("frame_loop_fps")
+            self.metrics["pipe_blocked_seconds"] = values.get("pipe_blocked_seconds")
+
         # GPU section
         if self._has_nvidia and self._gpu_samples_vram:
             self.metrics["gpu"] = {
@@ -242,14 +334,22 @@ class BenchmarkSession:
             self.metrics["gpu"] = "not available"
 
     def _save(self):
-        """Save metrics JSON to benchmarks/results/."""
-        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        """Save metrics JSON to benchmarks/results/ (or results_dir)."""
+        self.results_dir.mkdir(parents=True, exist_ok=True)
 
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         dur = int(self.segment_duration)
         label = self.label or "run"
         filename = f"{ts}_{dur}s_{label}.json"
-        filepath = RESULTS_DIR / filename
+        filepath = self.results_dir / filename
+
+        # Timeline next to the results (own folder so result globs don't pick it up)
+        traces_dir = self.results_dir / "traces"
+        traces_dir.mkdir(parents=True, exist_ok=True)
+        trace_path = traces_dir / f"{filepath.stem}.trace.json"
+        with open(trace_path, "w") as f:
+            json.dump(self.spans.to_chrome_trace(f"benchmark {label}"), f)
+        self.metrics["trace_file"] = f"traces/{trace_path.name}"
 
         with open(filepath, "w") as f:
             json.dump(self.metrics, f, indent=2)
@@ -0,0 +1,265 @@
+"""
+Render time prediction from measured throughput.
+
+Render wall time is modelled per machine (host name) and encoder settings as
+
+    seconds = overhead + rtf * video_seconds
+
+fitted by exponentially weighted least squares over completed renders, so the
+model follows the machine as load, covers and FFmpeg versions change (the
+weight of a job halves every SONIVO_ETA_HALF_LIFE later jobs). Every process
+that renders (API threads, pool workers, app.worker, app.cli) records its jobs
+into one JSON file (SONIVO_ETA_MODEL, default cache/eta_model.json) under a
+file lock, and readers reload it when it changes.
+
+Until a machine has enough samples, a model is seeded from benchmarks/results
+(when benchmarks/system_info.json describes a machine like this one), and
+otherwise falls back to PRIOR_OVERHEAD_SECONDS + PRIOR_RTF * video_seconds.
+
+    eta.predict(30)                     # seconds a 30 s render is expected to take
+    eta.record(30, 21.5)                # after a render, from generate_video
+    eta.expected_wait(work, slots)      # queue wait for work ahead of a job
+"""
+import glob
+import json
+import os
+import platform
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+MODEL_PATH = Path(os.environ.get("SONIVO_ETA_MODEL", str(BASE_DIR / "cache" / "eta_model.json")))
+HALF_LIFE_JOBS = float(os.environ.get("SONIVO_ETA_HALF_LIFE", "20"))
+BENCHMARK_RESULTS = BASE_DIR / "benchmarks" / "results"
+BENCHMARK_SYSTEM_INFO = BASE_DIR / "benchmarks" / "system_info.json"
+
+# Used until a model has samples (roughly a 2-core machine)
+PRIOR_OVERHEAD_SECONDS = 3.0
+PRIOR_RTF = 1.0
+# A slope is only fitted once segment lengths vary this much (seconds, std dev)
+_MIN_SPREAD_SECONDS = 2.0
+_MIN_FIT_SAMPLES = 3
+
+_lock = threading.Lock()
+_models: dict = {}
+_loaded_mtime: Optional[int] = None
+
+
+def machine_key() -> str:
+    return socket.gethostname()
+
+
+def encoder_key(width: int, height: int, fps: int, preset: str, crf: int, threads: Optional[int] = None) -> str:
+    """Identifies encoder settings with their own throughput."""
+    return f"{width}x{height}@{fps}:x264-{preset}-crf{crf}:threads-{threads or 'auto'}"
+
+
+def default_encoder_key(threads: Optional[int] = None) -> str:
+    # Imported here: video_generator records into this module
+    from app.services import video_generator as vg
+    return encoder_key(vg.WIDTH, vg.HEIGHT, vg.FPS, vg.X264_PRESET, vg.X264_CRF, threads)
+
+
+class RenderModel:
+    """Decayed sums for the least-squares fit of seconds on video seconds."""
+
+    __slots__ = ("n", "sw", "sx", "sy", "sxx", "sxy", "updated_at")
+
+    def __init__(self, state: Optional[dict] = None):
+        state = state or {}
+        for name in self.__slots__:
+            setattr(self, name, state.get(name, 0))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def add(self, video_seconds: float, seconds: float):
+        decay = 0.5 ** (1 / HALF_LIFE_JOBS) if HALF_LIFE_JOBS > 0 else 1.0
+        self.sw = self.sw * decay + 1
+        self.sx = self.sx * decay + video_seconds
+        self.sy = self.sy * decay + seconds
+        self.sxx = self.sxx * decay + video_seconds * video_seconds
+        self.sxy = self.sxy * decay + video_seconds * seconds
+        self.n += 1
+        self.updated_at = time.time()
+
+    def coefficients(self) -> tuple:
+        """(overhead seconds, seconds per video second)."""
+        if not self.sw or not self.sx:
+            return PRIOR_OVERHEAD_SECONDS, PRIOR_RTF
+        mean_x = self.sx / self.sw
+        mean_y = self.sy / self.sw
+        variance = self.sxx / self.sw - mean_x * mean_x
+        if self.n >= _MIN_FIT_SAMPLES and variance >= _MIN_SPREAD_SECONDS ** 2:
+            slope = (self.sxy / self.sw - mean_x * mean_y) / variance
+            overhead = mean_y - slope * mean_x
+            if slope > 0 and overhead >= 0:
+                return overhead, slope
+        # One segment length (or a fit that makes no sense): a plain real-time factor
+        return 0.0, mean_y / mean_x
+
+    def predict(self, video_seconds: float) -> float:
+        overhead, rtf = self.coefficients()
+        return overhead + rtf * max(0.0, video_seconds)
+
+
+def predict(video_seconds: float, ffmpeg_threads: Optional[int] = None) -> float:
+    """Expected wall time of a render of video_seconds on this machine."""
+    with _lock:
+        _reload()
+        model = _models.get(_key(ffmpeg_threads)) if ffmpeg_threads else None
+        if model is None or not model.n:
+            # Throttled encodes borrow the unthrottled model until they have their own samples
+            model = _models.get(_key())
+            if model is None:
+                # Kept in memory only; the next record() persists it with the new sample
+                model = _models[_key()] = _seed(_key())
+    return model.predict(video_seconds)
+
+
+def record(video_seconds: float, seconds: float, ffmpeg_threads: Optional[int] = None):
+    """Add a completed render to this machine's model (and persist it)."""
+    if video_seconds <= 0 or seconds <= 0:
+        return
+    key = _key(ffmpeg_threads)
+    with _lock, _file_lock():
+        _reload(force=True)
+        model = _models.get(key) or _seed(key)
+        model.add(video_seconds, seconds)
+        _models[key] = model
+        _save()
+
+
+def expected_wait(remaining_work: list, slots: int) -> float:
+    """Time until work ahead (seconds of render each) has drained through slots parallel renders."""
+    if not remaining_work:
+        return 0.0
+    # Greedy list scheduling: each job goes to the slot that frees up first
+    free_at = [0.0] * max(1, slots)
+    for seconds in remaining_work:
+        free_at.sort()
+        free_at[0] += max(0.0, seconds)
+    return min(free_at)
+
+
+def snapshot() -> dict:
+    """Models of this machine: coefficients and sample counts per encoder setting."""
+    prefix = f"{machine_key()}|"
+    with _lock:
+        _reload()
+        models = {k[len(prefix):]: m for k, m in _models.items() if k.startswith(prefix)}
+    return {
+        encoder: {
+            "overhead_seconds": round(m.coefficients()[0], 2),
+            "rtf": round(m.coefficients()[1], 3),
+            "samples": m.n,
+            "updated_at": m.updated_at or None,
+        }
+        for encoder, m in models.items()
+    }
+
+
+def _key(ffmpeg_threads: Optional[int] = None) -> str:
+    return f"{machine_key()}|{default_encoder_key(ffmpeg_threads)}"
+
+
+def _seed(key: str) -> RenderModel:
+    """A model for key from the benchmark results, if they were measured on a machine like this one."""
+    model = RenderModel()
+    try:
+        with open(BENCHMARK_SYSTEM_INFO) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return model
+    if info.get("machine") != platform.machine() or info.get("cpu_logical_cores") != os.cpu_count():
+        return model
+    encoder = key.split("|", 1)[1]
+    for path in sorted(glob.glob(str(BENCHMARK_RESULTS / "*.json"))):
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if result.get("exit_code") != 0 or _benchmark_encoder(result.get("ffmpeg_cmdline", "")) != encoder:
+            continue
+        video_seconds = result.get("segment_duration_seconds") or 0
+        seconds = result.get("total_job_time_seconds") or 0
+        if video_seconds > 0 and seconds > 0:
+            model.add(video_seconds, seconds)
+    return model
+
+
+def _benchmark_encoder(cmdline: str) -> Optional[str]:
+    def arg(flag: str) -> Optional[str]:
+        match = re.search(rf"(?:^|\s){re.escape(flag)}\s+(\S+)", cmdline)
+        return match.group(1) if match else None
+
+    size, fps, preset, crf = arg("-s"), arg("-r"), arg("-preset"), arg("-crf")
+    if not (size and fps and preset and crf) or "x" not in size:
+        return None
+    width, height = size.split("x", 1)
+    threads = arg("-threads")
+    return encoder_key(int(width), int(height), int(fps), preset, int(crf), int(threads) if threads else None)
+
+
+def _reload(force: bool = False):
+    """Re-read the model file if another process changed it. Caller holds _lock."""
+    global _models, _loaded_mtime
+    try:
+        mtime = MODEL_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return
+    if not force and mtime == _loaded_mtime:
+        return
+    try:
+        with open(MODEL_PATH) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return
+    _models = {key: RenderModel(value) for key, value in state.get("models", {}).items()}
+    _loaded_mtime = mtime
+
+
+def _save():
+    """Caller holds _lock and the file lock."""
+    global _loaded_mtime
+    try:
+        MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = MODEL_PATH.with_name(MODEL_PATH.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"models": {k: m.to_dict() for k, m in _models.items()}}, f, indent=1)
+        os.replace(tmp_path, MODEL_PATH)
+        _loaded_mtime = MODEL_PATH.stat().st_mtime_ns
+    except OSError as e:
+        print(f"Could not save the render time model: {e}")
+
+
+@contextmanager
+def _file_lock():
+    """Serializes read-modify-write of the model file across processes."""
+    if fcntl is None:
+        yield
+        return
+    try:
+        MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(MODEL_PATH.with_name(MODEL_PATH.name + ".lock"), "w")
+    except OSError:
+        yield
+        return
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,164 @@
+"""
+Background readers for a running FFmpeg process.
+
+- stderr is drained continuously into a bounded ring (the last N KB are kept
+  for error reporting), so a chatty FFmpeg can never fill the pipe and stall.
+- stdout carries `-progress pipe:1` key=value blocks (frame, fps, speed,
+  out_time), giving encoder-accurate progress, live fps and an ETA.
+"""
+import collections
+import threading
+import time
+from typing import Optional
+
+
+# Global options that make FFmpeg report machine-readable progress on stdout
+PROGRESS_ARGS = ["-nostats", "-progress", "pipe:1"]
+
+DEFAULT_STDERR_LIMIT = 64 * 1024
+
+
+class FFmpegMonitor:
+    """
+    Drains stdout/stderr of an FFmpeg Popen started with PROGRESS_ARGS.
+
+    Usage:
+        monitor = FFmpegMonitor(proc, total_frames=900)
+        ...
+        monitor.snapshot()     # {"frame", "fps", "speed", "eta_seconds", ...}
+        monitor.join()
+        monitor.stderr_tail()  # last N KB of stderr
+    """
+
+    def __init__(
+        self,
+        proc,
+        total_frames: int = 0,
+        stderr_limit: int = DEFAULT_STDERR_LIMIT,
+    ):
+        self.total_frames = total_frames
+        self._stderr_limit = stderr_limit
+        self._stderr_chunks: collections.deque = collections.deque()
+        self._stderr_bytes = 0
+        self._lock = threading.Lock()
+
+        self._progress: dict = {}
+        self._ended = False
+        self._started_at = time.monotonic()
+
+        self._threads = []
+        if proc.stderr is not None:
+            self._threads.append(threading.Thread(target=self._drain_stderr, args=(proc.stderr,), daemon=True))
+        if proc.stdout is not None:
+            self._threads.append(threading.Thread(target=self._read_progress, args=(proc.stdout,), daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def ended(self) -> bool:
+        """True once FFmpeg reported progress=end (all output written)."""
+        return self._ended
+
+    def frame(self) -> int:
+        """Frames encoded so far."""
+        with self._lock:
+            return self._progress.get("frame", 0)
+
+    def fraction(self) -> float:
+        """Encoded fraction of total_frames (0.0 to 1.0)."""
+        if self._ended:
+            return 1.0
+        if self.total_frames <= 0:
+            return 0.0
+        return min(1.0, self.frame() / self.total_frames)
+
+    def snapshot(self) -> dict:
+        """Latest encoder stats, with an ETA derived from the live encode rate."""
+        with self._lock:
+            stats = dict(self._progress)
+
+        frame = stats.get("frame", 0)
+        fps = stats.get("fps") or 0.0
+        if not fps and frame:
+            # FFmpeg reports fps=0 for the first blocks; fall back to the average
+            fps = frame / max(1e-6, time.monotonic() - self._started_at)
+
+        stats["frame"] = frame
+        stats["total_frames"] = self.total_frames
+        stats["fps"] = round(fps, 1)
+        stats["eta_seconds"] = None
+        if self._ended:
+            stats["eta_seconds"] = 0.0
+        elif fps > 0 and self.total_frames:
+            stats["eta_seconds"] = round(max(0, self.total_frames - frame) / fps, 1)
+        return stats
+
+    def stderr_tail(self, limit: Optional[int] = None) -> str:
+        """Last `limit` bytes of stderr (defaults to the whole ring)."""
+        with self._lock:
+            data = b"".join(self._stderr_chunks)
+        if limit is not None:
+            data = data[-limit:]
+        return data.decode(errors="replace")
+
+    def join(self, timeout: float = 5.0):
+        """Wait for both readers to hit EOF (after the process exits)."""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _drain_stderr(self, stream):
+        read = getattr(stream, "read1", stream.read)
+        while True:
+            try:
+                chunk = read(4096)
+            except (OSError, ValueError):
+                return
+            if not chunk:
+                return
+            with self._lock:
+                self._stderr_chunks.append(chunk)
+                self._stderr_bytes += len(chunk)
+                while self._stderr_bytes > self._stderr_limit and len(self._stderr_chunks) > 1:
+                    self._stderr_bytes -= len(self._stderr_chunks.popleft())
+
+    def _read_progress(self, stream):
+        block: dict = {}
+        try:
+            for raw in stream:
+                key, sep, value = raw.decode(errors="replace").strip().partition("=")
+                if not sep:
+                    continue
+                block[key] = value.strip()
+                if key == "progress":
+                    self._apply_block(block)
+                    block = {}
+        except (OSError, ValueError):
+            pass
+
+    def _apply_block(self, block: dict):
+        progress = {}
+        frame = _to_float(block.get("frame"))
+        if frame is not None:
+            progress["frame"] = int(frame)
+        fps = _to_float(block.get("fps"))
+        if fps is not None:
+            progress["fps"] = fps
+        speed = _to_float(block.get("speed", "").rstrip("x"))
+        if speed is not None:
+            progress["speed"] = speed
+        # out_time_us is microseconds; older FFmpeg builds only send out_time_ms (also µs)
+        out_time_us = _to_float(block.get("out_time_us") or block.get("out_time_ms"))
+        if out_time_us is not None and out_time_us >= 0:
+            progress["out_time_seconds"] = round(out_time_us / 1_000_000, 3)
+
+        with self._lock:
+            self._progress.update(progress)
+            if block.get("progress") == "end":
+                self._ended = True
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
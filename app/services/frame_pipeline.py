@@ -0,0 +1,172 @@
+"""
+Overlapped render/write pipeline between the frame loop and FFmpeg's stdin.
+
+The render loop fills frame buffers from a bounded ring while a dedicated writer
+thread pushes finished frames into the pipe with one large write each. Blocking
+on the encoder then no longer stalls compositing, and the encoder is not starved
+while Python renders the next frame.
+
+Timing is recorded on both sides so a job can be classified as render-bound
+(the writer waits for frames) or encode-bound (the renderer waits for buffers).
+"""
+import queue
+import sys
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Frames in flight between the renderer and the writer
+DEFAULT_RING_SIZE = 4
+
+# Linux F_SETPIPE_SZ (fcntl exposes the constant from Python 3.10)
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+_F_GETPIPE_SZ = getattr(fcntl, "F_GETPIPE_SZ", 1032)
+_PIPE_MAX_SIZE_PATH = "/proc/sys/fs/pipe-max-size"
+
+_STOP = object()
+
+
+class PipeClosed(Exception):
+    """The writer could not write to the stream (the reading process went away)."""
+
+
+def enlarge_pipe(fd: int, size: int) -> Optional[int]:
+    """
+    Grow a pipe's kernel buffer to `size` bytes (capped at the system maximum).
+    Returns the resulting size, or None where pipe sizes can't be changed.
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        with open(_PIPE_MAX_SIZE_PATH) as f:
+            size = min(size, int(f.read().strip()))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return fcntl.fcntl(fd, _F_SETPIPE_SZ, size)
+    except OSError:
+        try:
+            return fcntl.fcntl(fd, _F_GETPIPE_SZ)
+        except OSError:
+            return None
+
+
+class FramePipeline:
+    """
+    Bounded ring of frame buffers drained by a writer thread.
+
+    Usage:
+        pipeline = FramePipeline(proc.stdin, (HEIGHT, WIDTH, 3))
+        for ...:
+            buffer = pipeline.acquire()
+            pipeline.submit(render(buffer))
+        pipeline.close()
+        stats = pipeline.stats()
+    """
+
+    def __init__(
+        self,
+        stream,
+        frame_shape: tuple,
+        ring_size: int = DEFAULT_RING_SIZE,
+        pipe_size: Optional[int] = None,
+    ):
+        self._stream = stream
+        self._free: queue.Queue = queue.Queue()
+        self._filled: queue.Queue = queue.Queue()
+        for _ in range(ring_size):
+            self._free.put(np.zeros(frame_shape, dtype=np.uint8))
+
+        frame_bytes = int(np.prod(frame_shape))
+        self.pipe_size = enlarge_pipe(stream.fileno(), pipe_size or frame_bytes)
+
+        self._error: Optional[BaseException] = None
+        self._current: Optional[np.ndarray] = None
+        self._acquired_at = 0.0
+        self._closed = False
+
+        # Instrumentation (seconds)
+        self.frames_written = 0
+        self.render_seconds = 0.0
+        self.render_wait_seconds = 0.0  # renderer blocked on a free buffer
+        self.write_seconds = 0.0  # writer blocked inside write()
+        self.writer_idle_seconds = 0.0  # writer waiting for a rendered frame
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def acquire(self) -> np.ndarray:
+        """Take a free frame buffer, waiting if the encoder is behind."""
+        self._raise_if_failed()
+        start = time.perf_counter()
+        buffer = self._free.get()
+        self._acquired_at = time.perf_counter()
+        self.render_wait_seconds += self._acquired_at - start
+        self._raise_if_failed()
+        self._current = buffer
+        return buffer
+
+    def submit(self, data=None):
+        """
+        Queue the acquired buffer for writing.
+        `data` is what to write when it is not the buffer itself (e.g. a cached frame).
+        """
+        buffer = self._current
+        self._current = None
+        self.render_seconds += time.perf_counter() - self._acquired_at
+        self._filled.put((buffer, buffer if data is None else data))
+
+    def close(self, raise_errors: bool = True):
+        """Flush queued frames and stop the writer; raises PipeClosed after a write error."""
+        if not self._closed:
+            self._closed = True
+            self._filled.put(_STOP)
+            self._writer.join()
+        if raise_errors:
+            self._raise_if_failed()
+
+    def stats(self) -> dict:
+        """Render vs. write timing, and which side of the pipe limited throughput."""
+        return {
+            "frames_written": self.frames_written,
+            "render_seconds": round(self.render_seconds, 3),
+            "render_wait_seconds": round(self.render_wait_seconds, 3),
+            "write_blocked_seconds": round(self.write_seconds, 3),
+            "writer_idle_seconds": round(self.writer_idle_seconds, 3),
+            "pipe_buffer_bytes": self.pipe_size,
+            "bound": "encode" if self.render_wait_seconds > self.writer_idle_seconds else "render",
+        }
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise PipeClosed(str(self._error)) from self._error
+
+    def _write_loop(self):
+        while True:
+            start = time.perf_counter()
+            item = self._filled.get()
+            self.writer_idle_seconds += time.perf_counter() - start
+            if item is _STOP:
+                return
+
+            buffer, data = item
+            if self._error is None:
+                start = time.perf_counter()
+                try:
+                    self._stream.write(data)
+                    self.frames_written += 1
+                except (OSError, ValueError) as e:
+                    # Keep draining so the renderer never blocks on a dead pipe
+                    self._error = e
+                self.write_seconds += time.perf_counter() - start
+            self._free.put(buffer)
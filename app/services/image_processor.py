@@ -2,23 +2,92 @@
 Image processing service: color extraction, vinyl disc creation, background generation.
 """
 import math
+import os
 import random
 from pathlib import Path
 from typing import List, Tuple
 from collections import Counter
+from functools import lru_cache
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 
+from app.services.timing import span, timed
 
+
+# Covers are normalized at ingestion to the render size plus a small thumbnail
+# (UI lists, colour extraction). Larger images are refused before decoding.
+COVER_SIZE = 1080
+THUMBNAIL_SIZE = 256
+MAX_COVER_PIXELS = int(os.environ.get("SONIVO_MAX_COVER_PIXELS", str(40_000_000)))
+COVER_JPEG_QUALITY = 95
+
+
+def load_cover(cover_path: str, size: int) -> Image.Image:
+    """
+    Open a cover scaled to (size, size), decoding as little as possible.
+
+    The pixel count is checked from the header before any pixel data is read,
+    and JPEGs are decoded with draft() at the smallest DCT scale (1/2, 1/4, 1/8)
+    that still covers `size`, so a 4000px cover decodes at ~1000-2000px and the
+    LANCZOS pass only has to reduce the remainder.
+    """
+    img = Image.open(cover_path)
+    if img.width * img.height > MAX_COVER_PIXELS:
+        raise ValueError(
+            f"Cover image is {img.width}x{img.height}, above the {MAX_COVER_PIXELS:,} pixel limit"
+        )
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size))
+    img = img.convert("RGBA" if _has_alpha(img) else "RGB")
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.LANCZOS)
+    return img
+
+
+def normalize_cover(src_path: str, output_stem: str) -> Tuple[str, str]:
+    """
+    Store the render-ready cover ({output_stem}.jpg, or .png if it has transparency)
+    and its thumbnail ({output_stem}_thumb.jpg). Returns (cover path, thumbnail path).
+    Raises ValueError for images over the pixel limit and OSError for unreadable ones.
+    """
+    with span("cover_normalize"):
+        cover = load_cover(src_path, COVER_SIZE)
+        if cover.mode == "RGBA":
+            cover_path = f"{output_stem}.png"
+            cover.save(cover_path + ".part", format="PNG")
+        else:
+            cover_path = f"{output_stem}.jpg"
+            cover.save(cover_path + ".part", format="JPEG", quality=COVER_JPEG_QUALITY)
+        os.replace(cover_path + ".part", cover_path)
+
+        thumbnail_path = cover_thumbnail_path(cover_path)
+        thumb = cover.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        thumb.save(thumbnail_path, format="JPEG", quality=85)
+    return cover_path, thumbnail_path
+
+
+def cover_thumbnail_path(cover_path: str) -> str:
+    path = Path(cover_path)
+    return str(path.with_name(f"{path.stem}_thumb.jpg"))
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+@timed("extract_dominant_colors")
 def extract_dominant_colors(image_path: str, n: int = 5) -> List[Tuple[int, int, int]]:
     """
     Extract n dominant colors from an image using color quantization.
+    Reads the cover's thumbnail when one was stored at ingestion.
     Returns list of (R, G, B) tuples.
     """
-    img = Image.open(image_path).convert("RGB")
-    # Resize for speed
-    img = img.resize((150, 150))
+    thumbnail_path = cover_thumbnail_path(image_path)
+    if os.path.exists(thumbnail_path):
+        image_path = thumbnail_path
+    # Reduced-size decode and resize for speed
+    img = load_cover(image_path, 150).convert("RGB")
     # Quantize
     quantized = img.quantize(colors=n, method=Image.Quantize.MEDIANCUT)
     palette = quantized.getpalette()
@@ -35,16 +104,14 @@ def extract_dominant_colors(image_path: str, n: int = 5) -> List[Tuple[int, int,
     return colors
 
 
-def create_vinyl_image(cover_path: str, size: int = 800) -> Image.Image:
+@lru_cache(maxsize=4)
+def vinyl_layers(size: int) -> Tuple[Image.Image, Image.Image, Image.Image]:
     """
-    Create a vinyl record image with the album cover filling the entire disc.
-    Returns a PIL Image with alpha channel.
+    The cover-independent layers of a vinyl disc: (disc mask, grooves, shine).
+    Built once per size and shared; callers must not draw on them.
     """
-    vinyl = Image.new("RGBA", (size, size), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(vinyl)
     center = size // 2
     radius = size // 2 - 4
-    cover_diameter = radius * 2
 
     # Circular mask for the entire disc
     disc_mask = Image.new("L", (size, size), 0)
@@ -54,22 +121,7 @@ def create_vinyl_image(cover_path: str, size: int = 800) -> Image.Image:
         fill=255
     )
 
-    if cover_path and Path(cover_path).exists():
-        # Cover art fills the entire disc — resize to full canvas, apply circular mask
-        cover = Image.open(cover_path).convert("RGBA")
-        cover = cover.resize((size, size), Image.LANCZOS)
-        # Apply disc mask to cover's alpha
-        cover_with_mask = Image.new("RGBA", (size, size), (0, 0, 0, 0))
-        cover_with_mask.paste(cover, (0, 0), disc_mask)
-        vinyl = Image.alpha_composite(vinyl, cover_with_mask)
-    else:
-        # Fallback: dark disc
-        draw.ellipse(
-            [center - radius, center - radius, center + radius, center + radius],
-            fill=(35, 35, 40, 255)
-        )
-
-    # Overlay semi-transparent vinyl grooves on top of the cover
+    # Semi-transparent vinyl grooves
     grooves = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     grooves_draw = ImageDraw.Draw(grooves)
     for r in range(radius, 0, -6):
@@ -80,17 +132,6 @@ def create_vinyl_image(cover_path: str, size: int = 800) -> Image.Image:
             width=1
         )
 
-    vinyl = Image.alpha_composite(vinyl, grooves)
-
-    # Center hole
-    hole_radius = int(radius * 0.03)
-    draw = ImageDraw.Draw(vinyl)
-    draw.ellipse(
-        [center - hole_radius, center - hole_radius,
-         center + hole_radius, center + hole_radius],
-        fill=(0, 0, 0, 255)
-    )
-
     # Subtle shine effect
     shine = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     shine_draw = ImageDraw.Draw(shine)
@@ -105,6 +146,49 @@ def create_vinyl_image(cover_path: str, size: int = 800) -> Image.Image:
             width=2
         )
 
+    return disc_mask, grooves, shine
+
+
+@timed("create_vinyl_image")
+def create_vinyl_image(cover_path: str, size: int = 800) -> Image.Image:
+    """
+    Create a vinyl record image with the album cover filling the entire disc.
+    Returns a PIL Image with alpha channel.
+    """
+    vinyl = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(vinyl)
+    center = size // 2
+    radius = size // 2 - 4
+    disc_mask, grooves, shine = vinyl_layers(size)
+
+    if cover_path and Path(cover_path).exists():
+        # Cover art fills the entire disc — resize to full canvas, apply circular mask
+        # Normalized covers are already size x size, so this is a plain decode
+        with span("vinyl.cover_load"):
+            cover = load_cover(cover_path, size)
+        # Apply disc mask to cover's alpha
+        cover_with_mask = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        cover_with_mask.paste(cover, (0, 0), disc_mask)
+        vinyl = Image.alpha_composite(vinyl, cover_with_mask)
+    else:
+        # Fallback: dark disc
+        draw.ellipse(
+            [center - radius, center - radius, center + radius, center + radius],
+            fill=(35, 35, 40, 255)
+        )
+
+    # Overlay the grooves on top of the cover
+    vinyl = Image.alpha_composite(vinyl, grooves)
+
+    # Center hole
+    hole_radius = int(radius * 0.03)
+    draw = ImageDraw.Draw(vinyl)
+    draw.ellipse(
+        [center - hole_radius, center - hole_radius,
+         center + hole_radius, center + hole_radius],
+        fill=(0, 0, 0, 255)
+    )
+
     vinyl = Image.alpha_composite(vinyl, shine)
     return vinyl
 
@@ -0,0 +1,321 @@
+"""
+Durable local render queue (SQLite) shared by the API and render workers.
+
+With SONIVO_RENDER_MODE=queue the API only enqueues jobs and reads their
+progress; `python -m app.worker` processes claim and render them in separate
+processes and write progress back. The database is a single file
+(SONIVO_QUEUE_DB, default cache/jobs.sqlite3), so several workers, on this
+machine or on others that share the storage, can serve one API.
+
+Paths inside the project are stored relative to it and resolved by each
+worker against its own checkout, so machines may mount the storage at
+different locations. Workers heartbeat their running jobs; a job whose worker
+stopped heartbeating for STALE_SECONDS is queued again (up to MAX_ATTEMPTS).
+Cancelling marks a job cancelled; a worker rendering it sees that on its next
+poll and stops the render. Workers claim by priority class (scheduler.py), with
+the same aging rule as the in-process scheduler so bulk jobs are not starved.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+from app.services import eta
+from app.services.scheduler import AGING_SECONDS, INTERACTIVE
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+QUEUE_DB = Path(os.environ.get("SONIVO_QUEUE_DB", str(BASE_DIR / "cache" / "jobs.sqlite3")))
+
+# "thread": render in the API process (default); "pool": render in the API's warm
+# process pool (app/services/render_pool.py); "queue": hand jobs to app.worker
+RENDER_MODE = os.environ.get("SONIVO_RENDER_MODE", "thread")
+
+STALE_SECONDS = 60
+MAX_ATTEMPTS = 3
+_BUSY_TIMEOUT_MS = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,          -- queued | running | done | error | cancelled
+    params      TEXT NOT NULL,          -- JSON render arguments
+    progress    INTEGER NOT NULL DEFAULT 0,
+    encoder     TEXT,                   -- JSON FFmpeg stats while running
+    result      TEXT,                   -- JSON result or {"error": ...}
+    worker      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    priority    INTEGER NOT NULL DEFAULT 0, -- scheduler class, 0 = interactive
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+# Render arguments that are file paths
+_PATH_PARAMS = ("audio_path", "cover_path", "output_path")
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def to_stored_path(path: Optional[str]) -> Optional[str]:
+    """Project-relative form of a path, so other checkouts can resolve it."""
+    if not path:
+        return path
+    try:
+        return str(Path(path).resolve().relative_to(BASE_DIR))
+    except ValueError:
+        return str(path)
+
+
+def resolve_path(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return path
+    return str(path) if os.path.isabs(path) else str(BASE_DIR / path)
+
+
+class JobQueue:
+    """
+    Usage:
+        queue = JobQueue()
+        queue.enqueue(job_id, {"audio_path": ..., "output_path": ..., ...})
+        job = queue.claim(worker_name())        # worker side
+        queue.update_progress(job["id"], 40, stats)
+        queue.finish(job["id"], {"filename": ...})
+    """
+
+    def __init__(self, path: Path = QUEUE_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+            # Databases created before priority classes
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "priority" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call: safe across threads, processes and forks
+        conn = sqlite3.connect(str(self.path), timeout=_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def enqueue(self, job_id: str, params: dict, priority: int = INTERACTIVE):
+        stored = dict(params)
+        for key in _PATH_PARAMS:
+            if key in stored:
+                stored[key] = to_stored_path(stored[key])
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, params, priority, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(stored), priority, time.time()),
+            )
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """
+        Atomically take the queued job of the highest class (oldest first), or None.
+        Waiting raises a job by one class per scheduler.AGING_SECONDS.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                aging = AGING_SECONDS if AGING_SECONDS > 0 else float("inf")
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued'"
+                    " ORDER BY priority - (? - created_at) / ?, created_at LIMIT 1",
+                    (now, aging),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,"
+                    " started_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (worker, now, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = _row_to_job(row)
+        job["status"] = "running"
+        for key in _PATH_PARAMS:
+            if key in job["params"]:
+                job["params"][key] = resolve_path(job["params"][key])
+        return job
+
+    def update_progress(self, job_id: str, progress: int, encoder: Optional[dict] = None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, encoder = COALESCE(?, encoder), heartbeat_at = ?"
+                " WHERE id = ? AND status = 'running'",
+                (progress, json.dumps(encoder) if encoder else None, time.time(), job_id),
+            )
+
+    def heartbeat(self, job_ids: list):
+        if not job_ids:
+            return
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def finish(self, job_id: str, result: dict) -> bool:
+        """Mark a job done. False if it was cancelled meanwhile: a cancel is final."""
+        return self._complete(job_id, "done", result, progress=100)
+
+    def fail(self, job_id: str, error: str) -> bool:
+        return self._complete(job_id, "error", {"error": error})
+
+    def _complete(self, job_id: str, status: str, result: dict, progress: Optional[int] = None) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, progress = COALESCE(?, progress), finished_at = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                (status, json.dumps(result), progress, time.time(), job_id),
+            ).rowcount > 0
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. False if it is unknown or already finished."""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'cancelled', result = ?, finished_at = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                (json.dumps({"error": "cancelled"}), time.time(), job_id),
+            ).rowcount > 0
+
+    def cancelled(self, job_ids: list) -> list:
+        """Those of job_ids that have been cancelled."""
+        if not job_ids:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE status = 'cancelled' AND id IN ({','.join('?' * len(job_ids))})",
+                list(job_ids),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def requeue(self, job_id: str):
+        """Put a running job back in the queue (its worker is shutting down)."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, progress = 0, encoder = NULL"
+                " WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def requeue_stale(self, stale_seconds: float = STALE_SECONDS) -> int:
+        """Queue again jobs whose worker stopped heartbeating; fail them after MAX_ATTEMPTS."""
+        cutoff = time.time() - stale_seconds
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = conn.execute(
+                    "UPDATE jobs SET status = 'error', result = ?, finished_at = ?"
+                    " WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                    (json.dumps({"error": "render worker lost"}), time.time(), cutoff, MAX_ATTEMPTS),
+                ).rowcount
+                requeued = conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, progress = 0, encoder = NULL"
+                    " WHERE status = 'running' AND heartbeat_at < ?",
+                    (cutoff,),
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return requeued + failed
+
+    def interactive_active(self) -> bool:
+        """Whether an interactive job is queued or running (lower classes are throttled)."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM jobs WHERE status IN ('queued', 'running') AND priority = ?)",
+                (INTERACTIVE,),
+            ).fetchone()
+        return bool(row[0])
+
+    def expected_wait(self, job_id: Optional[str] = None, priority: int = INTERACTIVE) -> Optional[float]:
+        """
+        Estimated seconds until job_id (or a job of this class enqueued now) is claimed:
+        the predicted remaining work of running jobs plus that of jobs claimed before it,
+        with the running jobs taken as the workers' capacity. 0 for a running job,
+        None for an unknown or finished one.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, status, params, priority, created_at, started_at FROM jobs"
+                " WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        now = time.time()
+        aging = AGING_SECONDS if AGING_SECONDS > 0 else float("inf")
+
+        def rank(row) -> tuple:
+            # Same order as claim()
+            return (row["priority"] - (now - row["created_at"]) / aging, row["created_at"])
+
+        if job_id is None:
+            target = (priority, now)
+        else:
+            row = next((r for r in rows if r["id"] == job_id), None)
+            if row is None:
+                return None
+            if row["status"] == "running":
+                return 0.0
+            target = rank(row)
+        running = [r for r in rows if r["status"] == "running"]
+        work = [max(0.0, eta.predict(_video_seconds(r)) - (now - r["started_at"])) for r in running]
+        work += [
+            eta.predict(_video_seconds(r))
+            for r in sorted(rows, key=rank)
+            if r["status"] == "queued" and rank(r) < target
+        ]
+        return eta.expected_wait(work, max(1, len(running)))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    def counts(self) -> dict:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def active_params(self) -> list:
+        """Render arguments of queued and running jobs (their files must be kept)."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT params FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [json.loads(row["params"]) for row in rows]
+
+
+def _video_seconds(row: sqlite3.Row) -> float:
+    params = json.loads(row["params"])
+    return params.get("end_sec", 30) - params.get("start_sec", 0)
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "params": json.loads(row["params"]),
+        "progress": row["progress"],
+        "encoder": json.loads(row["encoder"]) if row["encoder"] else None,
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "worker": row["worker"],
+        "attempts": row["attempts"],
+        "priority": row["priority"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+    }
@@ -0,0 +1,232 @@
+"""
+Memory attribution for benchmark runs (opt-in, BenchmarkSession(profile_memory=True)).
+
+- tracemalloc snapshots at every timing-span boundary: top allocation sites
+  and growth since the previous boundary, plus the Python heap peak per stage.
+- RSS / PSS / USS of the Python process and of its children (FFmpeg) read
+  separately from /proc/<pid>/smaps_rollup, with the peak attributed to each
+  stage that was open when it was sampled.
+
+tracemalloc slows allocation-heavy code noticeably, so timings from profiled
+runs are not comparable with normal runs.
+"""
+import os
+import threading
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+import psutil
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+DEFAULT_TOP_N = 10
+DEFAULT_TRACE_FRAMES = 1
+
+_MB = 1024 * 1024
+
+# Ignore allocations made by the profiler and samplers themselves, and by the import machinery
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "*/psutil/*"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def read_memory(pid: int) -> Optional[dict]:
+    """
+    Resident (RSS), proportional (PSS, shared pages split between sharers) and
+    unique (USS, private pages) memory of a process in bytes, from
+    /proc/<pid>/smaps_rollup. Falls back to RSS only where that is unavailable.
+    Returns None if the process is gone.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                key, sep, value = line.partition(":")
+                if sep and value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0]) * 1024
+        return {
+            "rss": fields.get("Rss", 0),
+            "pss": fields.get("Pss", 0),
+            "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        }
+    except FileNotFoundError:
+        pass  # no smaps_rollup (kernel < 4.14, non-Linux) or the process exited
+    except (OSError, ValueError):
+        return None
+
+    try:
+        rss = psutil.Process(pid).memory_info().rss
+    except psutil.Error:
+        return None
+    return {"rss": rss, "pss": None, "uss": None}
+
+
+def _site(frame) -> str:
+    path = Path(frame.filename)
+    try:
+        path = path.relative_to(BASE_DIR)
+    except ValueError:
+        pass
+    return f"{path}:{frame.lineno}"
+
+
+class _StageMemory:
+    """Peaks observed while one stage was open."""
+
+    def __init__(self):
+        self.heap_peak = 0
+        self.heap_end = 0
+        self.peak = {"python": {}, "children": {}}
+        self.top: list = []
+        self.growth: list = []
+
+    def observe(self, who: str, sample: dict):
+        peak = self.peak[who]
+        for key, value in sample.items():
+            if value is not None and value > peak.get(key, 0):
+                peak[key] = value
+
+
+class MemoryProfiler:
+    """
+    Usage:
+        profiler = MemoryProfiler()
+        profiler.start()
+        recorder.observe(profiler.on_span)      # stage boundaries
+        profiler.sample(os.getpid(), child_pids) # from a sampling loop
+        profiler.stop()
+        profiler.report()
+    """
+
+    def __init__(self, top_n: int = DEFAULT_TOP_N, frames: int = DEFAULT_TRACE_FRAMES):
+        self.top_n = top_n
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self._open: list = []  # stack of open stage names
+        self._stages: dict = {}
+        self._overall = _StageMemory()
+        self._last_snapshot = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._last_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def stop(self):
+        with self._lock:
+            self._fold_heap_peak()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._last_snapshot = None
+
+    def on_span(self, event: str, name: str):
+        """SpanRecorder observer: called with ("start"|"end", stage name)."""
+        if not tracemalloc.is_tracing():
+            return
+        if event == "start":
+            with self._lock:
+                self._fold_heap_peak()
+                self._open.append(name)
+                self._stages.setdefault(name, _StageMemory())
+            self._sample_tree()
+            return
+
+        # Sample before closing so stages shorter than the monitor interval still get a reading
+        self._sample_tree()
+        with self._lock:
+            self._fold_heap_peak()
+            if name in self._open:
+                # Remove the innermost occurrence (spans nest)
+                del self._open[len(self._open) - 1 - self._open[::-1].index(name)]
+            stage = self._stages.setdefault(name, _StageMemory())
+            stage.heap_end = tracemalloc.get_traced_memory()[0]
+            self._snapshot_into(stage)
+
+    def _sample_tree(self):
+        try:
+            child_pids = [child.pid for child in psutil.Process(os.getpid()).children(recursive=True)]
+        except psutil.Error:
+            child_pids = []
+        self.sample(os.getpid(), child_pids)
+
+    def sample(self, python_pid: int, child_pids: list):
+        """Record one /proc reading of the Python process and its children."""
+        python = read_memory(python_pid)
+        children = {"rss": 0, "pss": 0, "uss": 0}
+        for pid in child_pids:
+            mem = read_memory(pid)
+            if mem is None:
+                continue
+            for key in children:
+                if children[key] is not None:
+                    children[key] = None if mem[key] is None else children[key] + mem[key]
+
+        with self._lock:
+            targets = [self._overall] + [self._stages[name] for name in set(self._open)]
+            for stage in targets:
+                if python is not None:
+                    stage.observe("python", python)
+                stage.observe("children", children)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "tracemalloc_frames": self.frames,
+                "python_heap_peak_mb": round(self._overall.heap_peak / _MB, 1),
+                "process": _peaks_mb(self._overall),
+                "stages": {
+                    name: {
+                        "python_heap_peak_mb": round(stage.heap_peak / _MB, 1),
+                        "python_heap_end_mb": round(stage.heap_end / _MB, 1),
+                        **_peaks_mb(stage),
+                        "top_allocations": stage.top,
+                        "growth": stage.growth,
+                    }
+                    for name, stage in self._stages.items()
+                },
+            }
+
+    def _fold_heap_peak(self):
+        """Credit the heap peak since the last boundary to every open stage, then reset it."""
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        self._overall.heap_peak = max(self._overall.heap_peak, peak)
+        for name in self._open:
+            stage = self._stages[name]
+            stage.heap_peak = max(stage.heap_peak, peak)
+        tracemalloc.reset_peak()
+
+    def _snapshot_into(self, stage: _StageMemory):
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        stage.top = [
+            {"site": _site(stat.traceback[0]), "size_mb": round(stat.size / _MB, 2), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[: self.top_n]
+        ]
+        if self._last_snapshot is not None:
+            diffs = [d for d in snapshot.compare_to(self._last_snapshot, "lineno") if d.size_diff > 0]
+            stage.growth = [
+                {"site": _site(d.traceback[0]), "size_diff_mb": round(d.size_diff / _MB, 2), "count_diff": d.count_diff}
+                for d in diffs[: self.top_n]
+            ]
+        self._last_snapshot = snapshot
+
+
+def _peaks_mb(stage: _StageMemory) -> dict:
+    out = {}
+    for who in ("python", "children"):
+        for key in ("rss", "pss", "uss"):
+            value = stage.peak[who].get(key)
+            out[f"peak_{who}_{key}_mb"] = round(value / _MB, 1) if value else None
+    return out
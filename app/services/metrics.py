@@ -0,0 +1,383 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+A deliberately small registry (counters, gauges, histograms with labels) so
+there is no extra dependency; every update is a dict lookup under a lock, cheap
+enough to leave on permanently. Gauges can be computed at scrape time
+(set_function), which is how in-flight FFmpeg processes and their RSS are read.
+
+Render processes (render_pool.py) drain() their counters and histograms after
+every job and send them to the pool owner, which merge()s them; gauges stay
+process-local, except render FFmpeg pids, which reach the owner through
+add_ffmpeg_listener().
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segment-length classes (seconds, upper bounds) used to label per-job histograms
+SEGMENT_CLASSES = (15, 30, 60, 120, 300)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+    def drain(self) -> dict:
+        """Take the recorded values and start from zero (forwarding to another process)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, values: dict):
+        """Add values drained from the same counter in another process."""
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the (unlabelled) value when scraped."""
+        self._function = function
+
+    def render(self) -> list[str]:
+        if self._function is not None:
+            try:
+                value = float(self._function())
+            except Exception:
+                value = math.nan
+            with self._lock:
+                self._values[()] = value
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def merge(self, values: dict):
+        """Add observations drained from the same histogram in another process."""
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                bucket_labels = labels + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> dict:
+        """Counter and histogram values recorded since the last drain, by metric name."""
+        drained = {}
+        for metric in self._metrics:
+            if isinstance(metric, (Counter, Histogram)):
+                values = metric.drain()
+                if values:
+                    drained[metric.name] = values
+        return drained
+
+    def merge(self, drained: dict):
+        """Add what another process's registry drained."""
+        by_name = {metric.name: metric for metric in self._metrics}
+        for name, values in drained.items():
+            metric = by_name.get(name)
+            if isinstance(metric, (Counter, Histogram)):
+                metric.merge(values)
+
+
+REGISTRY = Registry()
+
+
+def segment_class(seconds: float) -> str:
+    """Label value for a segment length: the smallest class bound it fits under."""
+    for bound in SEGMENT_CLASSES:
+        if seconds <= bound:
+            return str(bound)
+    return "+Inf"
+
+
+# ── Render jobs ──
+
+JOB_SECONDS = REGISTRY.register(Histogram(
+    "sonivo_job_duration_seconds", "Wall time of successful render jobs.",
+    buckets=(5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800), labelnames=("segment_le",),
+))
+JOB_RTF = REGISTRY.register(Histogram(
+    "sonivo_job_realtime_factor", "Render wall time divided by segment length.",
+    buckets=(0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10), labelnames=("segment_le",),
+))
+FRAME_LOOP_FPS = REGISTRY.register(Histogram(
+    "sonivo_frame_loop_fps", "Frames per second pushed through the render/write pipeline.",
+    buckets=(10, 20, 30, 45, 60, 90, 120, 180, 240),
+))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "sonivo_jobs_total", "Render jobs finished, by outcome.", labelnames=("status",),
+))
+JOBS_RUNNING = REGISTRY.register(Gauge(
+    "sonivo_jobs_running", "Render jobs currently executing.",
+))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "sonivo_jobs_queued", "Render jobs accepted but not started yet.",
+))
+JOBS_CANCELLED = REGISTRY.register(Counter(
+    "sonivo_jobs_cancelled_total", "Render jobs cancelled, by reason.", labelnames=("reason",),
+))
+JOBS_REJECTED = REGISTRY.register(Counter(
+    "sonivo_jobs_rejected_total", "Render requests refused with 503 because the expected wait was too long.",
+    labelnames=("priority",),
+))
+SCHEDULER_WAIT = REGISTRY.register(Histogram(
+    "sonivo_scheduler_wait_seconds", "Time render jobs waited for a slot, by priority class.",
+    buckets=(0.1, 1, 5, 15, 30, 60, 120, 300, 600), labelnames=("priority",),
+))
+POOL_RECYCLES = REGISTRY.register(Counter(
+    "sonivo_render_pool_recycles_total", "Render pool worker processes replaced, by reason.", labelnames=("reason",),
+))
+
+# ── FFmpeg ──
+
+FFMPEG_ERRORS = REGISTRY.register(Counter(
+    "sonivo_ffmpeg_errors_total", "FFmpeg invocations that failed.", labelnames=("kind",),
+))
+FFMPEG_PROCESSES = REGISTRY.register(Gauge(
+    "sonivo_ffmpeg_processes", "Render FFmpeg processes currently running.",
+))
+FFMPEG_RSS = REGISTRY.register(Gauge(
+    "sonivo_ffmpeg_resident_bytes", "Total resident memory of running render FFmpeg processes.",
+))
+
+# ── Caches ──
+
+CACHE_HITS = REGISTRY.register(Counter(
+    "sonivo_cache_hits_total", "Cache lookups served from cache.", labelnames=("cache",),
+))
+CACHE_MISSES = REGISTRY.register(Counter(
+    "sonivo_cache_misses_total", "Cache lookups that had to compute the value.", labelnames=("cache",),
+))
+
+# ── API ──
+
+WAVEFORM_SECONDS = REGISTRY.register(Histogram(
+    "sonivo_waveform_seconds", "Latency of waveform peak extraction.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+))
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    "sonivo_upload_bytes", "Size of uploaded audio files.",
+    buckets=tuple(mb * 1024 * 1024 for mb in (1, 5, 10, 25, 50, 100, 250, 500)),
+))
+UPLOAD_AUDIO_SECONDS = REGISTRY.register(Histogram(
+    "sonivo_upload_audio_duration_seconds", "Duration of uploaded audio.",
+    buckets=(30, 60, 180, 300, 600, 1200, 3600),
+))
+
+# ── Storage ──
+
+STORAGE_BYTES = REGISTRY.register(Gauge(
+    "sonivo_storage_bytes", "Bytes used by a managed directory at the last storage pass.", labelnames=("area",),
+))
+STORAGE_EVICTIONS = REGISTRY.register(Counter(
+    "sonivo_storage_evictions_total", "Upload/output units evicted, by reason.", labelnames=("area", "reason"),
+))
+STORAGE_EVICTED_BYTES = REGISTRY.register(Counter(
+    "sonivo_storage_evicted_bytes_total", "Bytes freed by storage eviction.", labelnames=("area",),
+))
+
+
+_ffmpeg_pids: set = set()
+_ffmpeg_lock = threading.Lock()
+_ffmpeg_listeners: list = []
+
+
+def add_ffmpeg_listener(listener):
+    """Call listener(pid, running) when a render FFmpeg is tracked or untracked."""
+    _ffmpeg_listeners.append(listener)
+
+
+def track_ffmpeg(pid: int):
+    with _ffmpeg_lock:
+        _ffmpeg_pids.add(pid)
+    for listener in _ffmpeg_listeners:
+        listener(pid, True)
+
+
+def untrack_ffmpeg(pid: int):
+    with _ffmpeg_lock:
+        _ffmpeg_pids.discard(pid)
+    for listener in _ffmpeg_listeners:
+        listener(pid, False)
+
+
+def _ffmpeg_count() -> int:
+    with _ffmpeg_lock:
+        return len(_ffmpeg_pids)
+
+
+def _ffmpeg_rss() -> int:
+    """Sum resident pages from /proc/<pid>/statm (one small read per process)."""
+    with _ffmpeg_lock:
+        pids = list(_ffmpeg_pids)
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+    return total
+
+
+FFMPEG_PROCESSES.set_function(_ffmpeg_count)
+FFMPEG_RSS.set_function(_ffmpeg_rss)
+
+
+@contextmanager
+def track_job(segment_seconds: float):
+    """Count a render job as running; on success record its wall time and real-time factor."""
+    JOBS_RUNNING.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # Exceptions may name their own outcome (a cancelled render is not an error)
+        JOBS_TOTAL.inc(status=getattr(e, "job_status", "error"))
+        raise
+    else:
+        elapsed = time.perf_counter() - start
+        label = segment_class(segment_seconds)
+        JOB_SECONDS.observe(elapsed, segment_le=label)
+        if segment_seconds > 0:
+            JOB_RTF.observe(elapsed / segment_seconds, segment_le=label)
+        JOBS_TOTAL.inc(status="done")
+    finally:
+        JOBS_RUNNING.dec()
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def drain() -> dict:
+    return REGISTRY.drain()
+
+
+def merge(drained: dict):
+    REGISTRY.merge(drained)
@@ -0,0 +1,223 @@
+"""
+Speculative precomputation right after upload.
+
+Between upload and "Generate" the user spends a while picking a segment and the
+server is idle. Each upload queues a task for one low-priority background thread
+that computes the waveform peaks, then builds the vinyl and rotation cycle for
+the cover (warming the rotation maps on the way; only in thread render mode,
+where renders run in this process). /api/waveform and generate_video pick the
+results up instead of starting cold.
+
+The work is speculative, so it stays cheap to throw away:
+- the thread (and the FFmpeg it starts) runs at a raised nice value
+- tasks run in upload order; only a new task for the same file_id replaces an
+  unfinished one, and at most MAX_PENDING tasks wait (the oldest are dropped)
+- a render that needs a cycle still being built cancels the build (it stops
+  between frames) and builds the cycle at its own priority instead of waiting
+- at most SONIVO_PRECOMPUTE_CYCLES cycles (~143 MB each) are kept, and unused
+  ones are dropped after SONIVO_PRECOMPUTE_TTL seconds
+
+Renders can also leave the cycle they built in the same cache
+(generate_video(..., keep_cycle=True)); the manifest CLI does, so rows sharing
+a cover build its cycle once per render process.
+
+SONIVO_PRECOMPUTE=0 turns it off.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.services import job_queue, metrics, scheduler
+from app.services.audio_processor import generate_waveform_peaks
+from app.services.rotation_cycle import CycleBuildCancelled, RotationCycle
+
+
+ENABLED = os.environ.get("SONIVO_PRECOMPUTE", "1") == "1"
+MAX_CYCLES = int(os.environ.get("SONIVO_PRECOMPUTE_CYCLES", "2"))
+CYCLE_TTL_SECONDS = float(os.environ.get("SONIVO_PRECOMPUTE_TTL", "900"))
+
+MAX_TASKS = 100
+MAX_PENDING = 10
+# Longest /api/waveform waits for peaks already being computed before doing the work itself
+WAIT_SECONDS = 60
+_EXPIRE_INTERVAL_SECONDS = 60
+
+
+class PrecomputeTask:
+    """Precomputation for one upload. peaks is filled in before peaks_ready is set."""
+
+    def __init__(self, file_id: str, audio_path: str, cover_path: Optional[str]):
+        self.file_id = file_id
+        self.audio_path = audio_path
+        self.cover_path = cover_path
+        self.peaks: Optional[list] = None
+        self.peaks_ready = threading.Event()
+        self.done = threading.Event()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+
+# Pending tasks (oldest first) and all recent tasks by file_id
+_queue: list = []
+_tasks: "OrderedDict[str, PrecomputeTask]" = OrderedDict()
+_cond = threading.Condition()
+_worker: Optional[threading.Thread] = None
+
+# Finished cycles: key -> [RotationCycle, last used]; keys being built -> PrecomputeTask
+_cycles: "OrderedDict[str, list]" = OrderedDict()
+_building: dict = {}
+_cache_lock = threading.Lock()
+
+
+def schedule(file_id: str, audio_path: str, cover_path: Optional[str]) -> Optional[PrecomputeTask]:
+    """Queue precomputation for a fresh upload, replacing an unfinished task for the same file."""
+    if not ENABLED:
+        return None
+
+    global _worker
+    task = PrecomputeTask(file_id, audio_path, cover_path)
+    with _cond:
+        previous = _tasks.pop(file_id, None)
+        if previous is not None and not previous.done.is_set():
+            previous.cancel()
+            if previous in _queue:
+                _queue.remove(previous)
+                _drop(previous)
+        _tasks[file_id] = task
+        while len(_tasks) > MAX_TASKS:
+            _tasks.popitem(last=False)
+        _queue.append(task)
+        while len(_queue) > MAX_PENDING:
+            _drop(_queue.pop(0))
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="sonivo-precompute", daemon=True)
+            _worker.start()
+        _cond.notify()
+    return task
+
+
+def cancel(file_id: str):
+    """Stop precomputation for an upload (e.g. a different cover was chosen)."""
+    task = _tasks.get(file_id)
+    if task is not None:
+        task.cancel()
+
+
+def waveform_peaks(file_id: str, timeout: float = WAIT_SECONDS) -> Optional[list]:
+    """
+    Peaks computed for an upload, waiting for them if they are being computed.
+    None if there is no task or it is still queued behind other uploads.
+    """
+    with _cond:
+        task = _tasks.get(file_id)
+        if task is None or task in _queue:
+            return None
+    task.peaks_ready.wait(timeout)
+    return task.peaks
+
+
+def take_cycle(key: str) -> Optional[RotationCycle]:
+    """
+    A handle on the precomputed rotation cycle for key (release() it when done).
+    None if there is none; a build still in progress is cancelled, since the
+    caller builds the cycle at its own priority faster than the precompute thread.
+    """
+    with _cache_lock:
+        _expire()
+        entry = _cycles.get(key)
+        if entry is None:
+            building = _building.get(key)
+            if building is not None:
+                building.cancel()
+            metrics.CACHE_MISSES.inc(cache="precompute")
+            return None
+        _cycles.move_to_end(key)
+        entry[1] = time.monotonic()
+        metrics.CACHE_HITS.inc(cache="precompute")
+        return entry[0].share()
+
+
+def store_cycle(key: str, cycle: RotationCycle):
+    """Keep a handle on a cycle a render built itself, for later renders of the same cover."""
+    with _cache_lock:
+        if key in _cycles or key in _building:
+            return
+        _cycles[key] = [cycle.share(), time.monotonic()]
+        while len(_cycles) > MAX_CYCLES:
+            _, (evicted, _) = _cycles.popitem(last=False)
+            evicted.release()
+
+
+def _drop(task: PrecomputeTask):
+    """Finish a task that never started so nobody waits on it. Caller holds _cond."""
+    task.peaks_ready.set()
+    task.done.set()
+
+
+def _run_worker():
+    scheduler.lower_thread_priority(scheduler.PRECOMPUTE)
+    while True:
+        with _cond:
+            while not _queue:
+                if not _cond.wait(timeout=_EXPIRE_INTERVAL_SECONDS):
+                    with _cache_lock:
+                        _expire()
+            task = _queue.pop(0)
+        try:
+            _run_task(task)
+        except Exception as e:
+            print(f"Precompute failed for {task.file_id}: {e}")
+        finally:
+            task.peaks_ready.set()
+            task.done.set()
+
+
+def _run_task(task: PrecomputeTask):
+    if task.cancelled:
+        return
+    # Imported here: video_generator itself uses this module
+    from app.services.video_generator import prepare_rotation_cycle, rotation_cycle_key
+
+    # Claim the cycle before the peaks, so a generate request arriving meanwhile
+    # cancels this build instead of racing it
+    key = rotation_cycle_key(task.cover_path)
+    with _cache_lock:
+        claimed = False
+        # Queue mode renders in worker processes, which cannot use this process's cycles
+        if job_queue.RENDER_MODE == "thread" and key not in _cycles and key not in _building:
+            _building[key] = task
+            claimed = True
+
+    cycle = None
+    try:
+        task.peaks = generate_waveform_peaks(task.audio_path)
+        task.peaks_ready.set()
+        if claimed and not task.cancelled:
+            cycle = prepare_rotation_cycle(task.cover_path, cancel_event=task.cancel_event)
+    except CycleBuildCancelled:
+        pass
+    finally:
+        if claimed:
+            with _cache_lock:
+                if cycle is not None:
+                    _cycles[key] = [cycle, time.monotonic()]
+                    while len(_cycles) > MAX_CYCLES:
+                        _, (evicted, _) = _cycles.popitem(last=False)
+                        evicted.release()
+                _building.pop(key, None)
+
+
+def _expire():
+    """Drop cycles unused for CYCLE_TTL_SECONDS. Caller holds _cache_lock."""
+    now = time.monotonic()
+    for key in [k for k, (_, used) in _cycles.items() if now - used > CYCLE_TTL_SECONDS]:
+        _cycles.pop(key)[0].release()
+
@@ -0,0 +1,419 @@
+"""
+Warm pool of long-lived render processes.
+
+Starting a render process from scratch costs an interpreter, the NumPy/Pillow
+imports, the rotation maps and the vinyl overlay layers before the first frame.
+Pool workers are forked from a forkserver that has already imported the render
+stack, warm the per-size state once (warm_worker) and then render jobs one after
+another. A worker is replaced after SONIVO_POOL_MAX_JOBS jobs or when its RSS
+exceeds SONIVO_POOL_MAX_RSS_MB after a job, so heap fragmentation from the large
+per-job frame buffers cannot accumulate.
+
+Jobs take the arguments of generate_video and report through the same
+progress_callback(percent, stats=None) contract, called on a relay thread in
+the submitting process. Setting a job's cancel_event stops its render at the
+next frame (the Future then raises RenderCancelled):
+
+    pool = RenderPool(processes=2)
+    future = pool.submit(audio_path=..., output_path=..., progress_callback=on_progress,
+                         cancel_event=threading.Event())
+    future.result()            # output path, or raises the render error
+    pool.shutdown()
+
+Workers also report what a render in this process would have recorded: their
+metrics (drained after every job), the pids of their render FFmpeg processes
+for the FFmpeg gauges, and, for a job submitted with a recorder, its timing
+spans. A job whose worker dies fails with RenderWorkerLost.
+
+Used by `python -m app.worker` and by the API with SONIVO_RENDER_MODE=pool.
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from app.services import metrics
+from app.services.timing import SpanRecorder, recording
+
+
+PROCESSES = int(os.environ.get("SONIVO_POOL_PROCESSES", "1"))
+MAX_JOBS_PER_WORKER = int(os.environ.get("SONIVO_POOL_MAX_JOBS", "50"))
+MAX_RSS_BYTES = int(float(os.environ.get("SONIVO_POOL_MAX_RSS_MB", "1024")) * 1024 * 1024)
+
+# Imported once by the forkserver; every worker forked from it starts with them loaded
+PRELOAD_MODULES = ["app.services.video_generator", "app.services.image_processor"]
+# (size, bold) fonts resolved at warm-up
+PRELOAD_FONTS = ((48, True), (36, False))
+
+# Relay wake-up period (how soon a set cancel_event reaches the worker) and liveness check period
+_EVENT_POLL_SECONDS = 0.2
+_WORKER_CHECK_SECONDS = 1.0
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class RenderWorkerLost(RuntimeError):
+    """The worker process rendering a job exited before reporting its outcome."""
+
+
+def _context():
+    # forkserver: workers fork from a clean, preloaded server, never from the API with its threads
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def warm_worker():
+    """Load everything a render needs that does not depend on the job."""
+    from app.services import image_processor, video_generator
+    from app.services.rotation_engine import get_rotation_maps
+
+    image_processor.vinyl_layers(video_generator.VINYL_SIZE)
+    # Only make sure the map cache file exists; the maps are unmapped once dropped,
+    # so their pages do not count towards the worker's RSS between jobs
+    get_rotation_maps(video_generator.VINYL_SIZE, video_generator.FPS, video_generator.VINYL_RPM)
+    for size, bold in PRELOAD_FONTS:
+        video_generator._get_font(size, bold)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _CancelFlag:
+    """cancel_event for a job in a worker: set when the pool writes the job's id to the worker's flag."""
+
+    def __init__(self, flag, job_id: int):
+        self._flag = flag
+        self._job_id = job_id
+
+    def is_set(self) -> bool:
+        return self._flag.value == self._job_id
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _worker_main(tasks, events, cancel_flag, current_job, max_jobs: int, max_rss_bytes: int):
+    """Worker process: warm up, then render jobs until told to stop or due for recycling."""
+    # Ctrl-C reaches the whole foreground process group; leave it so neither this process
+    # nor its FFmpeg sees it, and the pool owner decides what happens to renders
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.setpgrp()
+    # terminate() (shutdown(wait=False)) unwinds through generate_video, which kills
+    # its FFmpeg and removes the partial output instead of leaving both behind
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    from app.services.video_generator import RenderCancelled, generate_video
+
+    warm_worker()
+    pid = os.getpid()
+    metrics.add_ffmpeg_listener(lambda ffmpeg_pid, running: events.put(("ffmpeg", pid, ffmpeg_pid, running)))
+    jobs = 0
+    while True:
+        item = tasks.get()
+        if item is None:
+            return
+        job_id, kwargs, trace = item
+        # Set before anything else, so the pool can fail the job if this process dies
+        current_job.value = job_id
+        events.put(("start", job_id, pid))
+
+        def on_progress(pct, stats=None, job_id=job_id):
+            events.put(("progress", job_id, pct, stats))
+
+        recorder = SpanRecorder(trace=True) if trace else None
+        try:
+            with recording(recorder):
+                path = generate_video(
+                    progress_callback=on_progress, cancel_event=_CancelFlag(cancel_flag, job_id), **kwargs
+                )
+            outcome = ("done", job_id, path)
+        except RenderCancelled:
+            outcome = ("cancelled", job_id)
+        except Exception as e:
+            outcome = ("error", job_id, str(e))
+        # Metrics and spans first, so they are merged when the job's Future resolves
+        events.put(("metrics", pid, metrics.drain()))
+        if recorder is not None:
+            events.put(("spans", job_id, recorder.export()))
+        events.put(outcome)
+        current_job.value = 0
+
+        jobs += 1
+        reason = None
+        if max_jobs and jobs >= max_jobs:
+            reason = "jobs"
+        elif max_rss_bytes and _rss_bytes() > max_rss_bytes:
+            reason = "rss"
+        if reason is not None:
+            events.put(("retire", pid, reason))
+            return
+
+
+class _Job:
+    __slots__ = ("future", "progress_callback", "cancel_event", "recorder", "cancel_sent", "pid")
+
+    def __init__(self, future: Future, progress_callback, cancel_event, recorder):
+        self.future = future
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.recorder = recorder
+        self.cancel_sent = False
+        self.pid = None
+
+
+class RenderPool:
+    def __init__(
+        self,
+        processes: int = PROCESSES,
+        max_jobs_per_worker: int = MAX_JOBS_PER_WORKER,
+        max_rss_bytes: int = MAX_RSS_BYTES,
+    ):
+        self.processes = max(1, processes)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self._ctx = _context()
+        self._tasks = self._ctx.Queue()
+        self._events = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._jobs: dict = {}      # job_id -> _Job (submitted, not finished)
+        self._workers: dict = {}   # pid -> Process
+        self._cancel_flags: dict = {}  # pid -> shared id of the job to cancel
+        self._current_jobs: dict = {}  # pid -> shared id of the job being rendered (0: none)
+        self._ffmpeg_pids: dict = {}   # pid -> render FFmpeg pids of that worker
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._relay_stop = threading.Event()
+        self.recycled: dict = {}
+        for _ in range(self.processes):
+            self._spawn()
+        self._relay = threading.Thread(target=self._relay_events, name="sonivo-render-pool", daemon=True)
+        self._relay.start()
+
+    def submit(
+        self, progress_callback=None, cancel_event=None, recorder: Optional[SpanRecorder] = None, **kwargs
+    ) -> Future:
+        """
+        Queue a generate_video call. The Future resolves to the output path.
+        The render's timing spans are merged into recorder, if given.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("render pool is shut down")
+            job_id = next(self._ids)
+            self._jobs[job_id] = _Job(future, progress_callback, cancel_event, recorder)
+        self._tasks.put((job_id, kwargs, recorder is not None))
+        return future
+
+    def counts(self) -> dict:
+        """Submitted jobs waiting for a worker and rendering."""
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.pid is not None)
+            return {"queued": len(self._jobs) - running, "running": running}
+
+    def stats(self) -> dict:
+        counts = self.counts()
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "workers": list(self._workers),
+                "recycled": dict(self.recycled),
+                **counts,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers: after their current job (wait) or right away (terminate)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+        if wait:
+            for _ in workers:
+                self._tasks.put(None)
+        else:
+            for process in workers:
+                process.terminate()
+        for process in workers:
+            process.join()
+        self._relay_stop.set()
+        self._relay.join(timeout=2 * _WORKER_CHECK_SECONDS)
+        # Drain what the workers reported before exiting, then fail anything left over
+        self._handle_pending_events()
+        with self._lock:
+            leftover = list(self._jobs.values())
+            self._jobs.clear()
+            self._workers.clear()
+            self._cancel_flags.clear()
+            self._current_jobs.clear()
+            ffmpeg_pids = [p for pids in self._ffmpeg_pids.values() for p in pids]
+            self._ffmpeg_pids.clear()
+        for ffmpeg_pid in ffmpeg_pids:
+            metrics.untrack_ffmpeg(ffmpeg_pid)
+        for job in leftover:
+            job.future.set_exception(RenderWorkerLost("render pool shut down"))
+
+    def _spawn(self):
+        """Start one worker. Caller holds _lock, or is the constructor."""
+        cancel_flag = self._ctx.RawValue("q", 0)
+        current_job = self._ctx.RawValue("q", 0)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._tasks, self._events, cancel_flag, current_job, self.max_jobs_per_worker, self.max_rss_bytes),
+            name="sonivo-render",
+            daemon=True,
+        )
+        process.start()
+        self._workers[process.pid] = process
+        self._cancel_flags[process.pid] = cancel_flag
+        self._current_jobs[process.pid] = current_job
+
+    def _relay_events(self):
+        last_check = time.monotonic()
+        while not self._relay_stop.is_set():
+            try:
+                self._handle(self._events.get(timeout=_EVENT_POLL_SECONDS))
+            except queue.Empty:
+                pass
+            self._forward_cancels()
+            if time.monotonic() - last_check >= _WORKER_CHECK_SECONDS:
+                self._check_workers()
+                last_check = time.monotonic()
+
+    def _forward_cancels(self):
+        """Point a worker's cancel flag at its job once the job's cancel_event is set."""
+        with self._lock:
+            for job_id, job in self._jobs.items():
+                if job.cancel_sent or job.pid is None or job.cancel_event is None:
+                    continue
+                if job.cancel_event.is_set() and job.pid in self._cancel_flags:
+                    self._cancel_flags[job.pid].value = job_id
+                    job.cancel_sent = True
+
+    def _handle_pending_events(self):
+        while True:
+            try:
+                self._handle(self._events.get_nowait())
+            except queue.Empty:
+                return
+
+    def _handle(self, event: tuple):
+        kind = event[0]
+        if kind == "retire":
+            _, pid, reason = event
+            self._replace(pid, reason)
+            return
+        if kind == "metrics":
+            metrics.merge(event[2])
+            return
+        if kind == "ffmpeg":
+            _, pid, ffmpeg_pid, running = event
+            with self._lock:
+                if running and pid not in self._workers:
+                    return  # reported by a worker that has already been replaced
+                pids = self._ffmpeg_pids.setdefault(pid, set())
+                if running:
+                    pids.add(ffmpeg_pid)
+                else:
+                    pids.discard(ffmpeg_pid)
+            if running:
+                metrics.track_ffmpeg(ffmpeg_pid)
+            else:
+                metrics.untrack_ffmpeg(ffmpeg_pid)
+            return
+
+        job_id = event[1]
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and kind in ("done", "error", "cancelled"):
+                del self._jobs[job_id]
+        if job is None:
+            return
+
+        if kind == "start":
+            job.pid = event[2]
+        elif kind == "spans":
+            if job.recorder is not None:
+                job.recorder.merge(event[2], f"sonivo-render {job.pid}")
+        elif kind == "progress":
+            if job.progress_callback is not None:
+                try:
+                    job.progress_callback(event[2], event[3])
+                except Exception as e:
+                    print(f"Render pool progress callback failed: {e}")
+        elif kind == "done":
+            job.future.set_result(event[2])
+        elif kind == "error":
+            job.future.set_exception(RuntimeError(event[2]))
+        elif kind == "cancelled":
+            from app.services.video_generator import RenderCancelled
+            job.future.set_exception(RenderCancelled("render cancelled"))
+
+    def _check_workers(self):
+        """Replace workers that died (killed, out of memory) and fail the job they held."""
+        with self._lock:
+            if self._closed:
+                return
+            dead = [pid for pid, process in self._workers.items() if not process.is_alive()]
+        for pid in dead:
+            # Its last events may still be in the queue; handle them before judging the job
+            self._handle_pending_events()
+            with self._lock:
+                # The shared id covers a job taken off the task queue whose start event never arrived
+                current = self._current_jobs[pid].value if pid in self._current_jobs else 0
+                lost = [
+                    (job_id, job) for job_id, job in self._jobs.items()
+                    if job.pid == pid or job_id == current
+                ]
+                for job_id, _ in lost:
+                    del self._jobs[job_id]
+            exitcode = self._workers[pid].exitcode if pid in self._workers else None
+            for _, job in lost:
+                metrics.JOBS_TOTAL.inc(status="error")
+                job.future.set_exception(RenderWorkerLost(f"render process exited with code {exitcode}"))
+            if pid in self._workers:
+                self._replace(pid, "crash")
+
+    def _replace(self, pid: int, reason: str):
+        with self._lock:
+            process = self._workers.pop(pid, None)
+            if process is None:
+                return
+            self._cancel_flags.pop(pid, None)
+            self._current_jobs.pop(pid, None)
+            # A worker that died cannot untrack its FFmpeg any more
+            ffmpeg_pids = self._ffmpeg_pids.pop(pid, set())
+            self.recycled[reason] = self.recycled.get(reason, 0) + 1
+            metrics.POOL_RECYCLES.inc(reason=reason)
+            if not self._closed:
+                self._spawn()
+        for ffmpeg_pid in ffmpeg_pids:
+            metrics.untrack_ffmpeg(ffmpeg_pid)
+        process.join(timeout=10)
+
+
+_pool: Optional[RenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> RenderPool:
+    """The process-wide pool, started on first use (SONIVO_POOL_PROCESSES workers)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool()
+        return _pool
@@ -0,0 +1,364 @@
+"""
+Compact storage for the pre-rendered rotation cycle.
+
+Instead of a list of full RGBA PIL images, one rotation is kept as a single
+uint8 array that is already composited over the black background, so the
+frame loop only copies bytes. Two layouts are supported:
+
+- "disc": only the pixels inside the disc's bounding circle, packed row by row
+- "full": whole RGB frames, written to FFmpeg without any copy
+
+Optionally the array lives in `multiprocessing.shared_memory`, keyed by the
+cover and geometry, so concurrent jobs (threads or worker processes) rendering
+the same cover map one copy instead of building their own.
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from app.services import metrics
+from app.services.rotation_engine import RotationMaps, pack_rgba
+
+
+LAYOUTS = ("disc", "full")
+
+# Shared segments start with a small header: byte 0 is the state (_BUILDING, then
+# _READY or _ABANDONED), bytes 4-8 the pid of the process filling the frames
+_HEADER_BYTES = 64
+_BUILDING, _READY, _ABANDONED = 0, 1, 2
+_PID = struct.Struct("<I")
+_PID_OFFSET = 4
+_READY_TIMEOUT_SECONDS = 60
+# A segment whose owner pid is still unset after this long is treated as abandoned
+_PID_GRACE_SECONDS = 2.0
+
+# name -> [SharedMemory, refcount, owner]; a cycle keeps its entry, which is
+# dropped from the dict early when its segment turns out to be stale
+_shared: dict = {}
+_shared_lock = threading.Lock()
+
+
+class CycleBuildCancelled(Exception):
+    """Raised by build_rotation_cycle when its cancel_event is set."""
+
+
+class _StaleSegment(Exception):
+    """The process filling a shared segment died or gave up before completing it."""
+
+
+class RotationCycle:
+    """
+    One full rotation of pre-composited RGB frames.
+
+    Call render_into() with a persistent (height, width, 3) frame buffer: pixels
+    outside the disc are never written, so the buffer's black background is reused.
+    """
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        layout: str,
+        row_spans: Optional[list] = None,
+        shared_name: Optional[str] = None,
+        shared_entry: Optional[list] = None,
+    ):
+        self.frames = frames
+        self.layout = layout
+        self.row_spans = row_spans
+        self.shared_name = shared_name
+        self._entry = shared_entry
+        self._released = False
+
+    def __len__(self) -> int:
+        return self.frames.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes
+
+    @property
+    def shared(self) -> bool:
+        return self.shared_name is not None
+
+    def render_into(self, frame_buffer: np.ndarray, index: int) -> np.ndarray:
+        """
+        Composite rotation frame `index` into frame_buffer and return the bytes to write.
+        For the "full" layout the stored frame itself is returned (no copy).
+        """
+        frame = self.frames[index]
+        if self.layout == "full":
+            return frame
+
+        flat = frame_buffer.reshape(-1, 3)
+        for dst, src, length in self.row_spans:
+            flat[dst:dst + length] = frame[src:src + length]
+        return frame_buffer
+
+    def share(self) -> "RotationCycle":
+        """Another handle on the same frames, released independently (read-only use)."""
+        if self._entry is not None:
+            with _shared_lock:
+                self._entry[1] += 1
+        return RotationCycle(self.frames, self.layout, self.row_spans, self.shared_name, self._entry)
+
+    def release(self):
+        """Drop this job's reference; shared segments are unlinked by their owner at zero."""
+        if self._released:
+            return
+        self._released = True
+        if self._entry is not None:
+            self.frames = None
+            _release_shared(self.shared_name, self._entry)
+
+
+def build_rotation_cycle(
+    vinyl_base: Image.Image,
+    maps: RotationMaps,
+    frame_size: tuple,
+    offset: tuple = (0, 0),
+    layout: str = "disc",
+    share_key: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> RotationCycle:
+    """
+    Rotate, composite over black and store one rotation of the vinyl.
+
+    frame_size/offset describe where the vinyl canvas lands in the output frame.
+    With share_key, the frames are placed in (or attached from) shared memory.
+    Setting cancel_event aborts the build between frames (CycleBuildCancelled).
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown rotation cycle layout: {layout}")
+
+    row_spans = _row_spans(maps, frame_size, offset)
+    if layout == "disc":
+        shape = (maps.frame_count, maps.disc_index.size, 3)
+    else:
+        shape = (maps.frame_count, frame_size[1], frame_size[0], 3)
+
+    def fill(frames: np.ndarray):
+        pixels = pack_rgba(vinyl_base)
+        for i in range(maps.frame_count):
+            if cancel_event is not None and cancel_event.is_set():
+                raise CycleBuildCancelled()
+            rgb = _composite_over_black(maps.sample(pixels, i))
+            if layout == "disc":
+                frames[i] = rgb
+            else:
+                flat = frames[i].reshape(-1, 3)
+                for dst, src, length in row_spans:
+                    flat[dst:dst + length] = rgb[src:src + length]
+
+    if share_key is None:
+        frames = np.zeros(shape, dtype=np.uint8)
+        fill(frames)
+        return RotationCycle(frames, layout, row_spans)
+
+    name = _shared_name(share_key, layout, shape)
+    frames, entry = _acquire_shared(name, shape, fill)
+    return RotationCycle(frames, layout, row_spans, shared_name=name, shared_entry=entry)
+
+
+def cover_fingerprint(cover_path: Optional[str]) -> str:
+    """Content hash of a cover file, used to key shared rotation cycles."""
+    if not cover_path or not Path(cover_path).exists():
+        return "no-cover"
+    digest = hashlib.sha1()
+    with open(cover_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _composite_over_black(packed: np.ndarray) -> np.ndarray:
+    """Packed RGBA (N,) uint32 -> (N, 3) uint8 RGB premultiplied by alpha."""
+    rgba = packed.view(np.uint8).reshape(-1, 4)
+    rgb = rgba[:, :3].astype(np.uint16)
+    rgb *= rgba[:, 3:4]
+    rgb += 127
+    rgb //= 255
+    return rgb.astype(np.uint8)
+
+
+def _row_spans(maps: RotationMaps, frame_size: tuple, offset: tuple) -> list:
+    """
+    Contiguous runs of disc pixels, one per canvas row (the disc is convex).
+    Each row is (destination index in the flat frame, source index in the disc array, length).
+    """
+    width = frame_size[0]
+    rows = maps.disc_index // maps.size
+    cols = maps.disc_index % maps.size
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    lengths = np.diff(np.r_[starts, rows.size])
+    dst = (rows[starts] + offset[1]) * width + cols[starts] + offset[0]
+    return np.stack([dst, starts, lengths], axis=1).tolist()
+
+
+def _shared_name(share_key: str, layout: str, shape: tuple) -> str:
+    key = f"{share_key}:{layout}:{'x'.join(str(d) for d in shape)}"
+    return "sonivo_" + hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _acquire_shared(name: str, shape: tuple, fill) -> tuple:
+    """
+    Attach to the named segment, or create and fill it if this is the first job.
+    A segment left incomplete by a crashed or failed owner is unlinked and built again.
+    Returns (frames, entry).
+    """
+    while True:
+        try:
+            return _try_acquire_shared(name, shape, fill)
+        except _StaleSegment:
+            metrics.CACHE_MISSES.inc(cache="rotation_cycle_stale")
+
+
+def _try_acquire_shared(name: str, shape: tuple, fill) -> tuple:
+    nbytes = int(np.prod(shape))
+    with _shared_lock:
+        entry = _shared.get(name)
+        if entry is not None:
+            entry[1] += 1
+            shm, owner = entry[0], False
+        else:
+            try:
+                shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_BYTES + nbytes)
+                _PID.pack_into(shm.buf, _PID_OFFSET, os.getpid())
+                owner = True
+            except FileExistsError:
+                shm = _attach_untracked(name)
+                owner = False
+            entry = _shared[name] = [shm, 1, owner]
+
+    if owner:
+        metrics.CACHE_MISSES.inc(cache="rotation_cycle")
+    else:
+        metrics.CACHE_HITS.inc(cache="rotation_cycle")
+
+    try:
+        if owner:
+            try:
+                fill(_frames_view(shm, shape))
+            except BaseException:
+                # Jobs waiting on this segment rebuild instead of timing out
+                shm.buf[0] = _ABANDONED
+                raise
+            shm.buf[0] = _READY
+        else:
+            _wait_ready(shm)
+    except _StaleSegment:
+        with _shared_lock:
+            # New jobs must not attach to the stale segment any more, and the name is
+            # unlinked here (once per process) rather than by whoever drops the last reference
+            stale_here = _shared.get(name) is entry
+            if stale_here:
+                del _shared[name]
+            created = entry[2]
+            entry[2] = False
+        _release_shared(name, entry)
+        if stale_here:
+            if created:
+                # Registered with this process's resource tracker; unlink() unregisters it
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+            else:
+                _unlink_untracked(name)
+        raise
+    except BaseException:
+        _release_shared(name, entry)
+        raise
+
+    return _frames_view(shm, shape), entry
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing segment without registering it with the resource tracker.
+    Only the creating process unlinks; before Python 3.13 attaching also registered
+    the segment, so it was unlinked (or double-unregistered) when the attacher exited.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _unlink_untracked(name: str):
+    """
+    Remove a segment another process created. SharedMemory.unlink() would also
+    unregister it from this process's resource tracker, which never registered it.
+    """
+    try:
+        from _posixshmem import shm_unlink
+    except ImportError:  # not POSIX shared memory
+        return
+    try:
+        shm_unlink("/" + name)
+    except FileNotFoundError:
+        pass
+
+
+def _frames_view(shm: shared_memory.SharedMemory, shape: tuple) -> np.ndarray:
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=_HEADER_BYTES)
+
+
+def _wait_ready(shm: shared_memory.SharedMemory):
+    """Wait for the owner to complete the frames; _StaleSegment if it died or gave up."""
+    started = time.monotonic()
+    while shm.buf[0] != _READY:
+        waited = time.monotonic() - started
+        if shm.buf[0] == _ABANDONED or not _owner_alive(shm, waited):
+            raise _StaleSegment(shm.name)
+        if waited > _READY_TIMEOUT_SECONDS:
+            raise TimeoutError(f"Shared rotation cycle {shm.name} was never completed")
+        time.sleep(0.05)
+
+
+def _owner_alive(shm: shared_memory.SharedMemory, waited: float) -> bool:
+    pid = _PID.unpack_from(shm.buf, _PID_OFFSET)[0]
+    if not pid:
+        # Written right after creation; still unset long after means the creator died
+        return waited < _PID_GRACE_SECONDS
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _release_shared(name: str, entry: list):
+    with _shared_lock:
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        if _shared.get(name) is entry:
+            del _shared[name]
+
+    shm, _, owner = entry
+    try:
+        shm.close()
+    except BufferError:
+        pass  # a numpy view is still alive; the mapping goes away with it
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,219 @@
+"""
+Rotation engine: precomputed sampling maps for the spinning vinyl.
+
+The inverse-rotation geometry of one rotation cycle only depends on the canvas
+size, FPS and RPM, never on the cover. The per-angle sampling maps are computed
+once, saved as .npy files under the cache directory and memory-mapped, so every
+job (and every worker process) shares the same pages. Applying a map to a cover
+is a vectorized bilinear gather that only touches pixels inside the disc; the
+corners are always transparent.
+
+Source coordinates are stored as one packed uint32 per pixel and angle
+(16-bit x and y, 5 fractional bits each), i.e. ~200 MB for a 1080 px canvas.
+Maps are opened per job and unmapped once the cycle is built, so the pages
+live in the shared page cache instead of each job's resident set.
+"""
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from app.services import metrics
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+CACHE_DIR = Path(os.environ.get("SONIVO_CACHE_DIR", BASE_DIR / "cache")) / "rotation"
+
+# Fixed-point precision of the stored coordinates (5 bits -> 1/32 px) and of
+# the bilinear weights they expand to (8 bits)
+_COORD_FRAC_BITS = 5
+_COORD_MAX_SIZE = 1 << (16 - _COORD_FRAC_BITS)
+_FRAC_BITS = 8
+_FRAC_ONE = 1 << _FRAC_BITS
+
+# Packed RGBA is interpolated as two 16-bit lanes: (R, B) and (G, A)
+_LANES = np.uint32(0x00FF00FF)
+_HIGH_LANES = np.uint32(0xFF00FF00)
+
+# Keys whose maps are known to be on disk, so later jobs skip the existence check
+_maps_ready: set = set()
+_maps_lock = threading.Lock()
+
+
+def cycle_geometry(fps: int, rpm: float) -> tuple:
+    """
+    Return (frames_per_rotation, degrees_per_frame) for one full 360° turn.
+    At 33⅓ RPM / 30fps, one rotation = 55 frames (54 plus the wrap-around).
+    """
+    degrees_per_second = rpm * 6  # RPM * 360/60
+    degrees_per_frame = degrees_per_second / fps
+    frames_per_rotation = int(math.ceil(360.0 / degrees_per_frame))
+    return frames_per_rotation, degrees_per_frame
+
+
+class RotationMaps:
+    """
+    Per-angle bilinear sampling maps for a square canvas.
+
+    - disc_index: (N,) flat indices of the target pixels inside the disc
+    - coords:     (frames, N) packed fixed-point source position (y << 16 | x)
+    """
+
+    def __init__(
+        self,
+        size: int,
+        degrees_per_frame: float,
+        disc_index: np.ndarray,
+        coords: np.ndarray,
+    ):
+        self.size = size
+        self.degrees_per_frame = degrees_per_frame
+        self.disc_index = disc_index
+        self.coords = coords
+
+    @property
+    def frame_count(self) -> int:
+        return self.coords.shape[0]
+
+    def angle(self, frame: int) -> float:
+        """Rotation angle (PIL convention, degrees counter-clockwise) of a frame."""
+        return -(frame * self.degrees_per_frame) % 360
+
+    def sample(self, pixels: np.ndarray, frame: int) -> np.ndarray:
+        """
+        Rotate packed RGBA pixels (see pack_rgba) for one frame.
+        Returns only the disc pixels, as packed (N,) uint32.
+        """
+        coords = np.asarray(self.coords[frame])
+        x = coords & np.uint32(0xFFFF)
+        y = coords >> np.uint32(16)
+        frac_mask = np.uint32((1 << _COORD_FRAC_BITS) - 1)
+        weight_shift = np.uint32(_FRAC_BITS - _COORD_FRAC_BITS)
+        fx = (x & frac_mask) << weight_shift
+        fy = (y & frac_mask) << weight_shift
+        base = (y >> np.uint32(_COORD_FRAC_BITS)) * np.uint32(self.size)
+        base += x >> np.uint32(_COORD_FRAC_BITS)
+
+        width = self.size
+        top = _lerp(pixels[base], pixels[base + 1], fx)
+        bottom = _lerp(pixels[base + width], pixels[base + width + 1], fx)
+        return _lerp(top, bottom, fy)
+
+
+def pack_rgba(image: Image.Image) -> np.ndarray:
+    """Flatten an image to one uint32 per RGBA pixel, so a gather moves whole pixels."""
+    rgba = np.ascontiguousarray(np.asarray(image.convert("RGBA")))
+    return rgba.view(np.uint32).reshape(-1)
+
+
+def _lerp(a: np.ndarray, b: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """
+    Interpolate packed RGBA pixels: a + (b - a) * weight / 256, all four channels at once.
+    Channels are split into two 16-bit lanes per uint32 so one multiply handles two.
+    """
+    inv = _FRAC_ONE - weight
+    low = (a & _LANES) * inv + (b & _LANES) * weight
+    high = ((a >> 8) & _LANES) * inv + ((b >> 8) & _LANES) * weight
+    return ((low >> 8) & _LANES) | (high & _HIGH_LANES)
+
+
+def get_rotation_maps(size: int, fps: int, rpm: float) -> RotationMaps:
+    """
+    Get the sampling maps for (size, fps, rpm), memory-mapped from the disk cache.
+    Computed and saved on first use. Drop the returned object to unmap the pages.
+    """
+    if size > _COORD_MAX_SIZE:
+        raise ValueError(f"Rotation maps support canvases up to {_COORD_MAX_SIZE}px, got {size}px")
+
+    frames, degrees_per_frame = cycle_geometry(fps, rpm)
+    paths = _cache_paths(size, fps, rpm)
+    key = (size, fps, round(rpm, 3))
+
+    arrays = _load_cached(paths) if key in _maps_ready else None
+    if arrays is None:
+        with _maps_lock:
+            arrays = _load_cached(paths)
+            if arrays is None or arrays["coords"].shape[0] != frames:
+                metrics.CACHE_MISSES.inc(cache="rotation_maps")
+                arrays = _build_maps(size, frames, degrees_per_frame)
+                _save_cached(paths, arrays)
+                # Re-open memory-mapped so the pages are shared with other processes
+                arrays = _load_cached(paths) or arrays
+            else:
+                metrics.CACHE_HITS.inc(cache="rotation_maps")
+            _maps_ready.add(key)
+    else:
+        metrics.CACHE_HITS.inc(cache="rotation_maps")
+
+    return RotationMaps(
+        size=size,
+        degrees_per_frame=degrees_per_frame,
+        disc_index=arrays["index"],
+        coords=arrays["coords"],
+    )
+
+
+def _cache_paths(size: int, fps: int, rpm: float) -> dict:
+    stem = f"rot_{size}px_{fps}fps_{rpm:.3f}rpm"
+    return {
+        name: CACHE_DIR / f"{stem}.{name}.npy"
+        for name in ("index", "coords")
+    }
+
+
+def _load_cached(paths: dict) -> Optional[dict]:
+    try:
+        return {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached(paths: dict, arrays: dict):
+    """Write each array atomically (tmp file + rename) so readers never see partial maps."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for name, path in paths.items():
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, arrays[name])
+            os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write rotation cache: {e}")
+
+
+def _build_maps(size: int, frames: int, degrees_per_frame: float) -> dict:
+    """
+    Compute the inverse-rotation source coordinates for every disc pixel and angle.
+    Mirrors PIL's Image.rotate() geometry: pixel centers, rotation about (size/2, size/2).
+    """
+    center = size / 2
+    disc_radius = size / 2 - 2  # vinyl radius is size//2 - 4; keep the antialiased edge
+    scale = 1 << _COORD_FRAC_BITS
+
+    ys, xs = np.mgrid[0:size, 0:size]
+    dx = xs.ravel() + 0.5 - center
+    dy = ys.ravel() + 0.5 - center
+    inside = dx * dx + dy * dy <= disc_radius * disc_radius
+    disc_index = np.flatnonzero(inside).astype(np.int32)
+    dx = dx[inside]
+    dy = dy[inside]
+
+    coords = np.empty((frames, disc_index.size), dtype=np.uint32)
+    # Keep the +1 neighbour of the bilinear footprint inside the canvas
+    limit = (size - 1) * scale - 1
+
+    for i in range(frames):
+        theta = -math.radians(-(i * degrees_per_frame) % 360)
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        # Source position in pixel-center space (bilinear between centers)
+        src_x = (cos_t * dx + sin_t * dy + center - 0.5) * scale
+        src_y = (-sin_t * dx + cos_t * dy + center - 0.5) * scale
+        fixed_x = np.clip(np.rint(src_x), 0, limit).astype(np.uint32)
+        fixed_y = np.clip(np.rint(src_y), 0, limit).astype(np.uint32)
+        coords[i] = (fixed_y << np.uint32(16)) | fixed_x
+
+    return {"index": disc_index, "coords": coords}
@@ -0,0 +1,200 @@
+"""
+Priority classes for render work.
+
+Every piece of render-related work belongs to a class, highest first:
+
+    INTERACTIVE  single videos someone is waiting for
+    PREVIEW      browser preview proxies transcoded after upload
+    BATCH        tracks of a batch request
+    PRECOMPUTE   speculative waveform/rotation-cycle work after upload
+
+Renders (INTERACTIVE, BATCH) take one of a fixed number of slots
+(Scheduler.slot). A free slot goes to the waiting job of the highest class,
+oldest first; one slot is kept for INTERACTIVE so a batch can never occupy
+them all. To prevent starvation a waiting job rises one class for every
+SONIVO_PRIORITY_AGING seconds it has waited, so a batch track waiting long
+enough is eventually served ahead of newer interactive jobs.
+
+Lower classes are also throttled while they run: their FFmpeg gets a higher
+nice value (NICE), which costs nothing when cores are idle and yields them to
+interactive work under contention, and batch encodes started while an
+interactive job is active use SONIVO_BULK_FFMPEG_THREADS encoder threads.
+A nice value cannot be lowered again without privileges, so a job keeps the
+throttling it started with.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from app.services import eta, metrics
+
+
+INTERACTIVE, PREVIEW, BATCH, PRECOMPUTE = range(4)
+CLASS_NAMES = ("interactive", "preview", "batch", "precompute")
+
+# Nice value for each class's FFmpeg (and the background threads that start it)
+NICE = {INTERACTIVE: 0, PREVIEW: 5, BATCH: 5, PRECOMPUTE: 10}
+
+# Waiting this long raises a job by one class
+AGING_SECONDS = float(os.environ.get("SONIVO_PRIORITY_AGING", "60"))
+# Slots only INTERACTIVE jobs may take (when there is more than one slot)
+INTERACTIVE_RESERVE = int(os.environ.get("SONIVO_INTERACTIVE_RESERVE", "1"))
+# libx264 threads for batch encodes started while interactive work is active
+BULK_FFMPEG_THREADS = int(os.environ.get("SONIVO_BULK_FFMPEG_THREADS", "2"))
+
+# Re-evaluate aging at least this often while waiting
+_WAIT_POLL_SECONDS = 1.0
+
+
+def effective_priority(priority: int, waited_seconds: float) -> float:
+    """Class adjusted for time spent waiting (lower is served first)."""
+    if AGING_SECONDS <= 0:
+        return priority
+    return priority - waited_seconds / AGING_SECONDS
+
+
+def render_options(priority: int, interactive_active: bool) -> dict:
+    """generate_video throttling arguments (nice, ffmpeg_threads) for a job of this class."""
+    throttle = priority > INTERACTIVE and interactive_active
+    return {
+        "nice": NICE[priority],
+        "ffmpeg_threads": BULK_FFMPEG_THREADS if throttle and BULK_FFMPEG_THREADS > 0 else None,
+    }
+
+
+def lower_thread_priority(priority: int):
+    """Give the calling thread (and processes it starts) its class's nice value (Linux: per thread)."""
+    if not NICE[priority]:
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE[priority])
+    except (AttributeError, OSError):
+        pass
+
+
+class _Ticket:
+    __slots__ = ("priority", "enqueued_at", "seq", "estimate", "key", "started_at")
+
+    def __init__(self, priority: int, seq: int, estimate: float = 0.0, key=None):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.seq = seq
+        self.estimate = estimate
+        self.key = key
+        self.started_at = None
+
+
+class Scheduler:
+    """
+    Usage:
+        renders = Scheduler(slots=2)
+        with renders.slot(BATCH, cancel_event):
+            generate_video(..., **render_options(BATCH, renders.interactive_active()))
+    """
+
+    def __init__(self, slots: int, interactive_reserve: int = INTERACTIVE_RESERVE):
+        self.slots = max(1, slots)
+        # Never reserve every slot
+        self.interactive_reserve = min(max(0, interactive_reserve), self.slots - 1)
+        self._cond = threading.Condition()
+        self._waiting: list = []
+        self._active: list = []
+        self._running = [0] * len(CLASS_NAMES)
+        self._seq = 0
+
+    @contextmanager
+    def slot(self, priority: int, cancel_event=None, estimate: float = 0.0, key=None):
+        """
+        Hold a render slot for the duration of the block, waiting for one first.
+        Raises RenderCancelled if cancel_event is set while waiting.
+        estimate (expected render seconds) and key (e.g. a job id) feed expected_wait().
+        """
+        with self._cond:
+            self._seq += 1
+            ticket = _Ticket(priority, self._seq, estimate, key)
+            self._waiting.append(ticket)
+            try:
+                while not self._may_start(ticket):
+                    if cancel_event is not None and cancel_event.is_set():
+                        from app.services.video_generator import RenderCancelled
+                        raise RenderCancelled("render cancelled")
+                    self._cond.wait(_WAIT_POLL_SECONDS)
+            finally:
+                self._waiting.remove(ticket)
+                # Whoever is next in line may now be able to start too
+                self._cond.notify_all()
+            self._running[priority] += 1
+            ticket.started_at = time.monotonic()
+            self._active.append(ticket)
+        metrics.SCHEDULER_WAIT.observe(time.monotonic() - ticket.enqueued_at, priority=CLASS_NAMES[priority])
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._active.remove(ticket)
+                self._cond.notify_all()
+
+    def waiting(self) -> int:
+        """Jobs waiting for a slot."""
+        with self._cond:
+            return len(self._waiting)
+
+    def expected_wait(self, priority: int = INTERACTIVE, key=None) -> Optional[float]:
+        """
+        Estimated seconds until the waiting job with key (or a job of this class
+        submitted now) gets a slot: the remaining work of running jobs plus the
+        estimates of jobs ranked ahead of it, spread over all slots (the
+        interactive reserve is ignored). 0 for a running job, None for an unknown key.
+        """
+        with self._cond:
+            now = time.monotonic()
+            if key is not None:
+                if any(t.key == key for t in self._active):
+                    return 0.0
+                ticket = next((t for t in self._waiting if t.key == key), None)
+                if ticket is None:
+                    return None
+                rank = (effective_priority(ticket.priority, now - ticket.enqueued_at), ticket.seq)
+            else:
+                rank = (priority, self._seq + 1)
+            work = [max(0.0, t.estimate - (now - t.started_at)) for t in self._active]
+            work += [
+                t.estimate for t in sorted(self._waiting, key=lambda t: t.seq)
+                if (effective_priority(t.priority, now - t.enqueued_at), t.seq) < rank
+            ]
+        return eta.expected_wait(work, self.slots)
+
+    def interactive_active(self) -> bool:
+        """Whether an interactive job is running or waiting."""
+        with self._cond:
+            return bool(self._running[INTERACTIVE]) or any(t.priority == INTERACTIVE for t in self._waiting)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "interactive_reserve": self.interactive_reserve,
+                "running": {CLASS_NAMES[c]: n for c, n in enumerate(self._running) if n},
+                "waiting": {
+                    name: sum(1 for t in self._waiting if t.priority == c)
+                    for c, name in enumerate(CLASS_NAMES)
+                    if any(t.priority == c for t in self._waiting)
+                },
+            }
+
+    def _may_start(self, ticket: _Ticket) -> bool:
+        """Caller holds _cond. True if ticket is first in line and there is a slot it may take."""
+        free = self.slots - sum(self._running)
+        if free <= 0:
+            return False
+        now = time.monotonic()
+
+        def rank(t: _Ticket):
+            return (effective_priority(t.priority, now - t.enqueued_at), t.seq)
+
+        # Reserved slots go to interactive jobs only (aging does not unlock them)
+        eligible = [t for t in self._waiting if t.priority == INTERACTIVE or free > self.interactive_reserve]
+        return bool(eligible) and min(eligible, key=rank) is ticket
@@ -0,0 +1,347 @@
+"""
+Storage quotas for uploads/ and outputs/ with LRU and age-based eviction.
+
+Files are evicted in units: an upload together with everything derived from it
+(cover, thumbnail, preview proxy share its file_id prefix), or one output
+video. A unit is never evicted while a job holds a lease on it, while it is
+pinned (outputs only), or within MIN_AGE_SECONDS of its last use. Otherwise a
+pass first removes units idle for longer than the directory's maximum age,
+then least recently used units until the directory is under its quota and the
+disk has SONIVO_MIN_FREE_MB free.
+
+A pass runs every SONIVO_STORAGE_INTERVAL seconds on a background thread, and
+on demand (ensure_free_space) before uploads and renders when free space is low.
+
+Configuration (MB / hours, 0 disables that limit):
+    SONIVO_UPLOADS_QUOTA_MB   (default 2048)   SONIVO_UPLOADS_MAX_AGE_HOURS (default 24)
+    SONIVO_OUTPUTS_QUOTA_MB   (default 5120)   SONIVO_OUTPUTS_MAX_AGE_HOURS (default 168)
+    SONIVO_MIN_FREE_MB        (default 1024)
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.services import metrics
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+UPLOAD_DIR = BASE_DIR / "uploads"
+OUTPUT_DIR = BASE_DIR / "outputs"
+PINS_PATH = OUTPUT_DIR / ".pinned.json"
+
+_MB = 1024 * 1024
+_HOUR = 3600
+
+MIN_FREE_BYTES = int(float(os.environ.get("SONIVO_MIN_FREE_MB", "1024")) * _MB)
+INTERVAL_SECONDS = float(os.environ.get("SONIVO_STORAGE_INTERVAL", "300"))
+# Recently used units are kept regardless of quota (an upload being edited, a fresh download)
+MIN_AGE_SECONDS = 600
+
+
+class StorageArea:
+    """One managed directory. group() maps a file name to its eviction unit."""
+
+    def __init__(self, name: str, directory: Path, quota_bytes: int, max_age_seconds: float, group):
+        self.name = name
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.max_age_seconds = max_age_seconds
+        self.group = group
+        self.evictions: dict = {}
+        self.evicted_bytes = 0
+
+    def units(self) -> dict:
+        """unit key -> {"paths", "bytes", "mtime"} for the files currently in the directory."""
+        units: dict = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return units
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            unit = units.setdefault(self.group(entry.name), {"paths": [], "bytes": 0, "mtime": 0.0})
+            unit["paths"].append(Path(entry.path))
+            unit["bytes"] += st.st_size
+            unit["mtime"] = max(unit["mtime"], st.st_mtime)
+        return units
+
+
+def _upload_unit(name: str) -> str:
+    # "{file_id}.mp3", "{file_id}_cover.jpg", "{file_id}_preview.m4a" -> file_id
+    return name.split("_", 1)[0].split(".", 1)[0]
+
+
+def _output_unit(name: str) -> str:
+    return name
+
+
+def _env_mb(name: str, default: str) -> int:
+    return int(float(os.environ.get(name, default)) * _MB)
+
+
+def _env_hours(name: str, default: str) -> float:
+    return float(os.environ.get(name, default)) * _HOUR
+
+
+AREAS = {
+    "uploads": StorageArea(
+        "uploads", UPLOAD_DIR,
+        _env_mb("SONIVO_UPLOADS_QUOTA_MB", "2048"),
+        _env_hours("SONIVO_UPLOADS_MAX_AGE_HOURS", "24"),
+        _upload_unit,
+    ),
+    "outputs": StorageArea(
+        "outputs", OUTPUT_DIR,
+        _env_mb("SONIVO_OUTPUTS_QUOTA_MB", "5120"),
+        _env_hours("SONIVO_OUTPUTS_MAX_AGE_HOURS", "168"),
+        _output_unit,
+    ),
+}
+
+_lock = threading.Lock()
+_run_lock = threading.Lock()
+_last_used: dict = {}   # (area, unit) -> time.time()
+_leases: dict = {}      # (area, unit) -> count
+_pinned: Optional[set] = None
+_last_run: Optional[dict] = None
+_thread: Optional[threading.Thread] = None
+# Callables returning (area, file name) pairs to protect, for jobs held outside this process
+_lease_sources: list = []
+# Callables notified with (area, unit) after a unit is evicted
+_evict_listeners: list = []
+
+
+class Lease:
+    """
+    Keeps units from being evicted while a job uses them.
+
+    Usage:
+        lease = storage.Lease(uploads=[file_id], outputs=[output_filename])
+        ...                      # hand over to the job thread
+        lease.release()          # or: with storage.Lease(...):
+    """
+
+    def __init__(self, uploads: tuple = (), outputs: tuple = ()):
+        self._keys = [("uploads", _upload_unit(k)) for k in uploads] + [("outputs", k) for k in outputs]
+        with _lock:
+            for key in self._keys:
+                _leases[key] = _leases.get(key, 0) + 1
+                _last_used[key] = time.time()
+        self._released = False
+
+    def release(self):
+        with _lock:
+            if self._released:
+                return
+            self._released = True
+            now = time.time()
+            for key in self._keys:
+                _last_used[key] = now
+                if _leases.get(key, 0) <= 1:
+                    _leases.pop(key, None)
+                else:
+                    _leases[key] -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def add_lease_source(source):
+    """Register a callable returning (area, file name) pairs that must not be evicted."""
+    _lease_sources.append(source)
+
+
+def add_evict_listener(listener):
+    """Register a callable called with (area, unit) after a unit is evicted (unit = file_id for uploads)."""
+    _evict_listeners.append(listener)
+
+
+def touch(area: str, name: str):
+    """Record a use of a file (served, read for a render) for LRU ordering."""
+    with _lock:
+        _last_used[(area, AREAS[area].group(name))] = time.time()
+
+
+def pin(filename: str) -> bool:
+    """Exempt an output from eviction. Returns False if it does not exist."""
+    if not (OUTPUT_DIR / filename).is_file():
+        return False
+    with _lock:
+        pins = _load_pins()
+        pins.add(filename)
+        _save_pins(pins)
+    return True
+
+
+def unpin(filename: str):
+    with _lock:
+        pins = _load_pins()
+        pins.discard(filename)
+        _save_pins(pins)
+
+
+def enforce(reason: str = "periodic") -> dict:
+    """Run one eviction pass over all areas. Returns the pass summary."""
+    global _last_run
+    with _run_lock:
+        start = time.time()
+        evicted = {}
+        for area in AREAS.values():
+            evicted[area.name] = _enforce_area(area)
+        _last_run = {
+            "reason": reason,
+            "at": start,
+            "seconds": round(time.time() - start, 3),
+            "evicted": evicted,
+        }
+        return _last_run
+
+
+def ensure_free_space():
+    """Run a pass now if the disk holding the managed directories is low on space."""
+    if MIN_FREE_BYTES and _free_bytes() < MIN_FREE_BYTES:
+        enforce(reason="low_disk")
+
+
+def usage() -> dict:
+    """Current usage per area, eviction counts and disk space."""
+    with _lock:
+        pins = sorted(_load_pins())
+        leased = len(_leases)
+    areas = {}
+    for area in AREAS.values():
+        units = area.units()
+        total = sum(u["bytes"] for u in units.values())
+        metrics.STORAGE_BYTES.set(total, area=area.name)
+        areas[area.name] = {
+            "bytes": total,
+            "files": sum(len(u["paths"]) for u in units.values()),
+            "units": len(units),
+            "quota_bytes": area.quota_bytes or None,
+            "max_age_hours": area.max_age_seconds / _HOUR if area.max_age_seconds else None,
+            "evictions": dict(area.evictions),
+            "evicted_bytes": area.evicted_bytes,
+        }
+    disk = shutil.disk_usage(OUTPUT_DIR if OUTPUT_DIR.exists() else BASE_DIR)
+    return {
+        "areas": areas,
+        "disk": {"total_bytes": disk.total, "free_bytes": disk.free, "min_free_bytes": MIN_FREE_BYTES},
+        "pinned": pins,
+        "leased_units": leased,
+        "last_run": _last_run,
+    }
+
+
+def start(interval: float = INTERVAL_SECONDS):
+    """Start the periodic eviction thread (idempotent)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+
+    def run():
+        while True:
+            try:
+                enforce()
+            except Exception as e:
+                print(f"Storage pass failed: {e}")
+            time.sleep(interval)
+
+    _thread = threading.Thread(target=run, name="sonivo-storage", daemon=True)
+    _thread.start()
+
+
+def _enforce_area(area: StorageArea) -> dict:
+    units = area.units()
+    now = time.time()
+    external = set()
+    for source in _lease_sources:
+        external.update(area.group(name) for a, name in source() if a == area.name)
+    with _lock:
+        pins = _load_pins() if area.name == "outputs" else set()
+        protected = {k for (a, k) in _leases if a == area.name} | pins | external
+        last_used = {k: max(u["mtime"], _last_used.get((area.name, k), 0.0)) for k, u in units.items()}
+
+    candidates = [
+        k for k in units
+        if k not in protected and now - last_used[k] >= MIN_AGE_SECONDS
+    ]
+    candidates.sort(key=lambda k: last_used[k])  # least recently used first
+
+    total = sum(u["bytes"] for u in units.values())
+    evicted = {}
+
+    def evict(key, why):
+        nonlocal total
+        freed = 0
+        for path in units[key]["paths"]:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                freed += size
+            except FileNotFoundError:
+                pass
+        total -= units[key]["bytes"]
+        area.evictions[why] = area.evictions.get(why, 0) + 1
+        area.evicted_bytes += freed
+        metrics.STORAGE_EVICTIONS.inc(area=area.name, reason=why)
+        metrics.STORAGE_EVICTED_BYTES.inc(freed, area=area.name)
+        evicted[why] = evicted.get(why, 0) + 1
+        with _lock:
+            _last_used.pop((area.name, key), None)
+        for listener in _evict_listeners:
+            listener(area.name, key)
+
+    remaining = []
+    for key in candidates:
+        if area.max_age_seconds and now - last_used[key] > area.max_age_seconds:
+            evict(key, "age")
+        else:
+            remaining.append(key)
+
+    for key in remaining:
+        over_quota = area.quota_bytes and total > area.quota_bytes
+        low_disk = MIN_FREE_BYTES and _free_bytes() < MIN_FREE_BYTES
+        if not over_quota and not low_disk:
+            break
+        evict(key, "quota" if over_quota else "low_disk")
+
+    metrics.STORAGE_BYTES.set(total, area=area.name)
+    return evicted
+
+
+def _free_bytes() -> int:
+    try:
+        return shutil.disk_usage(OUTPUT_DIR).free
+    except OSError:
+        return shutil.disk_usage(BASE_DIR).free
+
+
+def _load_pins() -> set:
+    """Pinned output names, read once from outputs/.pinned.json. Caller holds _lock."""
+    global _pinned
+    if _pinned is None:
+        try:
+            with open(PINS_PATH) as f:
+                _pinned = set(json.load(f))
+        except (OSError, ValueError):
+            _pinned = set()
+    return _pinned
+
+
+def _save_pins(pins: set):
+    tmp_path = PINS_PATH.with_name(PINS_PATH.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(sorted(pins), f)
+    os.replace(tmp_path, PINS_PATH)
@@ -0,0 +1,230 @@
+"""
+Lightweight per-stage timing spans for the render pipeline.
+
+Code under measurement wraps stages in `span("name")`. Spans are recorded into
+the SpanRecorder active in the current context (BenchmarkSession activates its
+own), and are a no-op costing one ContextVar lookup when nothing is recording.
+
+A recorder created with trace=True also keeps a timeline (spans, instant
+markers and counters per thread) exportable as Chrome/Perfetto trace JSON.
+What a render process recorded is export()ed and merge()d into the submitter's
+recorder; perf_counter is CLOCK_MONOTONIC on Linux, so the timelines line up.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("sonivo_span_recorder", default=None)
+
+
+class SpanRecorder:
+    """
+    Accumulates stage durations (seconds, call count) and named values.
+
+    Usage:
+        recorder = SpanRecorder()
+        with recording(recorder):
+            with span("create_vinyl_image"):
+                ...
+        recorder.summary()
+    """
+
+    def __init__(self, trace: bool = False):
+        self._stages: dict = {}
+        self._values: dict = {}
+        self._observers: list = []
+        self._lock = threading.Lock()
+
+        # Timeline for to_chrome_trace()
+        self.trace = trace
+        self._events: list = []
+        self._threads: dict = {}
+        self._epoch = time.perf_counter()
+        # Merged from other processes: pid -> name, (pid, tid) -> thread name
+        self._processes: dict = {}
+        self._other_threads: dict = {}
+
+    def observe(self, callback):
+        """Call callback("start" | "end", name) at every span boundary (e.g. memory profiling)."""
+        self._observers.append(callback)
+
+    @contextmanager
+    def span(self, name: str):
+        for callback in self._observers:
+            callback("start", name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add(name, end - start)
+            if self.trace:
+                self._event({"ph": "X", "name": name, "ts": self._us(start), "dur": round((end - start) * 1e6, 1)})
+            for callback in self._observers:
+                callback("end", name)
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        """Add a measured duration to a stage (e.g. time accumulated by another thread)."""
+        with self._lock:
+            stage = self._stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += count
+
+    def set_value(self, name: str, value):
+        """Record a named scalar, e.g. frame-loop fps."""
+        with self._lock:
+            self._values[name] = value
+
+    def summary(self) -> dict:
+        """{stage: {"seconds": total, "count": n}} in first-seen order."""
+        with self._lock:
+            return {
+                name: {"seconds": round(seconds, 4), "count": count}
+                for name, (seconds, count) in self._stages.items()
+            }
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def export(self) -> dict:
+        """Everything recorded, picklable, for merge() in another process."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "epoch": self._epoch,
+                "stages": {name: list(stage) for name, stage in self._stages.items()},
+                "values": dict(self._values),
+                "events": list(self._events),
+                "threads": dict(self._threads),
+            }
+
+    def merge(self, exported: dict, process_name: str):
+        """Add what another process recorded (export()); its timeline keeps its own pid."""
+        for name, (seconds, count) in exported["stages"].items():
+            self.add(name, seconds, count)
+        with self._lock:
+            self._values.update(exported["values"])
+            if not self.trace:
+                return
+            pid = exported["pid"]
+            shift = (exported["epoch"] - self._epoch) * 1e6
+            self._processes[pid] = process_name
+            for tid, name in exported["threads"].items():
+                self._other_threads[(pid, tid)] = name
+            self._events.extend(dict(e, pid=pid, ts=round(e["ts"] + shift, 1)) for e in exported["events"])
+
+    def mark(self, name: str, **args):
+        """Instant marker on the timeline (trace=True only)."""
+        if self.trace:
+            self._event({"ph": "i", "s": "t", "name": name, "ts": self._us(time.perf_counter()), "args": args})
+
+    def counter(self, name: str, **values):
+        """Counter sample on the timeline, drawn as a graph in the trace viewer (trace=True only)."""
+        if self.trace:
+            self._event({"ph": "C", "name": name, "ts": self._us(time.perf_counter()), "args": values})
+
+    def to_chrome_trace(self, process_name: str = "sonivo") -> dict:
+        """Timeline in the Chrome trace-event format (chrome://tracing, ui.perfetto.dev)."""
+        pid = os.getpid()
+        with self._lock:
+            events = [e if "pid" in e else dict(e, pid=pid) for e in self._events]
+            processes = {pid: process_name, **self._processes}
+            threads = {**{(pid, tid): name for tid, name in self._threads.items()}, **self._other_threads}
+        meta = [
+            {"ph": "M", "name": "process_name", "pid": p, "tid": 0, "args": {"name": name}}
+            for p, name in processes.items()
+        ]
+        meta += [
+            {"ph": "M", "name": "thread_name", "pid": p, "tid": tid, "args": {"name": name}}
+            for (p, tid), name in threads.items()
+        ]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def _us(self, t: float) -> float:
+        return round((t - self._epoch) * 1e6, 1)
+
+    def _event(self, event: dict):
+        thread = threading.current_thread()
+        event["tid"] = thread.ident
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            self._events.append(event)
+
+
+def current_recorder() -> Optional[SpanRecorder]:
+    return _current.get()
+
+
+def activate(recorder: Optional[SpanRecorder]) -> contextvars.Token:
+    """Make `recorder` the target of span() calls; pass the token to deactivate()."""
+    return _current.set(recorder)
+
+
+def deactivate(token: contextvars.Token):
+    _current.reset(token)
+
+
+@contextmanager
+def recording(recorder: Optional[SpanRecorder]):
+    """Make `recorder` the target of span() calls in this context."""
+    token = activate(recorder)
+    try:
+        yield recorder
+    finally:
+        deactivate(token)
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage into the active recorder, if any."""
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.span(name):
+        yield
+
+
+def record(name: str, seconds: float, count: int = 1):
+    """Add an externally measured duration to the active recorder, if any."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(name, seconds, count)
+
+
+def record_value(name: str, value):
+    """Record a named scalar into the active recorder, if any."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.set_value(name, value)
+
+
+def mark(name: str, **args):
+    """Add an instant marker to the active recorder's timeline, if tracing."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.mark(name, **args)
+
+
+def counter(name: str, **values):
+    """Add a counter sample to the active recorder's timeline, if tracing."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.counter(name, **values)
+
+
+def timed(name: str):
+    """Decorator form of span() for whole functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -4,20 +4,32 @@ Uses Pillow for frame rendering and FFmpeg for video encoding.
 
 Optimized: pre-renders one rotation cycle of vinyl frames, reuses them.
 """
-import math
+import errno
 import os
 import subprocess
 import tempfile
+import threading
+import time
 import shutil
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 from PIL import Image, ImageDraw, ImageFont
 
+from app.services.audio_processor import passthrough_sample_rate
 from app.services.image_processor import (
     extract_dominant_colors,
     create_vinyl_image,
 )
+from app.services.ffmpeg_monitor import PROGRESS_ARGS, FFmpegMonitor
+from app.services import eta, metrics, precompute
+from app.services.frame_pipeline import FramePipeline, PipeClosed
+from app.services.rotation_cycle import (
+    CycleBuildCancelled, RotationCycle, build_rotation_cycle, cover_fingerprint,
+)
+from app.services.rotation_engine import get_rotation_maps
+from app.services.timing import counter, mark, record, record_value, span, timed
 
 
 # Video dimensions (Instagram square)
@@ -31,9 +43,40 @@ VINYL_SIZE = WIDTH
 VINYL_X = 0
 VINYL_Y = 0
 
+# Rotation cycle storage: "disc" keeps only the disc pixels, "full" whole frames.
+# SONIVO_SHARE_CYCLES=1 places cycles in shared memory so concurrent jobs with
+# the same cover reuse one copy (needs /dev/shm room for ~150 MB per cover).
+CYCLE_LAYOUT = os.environ.get("SONIVO_CYCLE_LAYOUT", "disc")
+SHARE_CYCLES = os.environ.get("SONIVO_SHARE_CYCLES", "0") == "1"
+
+# libx264 settings (also identify the throughput model in eta.py)
+X264_PRESET = "medium"
+X264_CRF = 20
+
+# Output audio. AAC sources are stream-copied (see audio_processor.passthrough_sample_rate);
+# others are encoded once, by a separate FFmpeg running alongside the video encode
+# (SONIVO_PARALLEL_AUDIO=1) and muxed in when both are done
+AUDIO_BITRATE = "256k"
+AUDIO_SAMPLE_RATE = 48000
+PARALLEL_AUDIO = os.environ.get("SONIVO_PARALLEL_AUDIO", "1") == "1"
+
+# Upper bound for FFmpeg to finish after the last frame, and progress poll period
+FFMPEG_TIMEOUT_SECONDS = 900
+PROGRESS_POLL_SECONDS = 0.5
+
+# Rendered frames in flight between the frame loop and the FFmpeg writer thread
+FRAME_RING_SIZE = int(os.environ.get("SONIVO_FRAME_RING", "4"))
 
+
+class RenderCancelled(Exception):
+    """generate_video stopped because its cancel_event was set."""
+
+    job_status = "cancelled"  # outcome label in sonivo_jobs_total
+
+
+@lru_cache(maxsize=None)
 def _get_font(size: int, bold: bool = False) -> ImageFont.FreeTypeFont:
-    """Get the best available font."""
+    """Get the best available font (loaded once per size)."""
     font_candidates = [
         "/System/Library/Fonts/Helvetica.ttc",
         "/System/Library/Fonts/HelveticaNeue.ttc",
@@ -61,25 +104,179 @@ def _get_font(size: int, bold: bool = False) -> ImageFont.FreeTypeFont:
     return ImageFont.load_default()
 
 
-def _prerender_rotation_cycle(vinyl_base: Image.Image) -> list:
+@timed("prerender_rotation_cycle")
+def _prerender_rotation_cycle(
+    vinyl_base: Image.Image,
+    share_key: Optional[str] = None,
+    cancel_event=None,
+) -> RotationCycle:
     """
     Pre-render all unique rotation frames for one full rotation.
     At 33⅓ RPM / 30fps, one rotation = 54 frames.
-    Returns a list of RGB byte buffers ready to composite.
+    Uses the shared, precomputed sampling maps of the rotation engine and stores
+    the frames as one compact array, already composited over the black background.
     """
-    degrees_per_second = VINYL_RPM * 6  # RPM * 360/60
-    degrees_per_frame = degrees_per_second / FPS
+    maps = get_rotation_maps(vinyl_base.size[0], FPS, VINYL_RPM)
+    return build_rotation_cycle(
+        vinyl_base,
+        maps,
+        frame_size=(WIDTH, HEIGHT),
+        offset=(VINYL_X, VINYL_Y),
+        layout=CYCLE_LAYOUT,
+        share_key=share_key,
+        cancel_event=cancel_event,
+    )
+
+
+def rotation_cycle_key(cover_path: Optional[str]) -> str:
+    """Identifies the rotation cycle a cover renders to (content hash + geometry)."""
+    return f"{cover_fingerprint(cover_path)}:{VINYL_SIZE}:{FPS}:{VINYL_RPM}:{CYCLE_LAYOUT}"
+
+
+def prepare_rotation_cycle(cover_path: Optional[str], cancel_event=None) -> RotationCycle:
+    """Build the vinyl disc for a cover and pre-render its rotation cycle."""
+    # Create vinyl disc image (1080x1080 RGBA)
+    vinyl_base = create_vinyl_image(cover_path, VINYL_SIZE)
+
+    share_key = None
+    if SHARE_CYCLES:
+        share_key = f"{cover_fingerprint(cover_path)}:{VINYL_SIZE}:{FPS}:{VINYL_RPM}"
+    return _prerender_rotation_cycle(vinyl_base, share_key=share_key, cancel_event=cancel_event)
+
+
+def _raise_if_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise RenderCancelled("render cancelled")
+
 
-    # Number of frames for one full 360° rotation
-    frames_per_rotation = int(math.ceil(360.0 / degrees_per_frame))
+def _stop_ffmpeg(proc: subprocess.Popen):
+    """Kill FFmpeg and reap it. SIGTERM would make it flush a file that is discarded anyway."""
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
 
-    rotated_frames = []
-    for i in range(frames_per_rotation):
-        angle = -(i * degrees_per_frame) % 360
-        rotated = vinyl_base.rotate(angle, resample=Image.BICUBIC, expand=False)
-        rotated_frames.append(rotated)
 
-    return rotated_frames
+def _renice(pid: int, nice: int):
+    """Raise a process's nice value to at least nice (it may already be higher, e.g. inherited)."""
+    try:
+        if os.getpriority(os.PRIO_PROCESS, pid) < nice:
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+    except OSError:
+        pass
+
+
+def _start_audio_encode(audio_path: str, start_sec: float, duration: float, output_path: str, nice: int) -> subprocess.Popen:
+    """Encode the segment's audio to an AAC .m4a in the background."""
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-y", "-v", "error",
+            "-ss", str(start_sec),
+            "-t", str(duration),
+            "-i", str(audio_path),
+            "-vn",
+            "-c:a", "aac",
+            "-b:a", AUDIO_BITRATE,
+            "-ar", str(AUDIO_SAMPLE_RATE),
+            "-f", "mp4",
+            str(output_path),
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    metrics.track_ffmpeg(proc.pid)
+    if nice:
+        _renice(proc.pid, nice)
+    return proc
+
+
+def _mux_audio(
+    video_path: str, audio_path: str, output_path: str, cancel_event, audio_proc: subprocess.Popen, nice: int = 0,
+):
+    """
+    Wait for the background audio encode, then copy both streams into the output.
+    The mux is cancellable and counted in the FFmpeg gauges like the render itself.
+    """
+    with span("audio_wait"):
+        deadline = time.monotonic() + FFMPEG_TIMEOUT_SECONDS
+        while True:
+            try:
+                _, stderr = audio_proc.communicate(timeout=PROGRESS_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                _raise_if_cancelled(cancel_event)
+                if time.monotonic() > deadline:
+                    metrics.FFMPEG_ERRORS.inc(kind="timeout")
+                    raise
+    if audio_proc.returncode != 0:
+        metrics.FFMPEG_ERRORS.inc(kind="audio")
+        raise RuntimeError(f"FFmpeg audio error: {stderr.decode(errors='replace')[-500:]}")
+
+    _raise_if_cancelled(cancel_event)
+    with span("audio_mux"):
+        mux_proc = subprocess.Popen(
+            [
+                "ffmpeg", "-y", "-v", "error",
+                "-i", str(video_path),
+                "-i", str(audio_path),
+                "-map", "0:v:0", "-map", "1:a:0",
+                "-c", "copy",
+                "-shortest",
+                "-movflags", "+faststart",
+                str(output_path),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        metrics.track_ffmpeg(mux_proc.pid)
+        try:
+            if nice:
+                _renice(mux_proc.pid, nice)
+            deadline = time.monotonic() + FFMPEG_TIMEOUT_SECONDS
+            while True:
+                try:
+                    _, stderr = mux_proc.communicate(timeout=PROGRESS_POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    _raise_if_cancelled(cancel_event)
+                    if time.monotonic() > deadline:
+                        metrics.FFMPEG_ERRORS.inc(kind="timeout")
+                        raise
+        except BaseException:
+            _stop_ffmpeg(mux_proc)
+            raise
+        finally:
+            metrics.untrack_ffmpeg(mux_proc.pid)
+    if mux_proc.returncode != 0:
+        metrics.FFMPEG_ERRORS.inc(kind="mux")
+        raise RuntimeError(f"FFmpeg mux error: {stderr.decode(errors='replace')[-500:]}")
+
+
+def _publish(part_path: str, output_path: str):
+    """
+    Move a finished video onto output_path in one step, so nobody sees a partial
+    file. Across filesystems it is first copied to a job-unique name next to it.
+    """
+    try:
+        os.replace(part_path, output_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    staged = f"{output_path}.{os.getpid()}-{threading.get_ident()}.part"
+    try:
+        shutil.copyfile(part_path, staged)
+        os.replace(staged, output_path)
+    finally:
+        if os.path.exists(staged):
+            os.remove(staged)
+
+
+def _report_encoder_progress(progress_callback, monitor: FFmpegMonitor):
+    """5-98% tracks frames actually encoded by FFmpeg; 100% once the file is finalized."""
+    percent = 5 + int(monitor.fraction() * 93)
+    progress_callback(percent, monitor.snapshot())
 
 
 def generate_video(
@@ -92,143 +289,250 @@ def generate_video(
     output_path: str,
     progress_callback=None,
     benchmark_session=None,
+    cancel_event=None,
+    nice: int = 0,
+    ffmpeg_threads: Optional[int] = None,
+    keep_cycle: bool = False,
 ) -> str:
     """
     Generate a vinyl-style Instagram video.
     Optimized: pre-renders one rotation cycle, black background, minimal per-frame work.
-    """
-    duration = end_sec - start_sec
-    total_frames = int(duration * FPS)
-
-    # Create vinyl disc image (1080x1080 RGBA)
-    vinyl_base = create_vinyl_image(cover_path, VINYL_SIZE)
-
-    # Pre-render all unique rotation positions (~54 frames)
-    if progress_callback:
-        progress_callback(2)
 
-    rotation_cycle = _prerender_rotation_cycle(vinyl_base)
-    cycle_length = len(rotation_cycle)
+    progress_callback(percent, stats=None) receives encoder stats (frame, fps,
+    speed, eta_seconds, ...) once FFmpeg is running.
 
-    if progress_callback:
-        progress_callback(5)
+    Setting cancel_event (anything with is_set()) stops the render at the next
+    frame: FFmpeg is terminated, the partial output removed and RenderCancelled raised.
 
-    # Pre-render the base frame: solid black (reused every frame)
-    base_rgb = Image.new("RGB", (WIDTH, HEIGHT), (0, 0, 0))
+    FFmpeg writes into a per-job temp directory; output_path is only replaced
+    once the video is complete, and a failed job never touches it.
 
-    # Set up FFmpeg process
-    tmp_dir = tempfile.mkdtemp(prefix="sonivo_")
+    nice and ffmpeg_threads throttle FFmpeg for lower priority classes (see scheduler.py).
 
-    try:
-        ffmpeg_cmd = [
-            "ffmpeg", "-y",
-            "-f", "rawvideo",
-            "-vcodec", "rawvideo",
-            "-pix_fmt", "rgb24",
-            "-s", f"{WIDTH}x{HEIGHT}",
-            "-r", str(FPS),
-            "-i", "pipe:0",
-            "-ss", str(start_sec),
-            "-t", str(duration),
-            "-i", str(audio_path),
-            # High quality for Instagram
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "20",
-            "-profile:v", "high",
-            "-level:v", "4.0",
-            "-pix_fmt", "yuv420p",
-            "-c:a", "aac",
-            "-b:a", "256k",
-            "-ar", "48000",
-            "-shortest",
-            "-movflags", "+faststart",
-            str(output_path)
-        ]
+    keep_cycle leaves a rotation cycle this call had to build in the precompute
+    cache, so later renders of the same cover in this process skip the build.
+    """
+    duration = end_sec - start_sec
+    total_frames = int(duration * FPS)
+    started_at = time.perf_counter()
 
-        ffmpeg_proc = subprocess.Popen(
-            ffmpeg_cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+    with metrics.track_job(duration):
+        _raise_if_cancelled(cancel_event)
+        if progress_callback:
+            progress_callback(2)
+
+        # Use the cycle precomputed after upload if there is one (cancelling one still in progress),
+        # otherwise build the vinyl and pre-render all unique rotation positions (~54 frames)
+        cycle_key = rotation_cycle_key(cover_path)
+        rotation_cycle = precompute.take_cycle(cycle_key)
+        if rotation_cycle is not None:
+            mark("precomputed_cycle")
+        else:
+            try:
+                rotation_cycle = prepare_rotation_cycle(cover_path, cancel_event=cancel_event)
+            except CycleBuildCancelled:
+                raise RenderCancelled("render cancelled") from None
+            if keep_cycle:
+                precompute.store_cycle(cycle_key, rotation_cycle)
+        cycle_length = len(rotation_cycle)
 
-        # Feed benchmark session the FFmpeg PID
         if benchmark_session is not None:
-            benchmark_session.set_ffmpeg_pid(
-                ffmpeg_proc.pid,
-                cmdline=" ".join(ffmpeg_cmd),
+            benchmark_session.set_rotation_cycle(
+                rotation_cycle.nbytes,
+                layout=rotation_cycle.layout,
+                shared=rotation_cycle.shared,
             )
 
-        # Generate and pipe frames
-        # The per-frame work is now: copy base → paste pre-rendered vinyl → tobytes
-        for frame_idx in range(total_frames):
-            # Pick the pre-rendered rotation frame
-            vinyl_rotated = rotation_cycle[frame_idx % cycle_length]
-
-            # Copy base frame and composite vinyl
-            frame = base_rgb.copy()
-            frame.paste(
-                vinyl_rotated.convert("RGB"),
-                (VINYL_X, VINYL_Y),
-                vinyl_rotated.split()[3],  # alpha channel as mask
-            )
-
-            # Write raw bytes to FFmpeg
-            ffmpeg_proc.stdin.write(frame.tobytes())
-
-            # Progress callback every 10 frames
-            if progress_callback and frame_idx % 10 == 0:
-                # 5-90% for frame generation, 90-100% for FFmpeg finalization
-                percent = 5 + int((frame_idx / total_frames) * 85)
-                progress_callback(percent)
-
-        # Close stdin and wait for FFmpeg to finish encoding
-        ffmpeg_proc.stdin.close()
         if progress_callback:
-            progress_callback(92)
-
-        ffmpeg_proc.wait(timeout=900)
+            progress_callback(5)
+
+        # Set up FFmpeg process; everything is written into the job's own temp dir
+        tmp_dir = tempfile.mkdtemp(prefix="sonivo_")
+        part_path = os.path.join(tmp_dir, "output.mp4")
+        ffmpeg_proc = None
+        audio_proc = None
+
+        # Audio: stream-copy a compatible AAC source, otherwise encode it (in parallel
+        # with the video when enabled). A copy can only cut between AAC frames (1024
+        # samples): FFmpeg keeps the frame before the start as decoder pre-roll and
+        # writes an MP4 edit list that trims playback to the exact start sample.
+        with span("audio_probe"):
+            passthrough = passthrough_sample_rate(audio_path) is not None
+        parallel_audio = not passthrough and PARALLEL_AUDIO
+        video_path = part_path
+        if passthrough:
+            audio_args = ["-ss", str(start_sec), "-t", str(duration), "-i", str(audio_path)]
+            audio_codec = ["-map", "1:a:0", "-c:a", "copy", "-shortest"]
+        elif parallel_audio:
+            audio_args, audio_codec = [], []
+            video_path = os.path.join(tmp_dir, "video.mp4")
+            audio_segment = os.path.join(tmp_dir, "audio.m4a")
+        else:
+            audio_args = ["-ss", str(start_sec), "-t", str(duration), "-i", str(audio_path)]
+            audio_codec = [
+                "-map", "1:a:0", "-c:a", "aac", "-b:a", AUDIO_BITRATE, "-ar", str(AUDIO_SAMPLE_RATE), "-shortest",
+            ]
+        mark("audio", mode="copy" if passthrough else "parallel" if parallel_audio else "inline")
 
-        if ffmpeg_proc.returncode != 0:
-            stderr = ffmpeg_proc.stderr.read().decode()
+        try:
+            _raise_if_cancelled(cancel_event)
+            if parallel_audio:
+                audio_proc = _start_audio_encode(audio_path, start_sec, duration, audio_segment, nice)
+            ffmpeg_cmd = [
+                "ffmpeg", "-y",
+                *PROGRESS_ARGS,
+                "-f", "rawvideo",
+                "-vcodec", "rawvideo",
+                "-pix_fmt", "rgb24",
+                "-s", f"{WIDTH}x{HEIGHT}",
+                "-r", str(FPS),
+                "-i", "pipe:0",
+                *audio_args,
+                "-map", "0:v:0",
+                # High quality for Instagram
+                "-c:v", "libx264",
+                "-preset", X264_PRESET,
+                "-crf", str(X264_CRF),
+                "-profile:v", "high",
+                "-level:v", "4.0",
+                *(["-threads", str(ffmpeg_threads)] if ffmpeg_threads else []),
+                "-pix_fmt", "yuv420p",
+                *audio_codec,
+                # The mux of a separately encoded audio track moves the index to the front instead
+                *(["-movflags", "+faststart"] if not parallel_audio else []),
+                str(video_path)
+            ]
+
+            with span("ffmpeg_start"):
+                ffmpeg_proc = subprocess.Popen(
+                    ffmpeg_cmd,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            metrics.track_ffmpeg(ffmpeg_proc.pid)
+            if nice:
+                _renice(ffmpeg_proc.pid, nice)
+            mark("ffmpeg_started", pid=ffmpeg_proc.pid, total_frames=total_frames)
+
+            # Drain stderr and parse -progress output in the background
+            monitor = FFmpegMonitor(ffmpeg_proc, total_frames=total_frames)
+
+            # Feed benchmark session the FFmpeg PID
             if benchmark_session is not None:
-                benchmark_session.set_exit_code(ffmpeg_proc.returncode)
-            raise RuntimeError(f"FFmpeg error: {stderr[-500:]}")
+                benchmark_session.set_ffmpeg_pid(
+                    ffmpeg_proc.pid,
+                    cmdline=" ".join(ffmpeg_cmd),
+                )
+
+            # Generate frames and hand them to the writer thread
+            # The per-frame work is now: copy the pre-composited disc rows → queue for writing.
+            # Ring buffers keep their black background; only the disc pixels are rewritten.
+            pipeline = FramePipeline(ffmpeg_proc.stdin, (HEIGHT, WIDTH, 3), ring_size=FRAME_RING_SIZE)
+            loop_start = time.perf_counter()
+            with span("frame_loop"):
+                try:
+                    for frame_idx in range(total_frames):
+                        if cancel_event is not None and cancel_event.is_set():
+                            # Stop FFmpeg first so the writer drains queued frames into a dead pipe
+                            _stop_ffmpeg(ffmpeg_proc)
+                            raise RenderCancelled("render cancelled")
+                        buffer = pipeline.acquire()
+                        pipeline.submit(rotation_cycle.render_into(buffer, frame_idx % cycle_length))
+
+                        # Progress callback every 10 frames, driven by frames FFmpeg has encoded
+                        if progress_callback and frame_idx % 10 == 0:
+                            _report_encoder_progress(progress_callback, monitor)
+
+                        # Timeline marker once per second of video (no-op unless tracing)
+                        if frame_idx % FPS == 0:
+                            counter("frames", rendered=frame_idx, encoded=monitor.frame())
+
+                    pipeline.close()
+                except PipeClosed:
+                    # FFmpeg went away mid-stream; its exit code and stderr are reported below
+                    pass
+                finally:
+                    pipeline.close(raise_errors=False)
+
+            loop_seconds = time.perf_counter() - loop_start
+            pipeline_stats = pipeline.stats()
+            record("pipe_write", pipeline_stats["write_blocked_seconds"], pipeline_stats["frames_written"])
+            frame_loop_fps = round(pipeline_stats["frames_written"] / max(loop_seconds, 1e-6), 1)
+            record_value("frame_loop_fps", frame_loop_fps)
+            if pipeline_stats["frames_written"]:
+                metrics.FRAME_LOOP_FPS.observe(frame_loop_fps)
+            record_value("pipe_blocked_seconds", pipeline_stats["write_blocked_seconds"])
 
-        if benchmark_session is not None:
-            benchmark_session.set_exit_code(0)
-            benchmark_session.set_output_path(str(output_path))
+            if benchmark_session is not None:
+                benchmark_session.set_pipeline_stats(pipeline_stats)
 
-        if progress_callback:
-            progress_callback(100)
+            # Close stdin and wait for FFmpeg to finish encoding
+            try:
+                ffmpeg_proc.stdin.close()
+            except (OSError, ValueError):
+                pass
 
-        return str(output_path)
+            # Keep reporting real encoder progress until FFmpeg has flushed the file
+            # (encoder tail, moov/faststart rewrite and audio mux after the last frame)
+            deadline = time.monotonic() + FFMPEG_TIMEOUT_SECONDS
+            with span("ffmpeg_flush"):
+                while True:
+                    try:
+                        ffmpeg_proc.wait(timeout=PROGRESS_POLL_SECONDS)
+                        break
+                    except subprocess.TimeoutExpired:
+                        if time.monotonic() > deadline:
+                            ffmpeg_proc.kill()
+                            metrics.FFMPEG_ERRORS.inc(kind="timeout")
+                            raise
+                        _raise_if_cancelled(cancel_event)
+                        if progress_callback:
+                            _report_encoder_progress(progress_callback, monitor)
+                monitor.join()
+            mark("ffmpeg_exited", returncode=ffmpeg_proc.returncode)
+
+            if ffmpeg_proc.returncode != 0:
+                metrics.FFMPEG_ERRORS.inc(kind="render")
+                stderr = monitor.stderr_tail()
+                if benchmark_session is not None:
+                    benchmark_session.set_exit_code(ffmpeg_proc.returncode)
+                raise RuntimeError(f"FFmpeg error: {stderr[-500:]}")
+
+            if audio_proc is not None:
+                _mux_audio(video_path, audio_segment, part_path, cancel_event, audio_proc, nice)
+            _raise_if_cancelled(cancel_event)
+            _publish(part_path, output_path)
 
-    finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+            if benchmark_session is not None:
+                benchmark_session.set_exit_code(0)
+                benchmark_session.set_output_path(str(output_path))
 
+            if progress_callback:
+                progress_callback(100, monitor.snapshot())
 
-def generate_video_batch(
-    tasks: list,
-    output_dir: str,
-) -> list:
-    """Generate multiple videos."""
-    results = []
-    for i, task in enumerate(tasks):
-        output_path = os.path.join(output_dir, task["filename"])
-        try:
-            generate_video(
-                audio_path=task["audio_path"],
-                cover_path=task.get("cover_path"),
-                artist=task.get("artist", "Unknown"),
-                title=task.get("title", "Unknown"),
-                start_sec=task.get("start_sec", 0),
-                end_sec=task.get("end_sec", 30),
-                output_path=output_path,
-            )
-            results.append({"filename": task["filename"], "status": "success", "path": output_path})
-        except Exception as e:
-            results.append({"filename": task["filename"], "status": "error", "error": str(e)})
+            # Feeds the ETA predictions for later jobs; the video is published, so a
+            # failure here (e.g. the model file's lock) must not fail or clean up the job
+            try:
+                eta.record(duration, time.perf_counter() - started_at, ffmpeg_threads)
+            except Exception as e:
+                print(f"Could not record the render time: {e}")
+            return str(output_path)
+
+        except BaseException:
+            # Cancelled or failed after FFmpeg started: never leave it running. Its partial
+            # files are in tmp_dir; output_path may be another job's finished video
+            if audio_proc is not None:
+                _stop_ffmpeg(audio_proc)
+            if ffmpeg_proc is not None:
+                _stop_ffmpeg(ffmpeg_proc)
+            raise
+
+        finally:
+            if ffmpeg_proc is not None:
+                metrics.untrack_ffmpeg(ffmpeg_proc.pid)
+            if audio_proc is not None:
+                metrics.untrack_ffmpeg(audio_proc.pid)
+            rotation_cycle.release()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    return results
@@ -0,0 +1,261 @@
+"""
+Watch-folder ingestion with Linux inotify (no polling).
+
+With SONIVO_WATCH_DIR set, the API watches that directory and hands every
+audio file that lands in it to a callback (the routes ingest it like an
+upload and can render a default segment, see routes/video.py):
+
+    watcher = WatchFolder(directory, on_file, extensions={".mp3", ".wav"})
+    watcher.start()
+
+A file is only handed over once it is complete:
+- it becomes a candidate when a writer closes it (IN_CLOSE_WRITE) or it is
+  moved in (IN_MOVED_TO, e.g. the final rename of rsync/scp temp files);
+- any further write, close or rename on the name restarts its settle timer
+  (SONIVO_WATCH_SETTLE seconds, default 2), and at the deadline its size and
+  mtime must match what they were at the last event;
+- dotfiles and names without an audio extension (`track.mp3.part`) are ignored.
+
+Handed-over files are remembered by (device, inode, size, mtime) in
+SONIVO_WATCH_STATE (default cache/watch.json), so renaming a file inside the
+folder, a repeated close or an API restart never ingests it twice. Files
+that arrived while the API was down are picked up by a scan at start, and
+again after an inotify queue overflow.
+
+inotify only reports changes made through this machine's kernel: on NFS/SMB
+mounts, files written by other clients are not seen.
+"""
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+WATCH_DIR = os.environ.get("SONIVO_WATCH_DIR", "")
+SETTLE_SECONDS = float(os.environ.get("SONIVO_WATCH_SETTLE", "2"))
+STATE_PATH = Path(os.environ.get("SONIVO_WATCH_STATE", str(BASE_DIR / "cache" / "watch.json")))
+# Identities remembered in the state file (oldest dropped first)
+MAX_REMEMBERED = 10000
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by len bytes of name
+_READ_SIZE = 64 * 1024
+# Longest poll() sleep, so stop() is noticed promptly
+_MAX_WAIT_SECONDS = 1.0
+
+
+class Inotify:
+    """Minimal ctypes binding: one watch on one directory, events as (mask, name)."""
+
+    def __init__(self, directory: Path, mask: int = _WATCH_MASK):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"cannot watch {directory}: {os.strerror(err)}")
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def read(self, timeout: Optional[float]) -> list:
+        """Events available within timeout seconds (None: wait indefinitely)."""
+        if not self._poll.poll(None if timeout is None else max(0, int(timeout * 1000))):
+            return []
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _identity(st: os.stat_result) -> str:
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class WatchFolder:
+    def __init__(
+        self,
+        directory,
+        on_file: Callable[[Path], None],
+        extensions: set,
+        settle_seconds: float = SETTLE_SECONDS,
+        state_path: Path = STATE_PATH,
+    ):
+        self.directory = Path(directory).resolve()
+        self.on_file = on_file
+        self.extensions = {e.lower() for e in extensions}
+        self.settle_seconds = settle_seconds
+        self.state_path = state_path
+        self.handed_over = 0
+        self.failed = 0
+        self._pending: dict = {}  # name -> (deadline, (size, mtime_ns) at the last event)
+        self._seen: dict = self._load_state()  # identity -> file name, oldest first
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Check that the directory can be watched, then watch it on a background thread."""
+        inotify = Inotify(self.directory)
+        self._thread = threading.Thread(target=self._run, args=(inotify,), name="sonivo-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2 * _MAX_WAIT_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "directory": str(self.directory),
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "pending": sorted(self._pending),
+            "handed_over": self.handed_over,
+            "failed": self.failed,
+        }
+
+    def _run(self, inotify: Inotify):
+        print(f"Watching {self.directory} for new audio files")
+        try:
+            self._scan()
+            while not self._stop.is_set():
+                now = time.monotonic()
+                wait = _MAX_WAIT_SECONDS
+                if self._pending:
+                    wait = min(wait, max(0.0, min(d for d, _ in self._pending.values()) - now))
+                for mask, name in inotify.read(wait):
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were dropped; the directory listing is the truth
+                        self._scan()
+                    elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        print(f"Watch folder {self.directory} was removed or moved; stopped watching")
+                        return
+                    elif not mask & IN_ISDIR:
+                        self._on_event(mask, name)
+                self._hand_over_settled()
+        finally:
+            inotify.close()
+
+    def _wanted(self, name: str) -> bool:
+        return bool(name) and not name.startswith(".") and Path(name).suffix.lower() in self.extensions
+
+    def _on_event(self, mask: int, name: str):
+        if not self._wanted(name):
+            return
+        if mask & (IN_MOVED_FROM | IN_DELETE):
+            self._pending.pop(name, None)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) or name in self._pending:
+            # Complete for now; a write in progress (IN_CREATE/IN_MODIFY) only delays a candidate
+            self._schedule(name)
+
+    def _schedule(self, name: str):
+        try:
+            st = os.stat(self.directory / name)
+        except FileNotFoundError:
+            self._pending.pop(name, None)
+            return
+        self._pending[name] = (time.monotonic() + self.settle_seconds, (st.st_size, st.st_mtime_ns))
+
+    def _scan(self):
+        """Queue every audio file in the directory; ones already handed over are skipped later."""
+        try:
+            names = [e.name for e in os.scandir(self.directory) if e.is_file(follow_symlinks=False)]
+        except OSError as e:
+            print(f"Watch folder scan failed: {e}")
+            return
+        for name in names:
+            if self._wanted(name):
+                self._schedule(name)
+
+    def _hand_over_settled(self):
+        now = time.monotonic()
+        for name, (deadline, snapshot) in list(self._pending.items()):
+            if deadline > now:
+                continue
+            path = self.directory / name
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+            if (st.st_size, st.st_mtime_ns) != snapshot:
+                # Still being written (e.g. a writer that reopens the file)
+                self._schedule(name)
+                continue
+            del self._pending[name]
+            identity = _identity(st)
+            if identity in self._seen:
+                # Renamed inside the folder, closed again unchanged, or seen before a restart
+                continue
+            try:
+                self.on_file(path)
+            except Exception as e:
+                self.failed += 1
+                print(f"Watch folder ingestion of {name} failed: {e}")
+                continue
+            self.handed_over += 1
+            self._remember(identity, name)
+
+    def _remember(self, identity: str, name: str):
+        self._seen[identity] = name
+        while len(self._seen) > MAX_REMEMBERED:
+            self._seen.pop(next(iter(self._seen)))
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"directory": str(self.directory), "seen": self._seen}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Could not save watch folder state: {e}")
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get("directory") != str(self.directory):
+            return {}
+        return dict(state.get("seen", {}))
@@ -0,0 +1,69 @@
+"""
+Stream a stored (uncompressed) ZIP archive built on the fly.
+
+MP4/H.264 is already compressed, so deflating it only burns CPU; entries are
+written with ZIP_STORED straight from the output files into the response, and
+no archive is ever written to disk. zipfile falls back to data descriptors on
+an unseekable stream, so sizes/CRCs follow each entry and memory stays at one
+read chunk.
+"""
+import io
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that hands back whatever zipfile wrote since the last drain."""
+
+    def __init__(self):
+        self._chunks: list = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(
+    files: Iterable[tuple[Path, str]],
+    extra: Iterable[tuple[str, str]] = (),
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (path, archive name) files plus (name, text) entries.
+
+    Usage:
+        StreamingResponse(stream_zip([(path, "a.mp4")], [("tracklist.txt", text)]),
+                          media_type="application/zip")
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for path, arcname in files:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            force_zip64 = zinfo.file_size >= zipfile.ZIP64_LIMIT
+            with open(path, "rb") as src, zf.open(zinfo, "w", force_zip64=force_zip64) as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+        for name, text in extra:
+            zf.writestr(name, text)
+    # Closing the archive writes the central directory
+    yield sink.drain()
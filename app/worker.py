@@ -0,0 +1,204 @@
+"""
+Standalone render worker: python -m app.worker [--processes N]
+
+Claims jobs from the SQLite queue (app/services/job_queue.py) and renders them
+in a warm pool of render processes (app/services/render_pool.py), so the
+compositing loop never shares a GIL with the API, renders survive API restarts
+and no job pays for interpreter and imaging-stack startup. Run the API with
+SONIVO_RENDER_MODE=queue and any number of workers against the same SONIVO_QUEUE_DB.
+
+Ctrl-C / SIGTERM stops claiming and waits for running renders; a second signal
+terminates them and puts their jobs back in the queue.
+
+Render metrics (job histograms, FFmpeg errors and gauges, cache hits) are
+recorded here, not in the API: with --metrics-port (SONIVO_WORKER_METRICS_PORT)
+the worker serves them at http://<host>:<port>/metrics for Prometheus to scrape.
+"""
+import argparse
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from app.services import metrics
+from app.services.job_queue import QUEUE_DB, JobQueue, worker_name
+from app.services.render_pool import RenderPool
+from app.services.scheduler import INTERACTIVE, render_options
+from app.services.video_generator import RenderCancelled
+
+
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 5
+STALE_CHECK_SECONDS = 30
+# Progress is written to the queue at most this often (and always at 100%)
+PROGRESS_WRITE_SECONDS = 0.5
+
+
+def render_kwargs(params: dict) -> dict:
+    """generate_video arguments for a job's stored parameters."""
+    return {
+        "audio_path": params["audio_path"],
+        "cover_path": params.get("cover_path"),
+        "artist": params.get("artist", "Unknown"),
+        "title": params.get("title", "Unknown"),
+        "start_sec": params.get("start_sec", 0),
+        "end_sec": params.get("end_sec", 30),
+        "output_path": params["output_path"],
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Serve this process's /metrics on a daemon thread."""
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="sonivo-worker-metrics", daemon=True).start()
+    return server
+
+
+class Worker:
+    def __init__(self, processes: int, db_path: Path = QUEUE_DB, metrics_port: int = 0):
+        self.processes = processes
+        self.db_path = db_path
+        self.metrics_port = metrics_port
+        self.queue = JobQueue(db_path)
+        self.name = worker_name()
+        self.running: dict = {}  # job_id -> (job, Future, cancel Event)
+        self.stopping = False
+        self.aborting = False
+        self.pool = None
+
+    def handle_signal(self, signum, frame):
+        if self.stopping:
+            self.aborting = True
+        self.stopping = True
+
+    def run(self):
+        print(f"Render worker {self.name}: {self.processes} process(es), queue {self.db_path}")
+        self.pool = RenderPool(self.processes)
+        # The pool forwards its renders' metrics to this process
+        metrics.JOBS_RUNNING.set_function(lambda: len(self.running))
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = serve_metrics(self.metrics_port)
+            print(f"  metrics on :{self.metrics_port}/metrics")
+        last_heartbeat = last_stale_check = 0.0
+        while True:
+            self._reap()
+            if self.aborting:
+                self._abort()
+                break
+            if self.stopping and not self.running:
+                break
+
+            # Jobs cancelled through the API stop at their next frame
+            for job_id in self.queue.cancelled(list(self.running)):
+                self.running[job_id][2].set()
+
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_SECONDS:
+                self.queue.heartbeat(list(self.running))
+                last_heartbeat = now
+            if now - last_stale_check >= STALE_CHECK_SECONDS:
+                if self.queue.requeue_stale():
+                    print("Requeued jobs of a lost worker")
+                last_stale_check = now
+
+            while not self.stopping and len(self.running) < self.processes:
+                job = self.queue.claim(self.name)
+                if job is None:
+                    break
+                cancel_event = threading.Event()
+                # Lower classes are throttled while interactive jobs are queued or running
+                throttle = job["priority"] > INTERACTIVE and self.queue.interactive_active()
+                future = self.pool.submit(
+                    progress_callback=self._progress_writer(job["id"]),
+                    cancel_event=cancel_event,
+                    **render_kwargs(job["params"]),
+                    **render_options(job["priority"], throttle),
+                )
+                self.running[job["id"]] = (job, future, cancel_event)
+                print(f"  ▶ {job['id']}")
+
+            time.sleep(POLL_SECONDS)
+        self.pool.shutdown(wait=not self.aborting)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        print("Render worker stopped")
+
+    def _progress_writer(self, job_id: str):
+        """progress_callback for a job: throttled writes to the queue (called on the pool's relay thread)."""
+        last_write = [0.0]
+
+        def on_progress(pct, stats=None):
+            now = time.monotonic()
+            if pct < 100 and now - last_write[0] < PROGRESS_WRITE_SECONDS:
+                return
+            last_write[0] = now
+            self.queue.update_progress(job_id, pct, stats)
+
+        return on_progress
+
+    def _reap(self):
+        for job_id, (job, future, _) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[job_id]
+            error = future.exception()
+            if error is None:
+                if self.queue.finish(job_id, job["params"].get("result") or {}):
+                    print(f"  ✓ {job_id}")
+                else:
+                    # Cancelled through the API as the render completed; the cancel stands
+                    print(f"  ⊘ {job_id} (cancelled)")
+            elif isinstance(error, RenderCancelled):
+                # Already marked cancelled in the queue
+                print(f"  ⊘ {job_id} (cancelled)")
+            else:
+                self.queue.fail(job_id, str(error))
+                print(f"  ✗ {job_id}")
+
+    def _abort(self):
+        self.pool.shutdown(wait=False)
+        for job_id in self.running:
+            self.queue.requeue(job_id)
+        self.running.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonivo render worker")
+    parser.add_argument(
+        "--processes", type=int, default=int(os.environ.get("SONIVO_WORKER_PROCESSES", "1")),
+        help="Concurrent renders (default: SONIVO_WORKER_PROCESSES or 1)",
+    )
+    parser.add_argument("--db", default=str(QUEUE_DB), help="Queue database (default: SONIVO_QUEUE_DB)")
+    parser.add_argument(
+        "--metrics-port", type=int, default=int(os.environ.get("SONIVO_WORKER_METRICS_PORT", "0")),
+        help="Serve render metrics at :PORT/metrics (default: SONIVO_WORKER_METRICS_PORT, 0 = off)",
+    )
+    args = parser.parse_args()
+
+    worker = Worker(max(1, args.processes), Path(args.db), args.metrics_port)
+    signal.signal(signal.SIGINT, worker.handle_signal)
+    signal.signal(signal.SIGTERM, worker.handle_signal)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 BENCHMARKS_DIR = PROJECT_ROOT / "benchmarks"
 RESULTS_DIR = BENCHMARKS_DIR / "results"
+LOAD_RESULTS_DIR = RESULTS_DIR / "load"
+MATRIX_RESULTS_DIR = RESULTS_DIR / "matrix"
+CAPACITY_RESULTS_DIR = RESULTS_DIR / "capacity"
 SYSTEM_INFO_PATH = BENCHMARKS_DIR / "system_info.json"
 REPORT_PATH = PROJECT_ROOT / "benchmark_report.md"
 
@@ -30,10 +33,10 @@ def percentile(data: list[float], p: float) -> float:
     return sorted_data[f] * (c - k) + sorted_data[c] * (k - f)
 
 
-def load_results() -> dict[int, list[dict]]:
-    """Load all result JSONs grouped by segment duration."""
+def load_results(results_dir: Path = RESULTS_DIR) -> dict[int, list[dict]]:
+    """Load all result JSONs grouped by segment duration (matrix runs: MATRIX_RESULTS_DIR)."""
     groups: dict[int, list[dict]] = {}
-    for fp in sorted(RESULTS_DIR.glob("*.json")):
+    for fp in sorted(results_dir.glob("*.json")):
         with open(fp) as f:
             data = json.load(f)
         dur = int(data["segment_duration_seconds"])
@@ -41,6 +44,24 @@ def load_results() -> dict[int, list[dict]]:
     return groups
 
 
+def load_load_results() -> list[dict]:
+    """Load load_test.py results (one JSON per concurrency level), ordered by segment and concurrency."""
+    runs = []
+    for fp in sorted(LOAD_RESULTS_DIR.glob("*.json")):
+        with open(fp) as f:
+            runs.append(json.load(f))
+    return sorted(runs, key=lambda r: (r["segment_duration_seconds"], r["concurrency"], r["timestamp"]))
+
+
+def load_capacity_result() -> dict:
+    """The latest capacity_sim.py result, or {}."""
+    paths = sorted(CAPACITY_RESULTS_DIR.glob("*.json"))
+    if not paths:
+        return {}
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
 def aggregate(groups: dict[int, list[dict]]) -> list[dict]:
     """Compute p50/p95 stats for each duration group."""
     rows = []
@@ -64,6 +85,11 @@ def aggregate(groups: dict[int, list[dict]]) -> list[dict]:
             if seg > 0:
                 rtfs.append(r["total_job_time_seconds"] / seg)
 
+        # Per-job memory increment (results recorded before/after the job)
+        mem_deltas = [r["peak_memory_delta_mb"] for r in runs if "peak_memory_delta_mb" in r]
+        mem_befores = [r["memory_before_mb"] for r in runs if "memory_before_mb" in r]
+        cycle_mbs = [r["rotation_cycle_mb"] for r in runs if r.get("rotation_cycle_mb")]
+
         rows.append({
             "duration": dur,
             "n_runs": len(runs),
@@ -76,11 +102,149 @@ def aggregate(groups: dict[int, list[dict]]) -> list[dict]:
             "p50_peak_mem": round(percentile(peak_mems, 50), 1),
             "p50_output_mb": round(percentile(output_sizes, 50), 2),
             "p50_avg_cpu": round(percentile(avg_cpus, 50), 1),
+            "p95_peak_delta": round(percentile(mem_deltas, 95), 1) if mem_deltas else None,
+            "p50_mem_before": round(percentile(mem_befores, 50), 1) if mem_befores else None,
+            "p50_cycle_mb": round(percentile(cycle_mbs, 50), 1) if cycle_mbs else None,
         })
 
     return rows
 
 
+def aggregate_stages(groups: dict[int, list[dict]]) -> list[dict]:
+    """Compute p50/p95 per timing stage (from the "stages" spans) for each duration group."""
+    rows = []
+    for dur in sorted(groups.keys()):
+        runs = [r for r in groups[dur] if r.get("stages")]
+        if not runs:
+            continue
+
+        stage_names: list[str] = []
+        for r in runs:
+            for name in r["stages"]:
+                if name not in stage_names:
+                    stage_names.append(name)
+
+        for name in stage_names:
+            secs = [r["stages"][name]["seconds"] for r in runs if name in r["stages"]]
+            shares = [
+                r["stages"][name]["seconds"] / r["total_job_time_seconds"]
+                for r in runs
+                if name in r["stages"] and r["total_job_time_seconds"] > 0
+            ]
+            rows.append({
+                "duration": dur,
+                "stage": name,
+                "n_runs": len(secs),
+                "p50_seconds": round(percentile(secs, 50), 3),
+                "p95_seconds": round(percentile(secs, 95), 3),
+                "p50_share": round(percentile(shares, 50) * 100, 1),
+            })
+
+        fps = [r["frame_loop_fps"] for r in runs if r.get("frame_loop_fps")]
+        blocked = [r["pipe_blocked_seconds"] for r in runs if r.get("pipe_blocked_seconds") is not None]
+        if fps:
+            rows.append({
+                "duration": dur,
+                "stage": "frame_loop_fps",
+                "n_runs": len(fps),
+                "p50_seconds": round(percentile(fps, 50), 1),
+                "p95_seconds": round(percentile(fps, 95), 1),
+                "p50_share": None,
+            })
+        if blocked:
+            rows.append({
+                "duration": dur,
+                "stage": "pipe_blocked",
+                "n_runs": len(blocked),
+                "p50_seconds": round(percentile(blocked, 50), 3),
+                "p95_seconds": round(percentile(blocked, 95), 3),
+                "p50_share": None,
+            })
+
+    return rows
+
+
+def aggregate_memory_profiles(groups: dict[int, list[dict]]) -> list[dict]:
+    """p95 per-stage memory attribution from runs made with --profile-memory."""
+    rows = []
+    for dur in sorted(groups.keys()):
+        runs = [r for r in groups[dur] if r.get("memory_profile")]
+        stage_names: list[str] = []
+        for r in runs:
+            for name in r["memory_profile"]["stages"]:
+                if name not in stage_names:
+                    stage_names.append(name)
+
+        for name in stage_names:
+            stages = [r["memory_profile"]["stages"][name] for r in runs if name in r["memory_profile"]["stages"]]
+
+            def p95(key):
+                values = [s[key] for s in stages if s.get(key) is not None]
+                return round(percentile(values, 95), 1) if values else None
+
+            top_site = max(
+                (a for s in stages for a in s.get("growth", [])[:1]),
+                key=lambda a: a["size_diff_mb"],
+                default=None,
+            )
+            rows.append({
+                "duration": dur,
+                "stage": name,
+                "n_runs": len(stages),
+                "heap_peak_mb": p95("python_heap_peak_mb"),
+                "python_pss_mb": p95("peak_python_pss_mb") or p95("peak_python_rss_mb"),
+                "children_pss_mb": p95("peak_children_pss_mb") or p95("peak_children_rss_mb"),
+                "top_growth": f"{top_site['site']} (+{top_site['size_diff_mb']} MB)" if top_site else None,
+            })
+    return rows
+
+
+FIXTURE_DIMENSIONS = ("codec", "duration", "cover_size", "cover_source")
+
+
+def aggregate_fixtures(groups: dict[int, list[dict]]) -> list[dict]:
+    """
+    Group fixture-matrix runs (run_benchmarks.py --matrix) by each input dimension.
+    A dimension's group only includes runs where that dimension alone was varied
+    (or the base case), so other inputs stay fixed; full-matrix runs are marginals.
+    """
+    runs = [r for dur in sorted(groups) for r in groups[dur] if r.get("fixture")]
+    rows = []
+    for dimension in FIXTURE_DIMENSIONS:
+        by_value: dict = {}
+        for r in runs:
+            if r["fixture"].get("varied") in (dimension, "base", "all"):
+                by_value.setdefault(r["fixture"][dimension], []).append(r)
+
+        for value in sorted(by_value):
+            value_runs = by_value[value]
+            rtfs = [
+                r["total_job_time_seconds"] / r["segment_duration_seconds"]
+                for r in value_runs if r["segment_duration_seconds"] > 0
+            ]
+            times = [r["total_job_time_seconds"] for r in value_runs]
+            peaks = [r["peak_memory_mb"] for r in value_runs]
+            deltas = [r["peak_memory_delta_mb"] for r in value_runs if "peak_memory_delta_mb" in r]
+
+            def stage(name):
+                secs = [r["stages"][name]["seconds"] for r in value_runs if name in r.get("stages", {})]
+                return round(percentile(secs, 50), 3) if secs else None
+
+            rows.append({
+                "dimension": dimension,
+                "value": value,
+                "n_runs": len(value_runs),
+                "p50_rtf": round(percentile(rtfs, 50), 3),
+                "p95_time": round(percentile(times, 95), 2),
+                "p95_peak_mem": round(percentile(peaks, 95), 1),
+                "p95_peak_delta": round(percentile(deltas, 95), 1) if deltas else None,
+                "p50_metadata_seconds": stage("extract_metadata"),
+                "p50_vinyl_seconds": stage("create_vinyl_image"),
+                "p50_audio_mb": round(percentile([r["fixture"]["audio_mb"] for r in value_runs], 50), 2),
+            })
+    return rows
+
+
 def linear_fit(rows: list[dict]) -> dict:
     """Best-effort linear fit: seconds per minute of audio, peak RAM per minute."""
     if len(rows) < 2:
@@ -110,7 +274,16 @@ def linear_fit(rows: list[dict]) -> dict:
     }
 
 
-def generate_report(rows: list[dict], fit: dict, sys_info: dict):
+def generate_report(
+    rows: list[dict],
+    fit: dict,
+    sys_info: dict,
+    stage_rows: list[dict] = (),
+    load_runs: list[dict] = (),
+    fixture_rows: list[dict] = (),
+    memory_rows: list[dict] = (),
+    capacity: dict = None,
+):
     """Generate the benchmark_report.md file."""
     lines = []
     lines.append("# Video Generation Benchmark Report\n")
@@ -151,6 +324,83 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
         )
     lines.append("")
 
+    # Stage timing (spans inside generate_video and the image helpers)
+    if stage_rows:
+        lines.append("## Stage Timing\n")
+        lines.append("`frame_loop_fps` is frames per second (not seconds); `pipe_blocked` is time the frame loop waited on FFmpeg.\n")
+        lines.append("| Segment (s) | Stage | Runs | p50 (s) | p95 (s) | p50 Share of Job |")
+        lines.append("|-------------|-------|------|---------|---------|------------------|")
+        for r in stage_rows:
+            share = f"{r['p50_share']}%" if r["p50_share"] is not None else "—"
+            lines.append(
+                f"| {r['duration']} | {r['stage']} | {r['n_runs']} "
+                f"| {r['p50_seconds']} | {r['p95_seconds']} | {share} |"
+            )
+        lines.append("")
+
+    # Input fixtures (run_benchmarks.py --matrix)
+    if fixture_rows:
+        lines.append("## Input Fixtures\n")
+        lines.append("Each dimension varied on its own around `MATRIX_BASE` in run_benchmarks.py. "
+                     "RTF = job time / segment length; metadata = Mutagen parse + cover extraction.\n")
+        lines.append("| Dimension | Value | Runs | Audio (MB) | RTF p50 | p95 Time (s) | p95 Peak RAM (MB) | p95 Peak Δ (MB) | Metadata p50 (s) | Vinyl p50 (s) |")
+        lines.append("|-----------|-------|------|------------|---------|--------------|-------------------|-----------------|------------------|---------------|")
+        for r in fixture_rows:
+            delta = r["p95_peak_delta"] if r["p95_peak_delta"] is not None else "—"
+            meta = r["p50_metadata_seconds"] if r["p50_metadata_seconds"] is not None else "—"
+            vinyl = r["p50_vinyl_seconds"] if r["p50_vinyl_seconds"] is not None else "—"
+            lines.append(
+                f"| {r['dimension']} | {r['value']} | {r['n_runs']} | {r['p50_audio_mb']} | {r['p50_rtf']} "
+                f"| {r['p95_time']} | {r['p95_peak_mem']} | {delta} | {meta} | {vinyl} |"
+            )
+        lines.append("")
+
+    # Memory per job (before the job vs. peak during it)
+    mem_rows = [r for r in rows if r["p95_peak_delta"] is not None]
+    if mem_rows:
+        lines.append("## Memory Per Job\n")
+        lines.append("| Segment (s) | RSS Before Job (MB) | p95 Peak RAM (MB) | p95 Peak Δ (MB) | Rotation Cycle (MB) |")
+        lines.append("|-------------|---------------------|-------------------|-----------------|---------------------|")
+        for r in mem_rows:
+            cycle = r["p50_cycle_mb"] if r["p50_cycle_mb"] is not None else "—"
+            lines.append(
+                f"| {r['duration']} | {r['p50_mem_before']} | {r['p95_peak_mem']} "
+                f"| {r['p95_peak_delta']} | {cycle} |"
+            )
+        lines.append("")
+
+    # Load test (measured through the HTTP API at fixed concurrency)
+    if load_runs:
+        lines.append("## Load Test\n")
+        lines.append("Measured by `benchmarks/load_test.py` against a local uvicorn server (upload → waveform → generate → progress polling).\n")
+        lines.append("| Segment (s) | Concurrency | Arrivals/min | Done/Jobs | Videos/h | Job p50 (s) | Job p95 (s) | Generate p95 (ms) | Progress p95 (ms) | Peak RSS (MB) |")
+        lines.append("|-------------|-------------|--------------|-----------|----------|-------------|-------------|-------------------|-------------------|---------------|")
+        for r in load_runs:
+            api = r["api_latency_ms"]
+            arrivals = r["arrival_rate_per_min"] or "closed"
+            rss = r.get("peak_rss_mb")
+            lines.append(
+                f"| {r['segment_duration_seconds']:g} | {r['concurrency']} | {arrivals} "
+                f"| {r['completed']}/{r['jobs']} | {r['throughput_videos_per_hour']} "
+                f"| {r['job_latency_seconds']['p50']} | {r['job_latency_seconds']['p95']} "
+                f"| {api.get('generate', {}).get('p95', '—')} | {api.get('progress', {}).get('p95', '—')} "
+                f"| {rss if rss is not None else 'n/a'} |"
+            )
+        lines.append("")
+
+    # Memory attribution (run_benchmarks.py --profile-memory)
+    if memory_rows:
+        lines.append("## Memory Attribution\n")
+        lines.append("From `--profile-memory` runs: Python heap (tracemalloc) and PSS of the Python process vs. FFmpeg children while each stage was open.\n")
+        lines.append("| Segment (s) | Stage | Runs | p95 Heap Peak (MB) | p95 Python PSS (MB) | p95 FFmpeg PSS (MB) | Largest Growth Site |")
+        lines.append("|-------------|-------|------|--------------------|---------------------|---------------------|---------------------|")
+        for r in memory_rows:
+            lines.append(
+                f"| {r['duration']} | {r['stage']} | {r['n_runs']} | {r['heap_peak_mb'] if r['heap_peak_mb'] is not None else '—'} "
+                f"| {r['python_pss_mb'] or '—'} | {r['children_pss_mb'] or '—'} | {r['top_growth'] or '—'} |"
+            )
+        lines.append("")
+
     # Resource Profile
     lines.append("## Resource Profile\n")
 
@@ -178,12 +428,27 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
             else:
                 lines.append(f"- **RAM scaling**: Grows ~{ram_growth:.1f} MB per second of audio ({ram_first:.0f}–{ram_last:.0f} MB range)")
 
+        # Render- vs encode-bound (frame pipeline instrumentation)
+        all_runs = [run for runs in load_results().values() for run in runs]
+        bounds = [run["pipeline"]["bound"] for run in all_runs if isinstance(run.get("pipeline"), dict)]
+        if bounds:
+            encode_bound = bounds.count("encode")
+            lines.append(
+                f"- **Pipeline**: {encode_bound}/{len(bounds)} runs encode-bound "
+                f"(frame loop waited on FFmpeg), {len(bounds) - encode_bound} render-bound"
+            )
+
         lines.append("- **Parallel contention**: Each job runs its own FFmpeg subprocess. Concurrent jobs compete for CPU cores and memory bandwidth. RAM is the likely bottleneck for parallel execution.")
     lines.append("")
 
     # Capacity Estimation
     lines.append("## Capacity Estimation\n")
     lines.append("Rule: `min(vCPU / eff_cpu_cores_p50, RAM_GB / p95_peak_ram_GB) × 0.8`\n")
+    lines.append(
+        "When per-job memory deltas are recorded, the RAM limit counts the process "
+        "baseline once and each concurrent job at its p95 peak Δ: "
+        "`(RAM_GB - baseline_GB) / p95_peak_delta_GB`.\n"
+    )
 
     if rows:
         # Use the "typical" (30s) or median duration for estimates
@@ -197,6 +462,10 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
 
         eff_cores = ref_row["p50_eff_cores"] or 1
         peak_ram_gb = ref_row["p95_peak_mem"] / 1024.0
+        baseline_gb = 0.0
+        if ref_row["p95_peak_delta"]:
+            peak_ram_gb = ref_row["p95_peak_delta"] / 1024.0
+            baseline_gb = (ref_row["p50_mem_before"] or 0) / 1024.0
 
         configs = [
             (4, 8), (8, 16), (16, 32),
@@ -206,7 +475,7 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
         lines.append("|---------------|------------|------------|----------------------|")
         for vcpu, ram in configs:
             cpu_cap = vcpu / eff_cores if eff_cores > 0 else 999
-            ram_cap = ram / peak_ram_gb if peak_ram_gb > 0 else 999
+            ram_cap = (ram - baseline_gb) / peak_ram_gb if peak_ram_gb > 0 else 999
             raw = min(cpu_cap, ram_cap)
             safe = max(1, int(raw * 0.8))
             lines.append(
@@ -214,6 +483,28 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
             )
     lines.append("")
 
+    if capacity:
+        mix = ", ".join(f"{m['segment_seconds']:g}s × {m['weight']:.0%}" for m in capacity["mix"])
+        lines.append("### Simulated Capacity\n")
+        lines.append(
+            f"From `benchmarks/capacity_sim.py`: {capacity['arrival']} arrivals of {mix}, "
+            f"sustainable while the p95 queue wait is ≤ {capacity['max_wait_seconds']:g}s "
+            f"(core speed ×{capacity['core_speed']:g}, {capacity['ram_headroom']:.0%} RAM headroom).\n"
+        )
+        lines.append("| Server Config | Workers | Max Videos/h | At Rate/h | Wait p95 (s) | Job p95 (s) | CPU Util | Peak RAM (MB) |")
+        lines.append("|---------------|---------|--------------|-----------|--------------|-------------|----------|---------------|")
+        for server in capacity["servers"]:
+            best = next((l for l in server["levels"] if l["workers"] == server["best_workers"]), None)
+            if not best or not best["at_rate"]:
+                continue
+            stats = best["at_rate"]
+            lines.append(
+                f"| {server['vcpu']} vCPU / {server['ram_gb']:g}GB | {best['workers']} | **{best['max_videos_per_hour']:.0f}** "
+                f"| {best['rate_per_hour']:.0f} | {stats['queue_wait_seconds']['p95']} | {stats['latency_seconds']['p95']} "
+                f"| {stats['cpu_utilization']:.0%} | {stats['peak_ram_mb']:.0f} |"
+            )
+        lines.append("")
+
     # Cost Modeling Inputs
     lines.append("## Cost Modeling Inputs (MEASURED ONLY)\n")
     if fit:
@@ -242,6 +533,12 @@ def generate_report(rows: list[dict], fit: dict, sys_info: dict):
     lines.append("## Raw Files\n")
     for fp in sorted(RESULTS_DIR.glob("*.json")):
         lines.append(f"- `benchmarks/results/{fp.name}`")
+    for fp in sorted(MATRIX_RESULTS_DIR.glob("*.json")):
+        lines.append(f"- `benchmarks/results/matrix/{fp.name}`")
+    for fp in sorted(LOAD_RESULTS_DIR.glob("*.json")):
+        lines.append(f"- `benchmarks/results/load/{fp.name}`")
+    for fp in sorted(CAPACITY_RESULTS_DIR.glob("*.json")):
+        lines.append(f"- `benchmarks/results/capacity/{fp.name}`")
     lines.append("")
 
     # Write
@@ -265,22 +562,32 @@ def main():
 
     # Load results
     groups = load_results()
-    if not groups:
+    matrix_groups = load_results(MATRIX_RESULTS_DIR)
+    if not groups and not matrix_groups:
         print("ERROR: No result files found in benchmarks/results/")
         sys.exit(1)
 
     print(f"\n  Found results for durations: {sorted(groups.keys())}s")
     for dur, runs in sorted(groups.items()):
         print(f"    {dur}s: {len(runs)} runs")
+    if matrix_groups:
+        print(f"  Found {sum(len(runs) for runs in matrix_groups.values())} fixture-matrix runs")
 
     # Aggregate
     print("\n  Computing aggregates...")
     rows = aggregate(groups)
     fit = linear_fit(rows)
+    stage_rows = aggregate_stages(groups)
+    fixture_rows = aggregate_fixtures(matrix_groups)
+    memory_rows = aggregate_memory_profiles(groups)
+    load_runs = load_load_results()
+    if load_runs:
+        print(f"  Found {len(load_runs)} load-test levels")
+    capacity = load_capacity_result()
 
     # Generate report
     print("\n  Generating report...")
-    generate_report(rows, fit, sys_info)
+    generate_report(rows, fit, sys_info, stage_rows, load_runs, fixture_rows, memory_rows, capacity)
 
     # Print summary table
     print("\n  ── Summary ──")
@@ -289,6 +596,26 @@ def main():
     for r in rows:
         print(f"  {r['duration']:>5d} | {r['p50_time']:>8.1f}s | {r['p95_time']:>8.1f}s | {r['p50_rtf']:>8.3f} | {r['p95_peak_mem']:>7.0f}MB")
 
+    if stage_rows:
+        print("\n  ── Stages (p50 / p95) ──")
+        for r in stage_rows:
+            print(f"  {r['duration']:>5d} | {r['stage']:<26s} | {r['p50_seconds']:>8} | {r['p95_seconds']:>8}")
+
+    if fixture_rows:
+        print("\n  ── Input fixtures (RTF p50, p95 peak RAM) ──")
+        for r in fixture_rows:
+            print(f"  {r['dimension']:<12s} | {str(r['value']):<9s} | {r['p50_rtf']:>6.3f} | {r['p95_peak_mem']:>7.0f}MB")
+
+    if load_runs:
+        print("\n  ── Load (videos/h, job p95) ──")
+        for r in load_runs:
+            rss = r.get("peak_rss_mb")
+            print(
+                f"  {r['segment_duration_seconds']:>5g} | c={r['concurrency']:<3d} | "
+                f"{r['throughput_videos_per_hour']:>8.0f}/h | {r['job_latency_seconds']['p95']:>7.1f}s | "
+                + (f"{rss:>6.0f}MB" if rss is not None else f"{'n/a':>8s}")
+            )
+
     if fit:
         print(f"\n  Linear fit:")
         print(f"    Seconds per minute audio (p50): {fit['seconds_per_minute_audio_p50']}s")
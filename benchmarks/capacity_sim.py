@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Capacity planning simulator driven by the measured benchmark runs.
+
+The static rule in benchmark_report.md (`min(vCPU / eff_cores, RAM / peak_RAM)
+× 0.8` at one segment length) says how many renders fit side by side, but not
+how long jobs queue or how many videos an hour a server sustains. This replays
+an arrival process and a segment-length mix against the per-duration runs in
+benchmarks/results/ (wall time, CPU cores used, peak RAM) with a discrete-event
+simulation of a server shape and worker count:
+
+- each arriving job draws a measured run of its segment length (the nearest
+  measured length, with time scaled to the segment);
+- a job starts when a worker is free and its peak RAM fits, first come first
+  served (a job that does not fit blocks the ones behind it);
+- running jobs share the vCPUs: while they demand more cores than there are,
+  all of them slow down proportionally. --core-speed scales per-core speed
+  relative to the benchmark machine (system_info.json).
+
+For every worker count it reports the queue wait and job latency percentiles,
+CPU and worker utilization and peak RAM at --rate, and the maximum sustainable
+videos/hour: the highest arrival rate at which the p95 queue wait stays within
+--max-wait. Results go to benchmarks/results/capacity/ for aggregate_results.py.
+
+Usage:
+    python benchmarks/capacity_sim.py --servers 4x8,8x16 --mix 15:0.2,30:0.6,60:0.2
+    python benchmarks/capacity_sim.py --servers 16x32 --workers 2,4,6 --rate 300 --arrival burst --burst 10
+"""
+import argparse
+import bisect
+import json
+import math
+import random
+import sys
+from collections import deque
+from datetime import datetime, timezone
+
+from aggregate_results import RESULTS_DIR, SYSTEM_INFO_PATH, load_results, percentile
+
+CAPACITY_RESULTS_DIR = RESULTS_DIR / "capacity"
+
+# Share of the RAM kept free for the OS and page cache (same margin as the ×0.8 rule)
+DEFAULT_RAM_HEADROOM = 0.2
+# Jobs at the start of a run left out of the statistics (the queue fills from empty)
+WARMUP_FRACTION = 0.1
+# Binary search steps for the maximum sustainable rate
+SEARCH_STEPS = 14
+# Worker counts tried by default, at most
+MAX_AUTO_WORKERS = 16
+
+
+class Profile:
+    """Measured runs per segment length: (wall seconds, CPU cores used, peak RAM MB)."""
+
+    def __init__(self, groups: dict[int, list[dict]]):
+        self.samples: dict[int, list[tuple]] = {}
+        baselines = []
+        for duration, runs in sorted(groups.items()):
+            samples = []
+            for r in runs:
+                wall = r.get("total_job_time_seconds") or 0
+                if r.get("exit_code", 0) != 0 or wall <= 0 or duration <= 0:
+                    continue
+                cpu = r.get("cpu_user_time_seconds", 0) + r.get("cpu_system_time_seconds", 0)
+                # With per-job deltas, the process baseline is counted once per server (as in the report)
+                mem = r.get("peak_memory_delta_mb") or r.get("peak_memory_mb", 0)
+                if r.get("peak_memory_delta_mb") and r.get("memory_before_mb"):
+                    baselines.append(r["memory_before_mb"])
+                samples.append((wall, max(cpu / wall, 0.1), mem))
+            if samples:
+                self.samples[duration] = samples
+        self.durations = sorted(self.samples)
+        self.baseline_mb = percentile(baselines, 50) if baselines else 0.0
+
+    def nearest(self, segment: float) -> int:
+        i = bisect.bisect_left(self.durations, segment)
+        candidates = self.durations[max(0, i - 1):i + 1]
+        return min(candidates, key=lambda d: abs(math.log(d / segment)))
+
+    def draw(self, segment: float, rng: random.Random) -> tuple:
+        """A measured run for this segment length, its time scaled from the nearest measured length."""
+        duration = self.nearest(segment)
+        wall, cores, mem = rng.choice(self.samples[duration])
+        return wall * segment / duration, cores, mem
+
+    def mean_wall(self, mix: list[tuple]) -> float:
+        total = 0.0
+        for segment, weight in mix:
+            duration = self.nearest(segment)
+            walls = [s[0] for s in self.samples[duration]]
+            total += weight * sum(walls) / len(walls) * segment / duration
+        return total
+
+    def max_mem(self, mix: list[tuple]) -> float:
+        return max(s[2] for segment, _ in mix for s in self.samples[self.nearest(segment)])
+
+
+def parse_mix(text: str) -> list[tuple]:
+    """'15:0.2,30:0.8' -> [(15.0, 0.2), (30.0, 0.8)] with the weights normalized."""
+    mix = []
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        segment, _, weight = part.partition(":")
+        mix.append((float(segment), float(weight or 1)))
+    total = sum(w for _, w in mix)
+    if not mix or total <= 0 or any(s <= 0 or w < 0 for s, w in mix):
+        raise ValueError(f"invalid segment mix: {text!r}")
+    return [(s, w / total) for s, w in mix]
+
+
+def parse_servers(text: str) -> list[tuple]:
+    """'4x8,8x16' -> [(4, 8.0), (8, 16.0)] (vCPUs x RAM GB)."""
+    servers = []
+    for part in text.split(","):
+        if part.strip():
+            vcpu, _, ram = part.lower().partition("x")
+            servers.append((int(vcpu), float(ram)))
+    return servers
+
+
+def arrivals(rate_per_hour: float, jobs: int, process: str, burst: int, rng: random.Random) -> list[float]:
+    """Arrival times (seconds) of jobs at a mean of rate_per_hour."""
+    mean_gap = 3600.0 / rate_per_hour
+    times, t = [], 0.0
+    while len(times) < jobs:
+        if process == "uniform":
+            t += mean_gap
+            times.append(t)
+        elif process == "burst":
+            # Batches of `burst` tracks at once (batch requests, manifests), Poisson between batches
+            t += rng.expovariate(1.0 / (mean_gap * burst))
+            times.extend([t] * burst)
+        else:
+            t += rng.expovariate(1.0 / mean_gap)
+            times.append(t)
+    return times[:jobs]
+
+
+def simulate(
+    profile: Profile, vcpu: int, ram_gb: float, workers: int, rate_per_hour: float, mix: list[tuple],
+    jobs: int, process: str = "poisson", burst: int = 10, core_speed: float = 1.0,
+    ram_headroom: float = DEFAULT_RAM_HEADROOM, seed: int = 1,
+) -> dict:
+    """Run one simulation; waits and latencies exclude the warm-up jobs."""
+    rng = random.Random(seed)
+    usable_mb = ram_gb * 1024 * (1 - ram_headroom) - profile.baseline_mb
+    segments = [s for s, _ in mix]
+    weights = [w for _, w in mix]
+    pending = deque()
+    for index, arrived in enumerate(arrivals(rate_per_hour, jobs, process, burst, rng)):
+        segment = rng.choices(segments, weights)[0]
+        wall, cores, mem = profile.draw(segment, rng)
+        pending.append({"index": index, "arrived": arrived, "work": wall, "cores": cores, "mem": mem})
+
+    queue: deque = deque()
+    running: list = []
+    waits, latencies = [], []
+    now = mem_used = peak_mem = 0.0
+    cpu_busy = worker_busy = 0.0
+    warmup = int(jobs * WARMUP_FRACTION)
+    measure_from = None
+
+    while pending or queue or running:
+        # Start queued jobs in arrival order while a worker and RAM are free
+        while queue and len(running) < workers and mem_used + queue[0]["mem"] <= usable_mb:
+            job = queue.popleft()
+            job["started"] = now
+            running.append(job)
+            mem_used += job["mem"]
+            peak_mem = max(peak_mem, mem_used)
+        if queue and not running:
+            raise ValueError(f"a job needs {queue[0]['mem']:.0f} MB; only {usable_mb:.0f} MB usable")
+
+        demand = sum(j["cores"] for j in running)
+        speed = core_speed * min(1.0, vcpu / demand) if running else 0.0
+        to_done = min(j["work"] for j in running) / speed if running else math.inf
+        to_arrival = pending[0]["arrived"] - now if pending else math.inf
+        # A step rather than absolute event times, which lose precision over long runs
+        dt = max(0.0, min(to_done, to_arrival))
+        for job in running:
+            job["work"] -= speed * dt
+        if measure_from is not None:
+            cpu_busy += min(demand, vcpu) * dt
+            worker_busy += len(running) * dt
+        now += dt
+
+        for job in [j for j in running if j["work"] <= 1e-6]:
+            running.remove(job)
+            mem_used -= job["mem"]
+            if job["index"] >= warmup:
+                waits.append(job["started"] - job["arrived"])
+                latencies.append(now - job["arrived"])
+        while pending and pending[0]["arrived"] <= now:
+            job = pending.popleft()
+            if job["index"] == warmup:
+                measure_from = now
+            queue.append(job)
+
+    span = now - (measure_from or 0.0)
+    return {
+        "completed": len(latencies),
+        "throughput_videos_per_hour": round(len(latencies) / span * 3600, 1) if span > 0 else 0,
+        "queue_wait_seconds": {p: round(percentile(waits, q), 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "latency_seconds": {p: round(percentile(latencies, q), 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "cpu_utilization": round(cpu_busy / (vcpu * span), 3) if span > 0 else 0,
+        "worker_utilization": round(worker_busy / (workers * span), 3) if span > 0 else 0,
+        "peak_ram_mb": round(peak_mem + profile.baseline_mb, 1),
+    }
+
+
+def max_sustainable_rate(profile: Profile, vcpu: int, ram_gb: float, workers: int, mix: list[tuple], args) -> float:
+    """Highest videos/hour whose p95 queue wait stays within args.max_wait (binary search)."""
+    def ok(rate: float) -> bool:
+        result = simulate(
+            profile, vcpu, ram_gb, workers, rate, mix, args.jobs, args.arrival, args.burst,
+            args.core_speed, args.ram_headroom, args.seed,
+        )
+        return result["queue_wait_seconds"]["p95"] <= args.max_wait
+
+    # Contention only slows jobs down, so uncontended service time bounds the rate
+    high = workers * 3600.0 / (profile.mean_wall(mix) / args.core_speed)
+    low = 0.0
+    for _ in range(SEARCH_STEPS):
+        middle = (low + high) / 2
+        if ok(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def worker_counts(profile: Profile, vcpu: int, ram_gb: float, mix: list[tuple], args) -> list[int]:
+    if args.workers:
+        return [int(w) for w in args.workers.split(",") if w.strip()]
+    usable_mb = ram_gb * 1024 * (1 - args.ram_headroom) - profile.baseline_mb
+    fit = int(usable_mb // profile.max_mem(mix))
+    return list(range(1, min(vcpu, fit, MAX_AUTO_WORKERS) + 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonivo capacity planning simulator")
+    parser.add_argument("--servers", default="4x8,8x16,16x32", help="Server shapes as vCPUxRAM_GB, comma-separated")
+    parser.add_argument("--workers", default="", help="Concurrent renders to try (default: 1 up to what fits)")
+    parser.add_argument("--mix", default="30:1", help="Segment lengths and weights, e.g. 15:0.2,30:0.6,60:0.2")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrival rate to report latencies at (videos/hour; default: 80%% of the sustainable rate)")
+    parser.add_argument("--arrival", choices=("poisson", "uniform", "burst"), default="poisson", help="Arrival process")
+    parser.add_argument("--burst", type=int, default=10, help="Jobs per batch with --arrival burst")
+    parser.add_argument("--max-wait", type=float, default=60.0, help="p95 queue wait (s) a sustainable rate must meet")
+    parser.add_argument("--core-speed", type=float, default=1.0, help="Per-core speed relative to the benchmark machine")
+    parser.add_argument("--ram-headroom", type=float, default=DEFAULT_RAM_HEADROOM, help="Share of RAM kept free")
+    parser.add_argument("--jobs", type=int, default=2000, help="Jobs per simulation")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+        servers = parse_servers(args.servers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    profile = Profile(load_results())
+    if not profile.durations:
+        print("ERROR: No result files found in benchmarks/results/ (run run_benchmarks.py first)")
+        sys.exit(1)
+    machine = {}
+    if SYSTEM_INFO_PATH.exists():
+        with open(SYSTEM_INFO_PATH) as f:
+            machine = json.load(f)
+
+    print("=" * 60)
+    print("Sonivo Capacity Simulation")
+    print("=" * 60)
+    print(f"\n  Measured segments: {profile.durations}s on {machine.get('cpu_model', 'unknown CPU')}")
+    print(f"  Mix: {', '.join(f'{s:g}s × {w:.0%}' for s, w in mix)} | {args.arrival} arrivals | p95 wait ≤ {args.max_wait:g}s")
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "benchmark_machine": machine.get("cpu_model"),
+        "mix": [{"segment_seconds": s, "weight": round(w, 4)} for s, w in mix],
+        "arrival": args.arrival,
+        "burst": args.burst if args.arrival == "burst" else None,
+        "max_wait_seconds": args.max_wait,
+        "core_speed": args.core_speed,
+        "ram_headroom": args.ram_headroom,
+        "jobs": args.jobs,
+        "servers": [],
+    }
+    for vcpu, ram_gb in servers:
+        print(f"\n  ── {vcpu} vCPU / {ram_gb:g}GB ──")
+        print(f"  {'Workers':>7s} | {'Max/h':>7s} | {'Rate/h':>7s} | {'Wait p50':>8s} | {'Wait p95':>8s} | {'Job p95':>8s} | {'CPU':>4s} | {'Peak RAM':>8s}")
+        levels = []
+        for workers in worker_counts(profile, vcpu, ram_gb, mix, args):
+            try:
+                max_rate = max_sustainable_rate(profile, vcpu, ram_gb, workers, mix, args)
+                rate = args.rate or max_rate * 0.8
+                stats = simulate(
+                    profile, vcpu, ram_gb, workers, rate, mix, args.jobs, args.arrival, args.burst,
+                    args.core_speed, args.ram_headroom, args.seed,
+                ) if rate > 0 else None
+            except ValueError as e:
+                print(f"  {workers:>7d} | ✗ {e}")
+                continue
+            levels.append({"workers": workers, "max_videos_per_hour": round(max_rate, 1), "rate_per_hour": round(rate, 1), "at_rate": stats})
+            if not stats:
+                print(f"  {workers:>7d} | {0:>7d} | no rate keeps the p95 wait within {args.max_wait:g}s")
+            else:
+                print(
+                    f"  {workers:>7d} | {max_rate:>7.0f} | {rate:>7.0f} | {stats['queue_wait_seconds']['p50']:>7.1f}s | "
+                    f"{stats['queue_wait_seconds']['p95']:>7.1f}s | {stats['latency_seconds']['p95']:>7.1f}s | "
+                    f"{stats['cpu_utilization']:>4.0%} | {stats['peak_ram_mb']:>6.0f}MB"
+                )
+        best = max(levels, key=lambda l: l["max_videos_per_hour"], default=None)
+        if best and not best["max_videos_per_hour"]:
+            best = None
+        if best:
+            print(f"  → best: {best['workers']} workers, {best['max_videos_per_hour']:.0f} videos/h")
+        result["servers"].append({
+            "vcpu": vcpu, "ram_gb": ram_gb, "levels": levels,
+            "best_workers": best["workers"] if best else None,
+            "max_videos_per_hour": best["max_videos_per_hour"] if best else 0,
+        })
+
+    CAPACITY_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = CAPACITY_RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_capacity.json"
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n{'=' * 60}")
+    print(f"Results: {out}")
+    print(f"{'=' * 60}")
+
+
+if __name__ == "__main__":
+    main()
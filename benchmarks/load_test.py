@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+HTTP load harness for Sonivo.
+
+Starts the FastAPI app locally (uvicorn subprocess) and drives the real API the
+way the UI does: upload → waveform → /api/generate → progress polling, using the
+sine fixtures. Each concurrency level is measured separately, so contention
+between concurrent FFmpeg processes, the event loop and polling shows up in the
+numbers instead of being extrapolated from single-job runs.
+
+Reports throughput (videos/hour), job latency percentiles, API latency
+percentiles per endpoint and peak server RSS (process tree) per level, and
+writes one JSON per level to benchmarks/results/load/ for aggregate_results.py.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1,2,4 --jobs 8 --segment 15
+    python benchmarks/load_test.py --concurrency 4 --arrival-rate 6   # Poisson, jobs/min
+"""
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import psutil
+
+from benchmarks.aggregate_results import percentile
+from benchmarks.run_benchmarks import generate_fixture
+
+BENCHMARKS_DIR = PROJECT_ROOT / "benchmarks"
+RESULTS_DIR = BENCHMARKS_DIR / "results" / "load"
+OUTPUTS_DIR = PROJECT_ROOT / "outputs"
+UPLOADS_DIR = PROJECT_ROOT / "uploads"
+
+POLL_INTERVAL = 0.5  # same cadence as static/js/app.js
+JOB_TIMEOUT = 1800
+SERVER_START_TIMEOUT = 30
+
+
+class LoadStats:
+    """Thread-safe collection of latencies from all virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.api: dict[str, list[float]] = {}
+        self.jobs: list[float] = []
+        self.errors: list[str] = []
+
+    def api_call(self, endpoint: str, seconds: float):
+        with self._lock:
+            self.api.setdefault(endpoint, []).append(seconds)
+
+    def job_done(self, seconds: float):
+        with self._lock:
+            self.jobs.append(seconds)
+
+    def job_failed(self, error: str):
+        with self._lock:
+            self.errors.append(error)
+
+
+class ApiClient:
+    """Minimal stdlib HTTP client that times every request into LoadStats."""
+
+    def __init__(self, base_url: str, stats: LoadStats):
+        self.base_url = base_url
+        self.stats = stats
+
+    def request(self, endpoint: str, path: str, data: bytes = None, headers: dict = None) -> dict:
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                body = resp.read()
+        finally:
+            self.stats.api_call(endpoint, time.perf_counter() - start)
+        return json.loads(body)
+
+    def upload(self, audio_path: Path) -> dict:
+        boundary = uuid.uuid4().hex
+        body = b"".join([
+            f"--{boundary}\r\n".encode(),
+            f'Content-Disposition: form-data; name="file"; filename="{audio_path.name}"\r\n'.encode(),
+            b"Content-Type: application/octet-stream\r\n\r\n",
+            audio_path.read_bytes(),
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+        return self.request(
+            "upload", "/api/upload", body,
+            {"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+
+    def post_form(self, endpoint: str, path: str, fields: dict) -> dict:
+        data = urllib.parse.urlencode(fields).encode()
+        return self.request(endpoint, path, data, {"Content-Type": "application/x-www-form-urlencoded"})
+
+
+def run_job(client: ApiClient, audio_path: Path, segment: float, job_index: int, created: list) -> None:
+    """One user session: upload, waveform, generate, poll until done. Appends files it created."""
+    start = time.perf_counter()
+    upload = client.upload(audio_path)
+    try:
+        client.request("waveform", f"/api/waveform/{upload['file_id']}")
+
+        title = f"Load {job_index} {uuid.uuid4().hex[:6]}"
+        job = client.post_form("generate", "/api/generate", {
+            "file_id": upload["file_id"],
+            "artist": "Benchmark",
+            "title": title,
+            "start_sec": 0,
+            "end_sec": segment,
+        })
+
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            progress = client.request("progress", f"/api/progress/{job['job_id']}")
+            if progress["status"] == "done":
+                client.stats.job_done(time.perf_counter() - start)
+                created.append(OUTPUTS_DIR / progress["result"]["filename"])
+                return
+            if progress["status"] in ("error", "not_found"):
+                raise RuntimeError(progress.get("result", {}).get("error", progress["status"]))
+        raise TimeoutError(f"job {job['job_id']} did not finish in {JOB_TIMEOUT}s")
+    finally:
+        # Collected at the end so derived files (preview proxy, covers) are included
+        created.extend(UPLOADS_DIR.glob(f"{upload['file_id']}*"))
+
+
+def sample_rss(pid: int, stop: threading.Event, peak: list):
+    """Track peak RSS (MB) of the server process tree, including FFmpeg children."""
+    try:
+        proc = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    while not stop.is_set():
+        try:
+            rss = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+            peak[0] = max(peak[0], rss / (1024 * 1024))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return
+        stop.wait(0.25)
+
+
+def start_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=str(PROJECT_ROOT),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/progress/ping", timeout=1):
+                return proc
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not start in time")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_level(
+    base_url: str,
+    server_pid: int | None,
+    audio_path: Path,
+    segment: float,
+    concurrency: int,
+    jobs: int,
+    arrival_rate: float,
+) -> dict:
+    """
+    Run `jobs` sessions with at most `concurrency` in flight.
+    With arrival_rate (jobs/min) sessions arrive as a Poisson process; otherwise closed loop.
+    Peak RSS is only sampled when the server runs locally (server_pid given).
+    """
+    stats = LoadStats()
+    client = ApiClient(base_url, stats)
+    created: list[Path] = []
+
+    stop = threading.Event()
+    peak = [0.0]
+    sampler = None
+    if server_pid is not None:
+        sampler = threading.Thread(target=sample_rss, args=(server_pid, stop, peak), daemon=True)
+        sampler.start()
+
+    def session(i):
+        try:
+            run_job(client, audio_path, segment, i, created)
+        except Exception as e:
+            stats.job_failed(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(jobs):
+            if arrival_rate and i > 0:
+                time.sleep(random.expovariate(arrival_rate / 60.0))
+            pool.submit(session, i)
+    wall = time.perf_counter() - start
+
+    stop.set()
+    if sampler is not None:
+        sampler.join(timeout=2)
+
+    for path in created:
+        path.unlink(missing_ok=True)
+
+    completed = len(stats.jobs)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "concurrency": concurrency,
+        "arrival_rate_per_min": arrival_rate or None,
+        "segment_duration_seconds": segment,
+        "jobs": jobs,
+        "completed": completed,
+        "failed": len(stats.errors),
+        "errors": stats.errors[:10],
+        "wall_time_seconds": round(wall, 2),
+        "throughput_videos_per_hour": round(completed / wall * 3600, 1) if wall > 0 else 0,
+        "job_latency_seconds": {
+            "p50": round(percentile(stats.jobs, 50), 2),
+            "p95": round(percentile(stats.jobs, 95), 2),
+            "p99": round(percentile(stats.jobs, 99), 2),
+            "max": round(max(stats.jobs), 2) if stats.jobs else 0,
+        },
+        "api_latency_ms": {
+            endpoint: {
+                "count": len(times),
+                "p50": round(percentile(times, 50) * 1000, 1),
+                "p95": round(percentile(times, 95) * 1000, 1),
+                "p99": round(percentile(times, 99) * 1000, 1),
+            }
+            for endpoint, times in sorted(stats.api.items())
+        },
+        "peak_rss_mb": round(peak[0], 1) if sampler is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonivo HTTP load benchmark")
+    parser.add_argument("--concurrency", default="1,2,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--jobs", type=int, default=0, help="Jobs per level (default: 2 × concurrency)")
+    parser.add_argument("--segment", type=int, default=15, help="Segment length in seconds (sine fixture)")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="Poisson arrivals per minute (0 = closed loop)")
+    parser.add_argument("--url", default=None, help="Use an already running server instead of starting one")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    print("=" * 60)
+    print("Sonivo Load Benchmark")
+    print("=" * 60)
+
+    print("\n[1/3] Preparing fixtures...")
+    audio_path = generate_fixture(args.segment)
+
+    print("\n[2/3] Starting server...")
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        server_pid = None
+        print(f"  Using {base_url}")
+    else:
+        port = free_port()
+        server = start_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+        server_pid = server.pid
+        print(f"  ✓ uvicorn pid {server.pid} on {base_url}")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    print("\n[3/3] Running load levels...")
+    try:
+        for concurrency in levels:
+            jobs = args.jobs or concurrency * 2
+            print(f"\n  ── Concurrency {concurrency} ({jobs} jobs, {args.segment}s segments) ──")
+            result = run_level(
+                base_url, server_pid, audio_path, float(args.segment),
+                concurrency, jobs, args.arrival_rate,
+            )
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out = RESULTS_DIR / f"{ts}_{args.segment}s_c{concurrency}.json"
+            with open(out, "w") as f:
+                json.dump(result, f, indent=2)
+
+            lat = result["job_latency_seconds"]
+            rss = result["peak_rss_mb"]
+            rss_text = f"{rss:.0f}MB" if rss is not None else "n/a (remote server)"
+            print(
+                f"    ✓ {result['completed']}/{jobs} done | "
+                f"{result['throughput_videos_per_hour']:.0f} videos/h | "
+                f"job p50 {lat['p50']:.1f}s p95 {lat['p95']:.1f}s | "
+                f"peak RSS {rss_text}"
+            )
+            for endpoint, api in result["api_latency_ms"].items():
+                print(f"      {endpoint:<10s} p50 {api['p50']:7.1f}ms  p95 {api['p95']:7.1f}ms  (n={api['count']})")
+            if result["failed"]:
+                print(f"    ✗ {result['failed']} failed: {result['errors'][0]}")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    print(f"\n{'=' * 60}")
+    print(f"Results: {RESULTS_DIR}")
+    print(f"{'=' * 60}")
+
+
+if __name__ == "__main__":
+    main()
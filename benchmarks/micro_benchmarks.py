@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Stage-level micro-benchmarks for the Sonivo render pipeline.
+
+Times each stage in isolation (warm-up + repeated runs) instead of whole
+generate_video() jobs, so a regression in one stage shows up in seconds:
+
+    create_vinyl_image, prerender_rotation_cycle, composite_frame,
+    generate_waveform_peaks, extract_metadata, extract_dominant_colors
+
+Usage:
+    python benchmarks/micro_benchmarks.py                     # run and print
+    python benchmarks/micro_benchmarks.py --save-baseline     # store baseline
+    python benchmarks/micro_benchmarks.py --compare           # fail on regression
+    python benchmarks/micro_benchmarks.py --compare --threshold 0.25 --stage create_vinyl_image
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np
+
+from app.services.audio_processor import extract_metadata, generate_waveform_peaks
+from app.services.image_processor import create_vinyl_image, extract_dominant_colors
+from app.services.video_generator import HEIGHT, VINYL_SIZE, WIDTH, _prerender_rotation_cycle
+from benchmarks.aggregate_results import percentile
+
+BENCHMARKS_DIR = PROJECT_ROOT / "benchmarks"
+FIXTURES_DIR = BENCHMARKS_DIR / "fixtures"
+RESULTS_DIR = BENCHMARKS_DIR / "results" / "micro"
+BASELINES_DIR = BENCHMARKS_DIR / "baselines"
+BASELINE_PATH = BASELINES_DIR / "micro_baseline.json"
+
+DEFAULT_WARMUP = 2
+DEFAULT_REPEAT = 10
+DEFAULT_THRESHOLD = 0.15  # fail when the median is >15% slower than baseline
+
+# Frames composited per measured run of the composite_frame stage
+COMPOSITE_FRAMES = 120
+
+
+def prepare_fixtures() -> dict:
+    """Reuse the end-to-end fixtures; build a tagged MP3 with embedded art for Mutagen."""
+    from benchmarks.run_benchmarks import generate_cover_fixture, generate_fixture
+
+    audio = generate_fixture(15)
+    cover = generate_cover_fixture()
+
+    tagged = FIXTURES_DIR / "micro_tagged.mp3"
+    if not tagged.exists():
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", str(audio), "-i", str(cover),
+            "-map", "0:a", "-map", "1:v",
+            "-c:a", "libmp3lame", "-b:a", "192k",
+            "-c:v", "mjpeg", "-disposition:v", "attached_pic",
+            "-id3v2_version", "3",
+            "-metadata", "artist=Benchmark", "-metadata", "title=Micro",
+            str(tagged),
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            tagged = audio
+
+    return {"audio": audio, "cover": cover, "tagged": tagged}
+
+
+def build_stages(fixtures: dict) -> dict:
+    """
+    Map stage name -> (setup, run[, teardown]). setup() returns the run argument,
+    so per-stage inputs (e.g. the vinyl base) are built outside the timed region;
+    teardown(arg) frees them afterwards.
+    """
+    cover = str(fixtures["cover"])
+
+    def vinyl_setup():
+        return create_vinyl_image(cover, VINYL_SIZE)
+
+    def prerender_run(vinyl):
+        _prerender_rotation_cycle(vinyl).release()
+
+    def composite_setup():
+        cycle = _prerender_rotation_cycle(create_vinyl_image(cover, VINYL_SIZE))
+        return cycle, np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    def composite_run(state):
+        cycle, frame_buffer = state
+        for i in range(COMPOSITE_FRAMES):
+            cycle.render_into(frame_buffer, i % len(cycle))
+
+    def composite_teardown(state):
+        state[0].release()
+
+    return {
+        "create_vinyl_image": (lambda: None, lambda _: create_vinyl_image(cover, VINYL_SIZE)),
+        "prerender_rotation_cycle": (vinyl_setup, prerender_run),
+        "composite_frame": (composite_setup, composite_run, composite_teardown),
+        "generate_waveform_peaks": (lambda: None, lambda _: generate_waveform_peaks(str(fixtures["audio"]))),
+        "extract_metadata": (lambda: None, lambda _: extract_metadata(str(fixtures["tagged"]))),
+        "extract_dominant_colors": (lambda: None, lambda _: extract_dominant_colors(cover)),
+    }
+
+
+def run_stage(setup, run, warmup: int, repeat: int, teardown=None) -> dict:
+    """Warm up, then time `repeat` runs; returns summary statistics in seconds."""
+    arg = setup()
+    times = []
+    try:
+        for _ in range(warmup):
+            run(arg)
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(arg)
+            times.append(time.perf_counter() - start)
+    finally:
+        if teardown is not None:
+            teardown(arg)
+
+    return {
+        "runs": repeat,
+        "min": round(min(times), 6),
+        "median": round(statistics.median(times), 6),
+        "mean": round(statistics.fmean(times), 6),
+        "p95": round(percentile(times, 95), 6),
+        "stdev": round(statistics.stdev(times), 6) if len(times) > 1 else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Compare medians against the baseline; a stage regresses above `threshold`."""
+    rows = []
+    for name, stats in results.items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or base["median"] <= 0:
+            rows.append({"stage": name, "status": "new", "change": None})
+            continue
+        change = (stats["median"] - base["median"]) / base["median"]
+        status = "regressed" if change > threshold else "ok"
+        rows.append({"stage": name, "status": status, "change": change, "baseline": base["median"]})
+    return rows
+
+
+def machine_fingerprint() -> dict:
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "python_version": platform.python_version(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonivo stage micro-benchmarks")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--stage", action="append", help="Only run this stage (repeatable)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write {BASELINE_PATH.name}")
+    parser.add_argument("--compare", action="store_true", help="Exit 1 if a stage regressed")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed median slowdown before failing (0.15 = 15%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Sonivo Micro-Benchmarks")
+    print("=" * 60)
+
+    print("\n[1/3] Preparing fixtures...")
+    fixtures = prepare_fixtures()
+    stages = build_stages(fixtures)
+    selected = args.stage or list(stages.keys())
+    unknown = [s for s in selected if s not in stages]
+    if unknown:
+        print(f"ERROR: unknown stage(s): {', '.join(unknown)}. Available: {', '.join(stages)}")
+        sys.exit(2)
+
+    print(f"\n[2/3] Running {len(selected)} stages ({args.warmup} warm-up + {args.repeat} runs each)...")
+    results = {}
+    for name in selected:
+        setup, run, *teardown = stages[name]
+        print(f"  {name:<26s} ", end="", flush=True)
+        results[name] = run_stage(setup, run, args.warmup, args.repeat, *teardown)
+        r = results[name]
+        print(f"median {r['median'] * 1000:9.2f} ms | p95 {r['p95'] * 1000:9.2f} ms | ±{r['stdev'] * 1000:.2f}")
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "machine": machine_fingerprint(),
+        "warmup": args.warmup,
+        "repeat": args.repeat,
+        "composite_frames_per_run": COMPOSITE_FRAMES,
+        "stages": results,
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_micro.json"
+    with open(result_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n[3/3] Baseline...")
+    exit_code = 0
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"  ERROR: no baseline at {args.baseline}. Run with --save-baseline first.")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print(f"  ⚠ Baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+
+        for row in compare(results, baseline, args.threshold):
+            if row["status"] == "new":
+                print(f"  {row['stage']:<26s} no baseline")
+                continue
+            mark = "✗" if row["status"] == "regressed" else "✓"
+            print(f"  {mark} {row['stage']:<24s} {row['change'] * 100:+6.1f}% vs {row['baseline'] * 1000:.2f} ms")
+            if row["status"] == "regressed":
+                exit_code = 1
+
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+        baseline = report
+        if args.baseline.exists() and args.stage:
+            # Partial run: only replace the selected stages
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            baseline["stages"].update(results)
+            baseline["timestamp"] = report["timestamp"]
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"  ✓ Baseline saved to {args.baseline}")
+
+    print(f"\n{'=' * 60}")
+    print(f"Results: {result_path}")
+    if exit_code:
+        print(f"FAILED: stage regression above {args.threshold * 100:.0f}%")
+    print(f"{'=' * 60}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,26 @@ Benchmark runner for Sonivo video generation pipeline.
 Generates synthetic audio fixtures (sine waves via FFmpeg), then runs
 the real generate_video() function with BenchmarkSession instrumentation.
 
+With --matrix it instead runs a fixture matrix over realistic inputs: audio
+codec (WAV/MP3/AAC/FLAC), duration (short to very long) and cover size
+(300–3000 px JPEG, uploaded or embedded in the audio tags). Each dimension is
+varied around MATRIX_BASE; --full-matrix runs every combination.
+
 Usage:
     python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --matrix
+    python benchmarks/run_benchmarks.py --matrix --durations 15,60 --runs 2
+    python benchmarks/run_benchmarks.py --durations 30 --runs 1 --profile-memory
 """
+import argparse
+import itertools
 import json
 import os
 import platform
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
 from pathlib import Path
 
@@ -20,7 +32,9 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from app.services.benchmarking import BenchmarkSession
+from app.services.audio_processor import extract_metadata
+from app.services.benchmarking import MATRIX_RESULTS_DIR, TRACES_DIR, BenchmarkSession
+from app.services.timing import span
 from app.services.video_generator import generate_video
 
 BENCHMARKS_DIR = PROJECT_ROOT / "benchmarks"
@@ -33,6 +47,20 @@ DURATIONS = [15, 30, 60, 120, 300]
 WARMUP_RUNS = 1
 MEASURED_RUNS = 5
 
+# Fixture matrix (--matrix)
+MATRIX_CODECS = {
+    # codec: (container extension, ffmpeg encoder args)
+    "wav": ("wav", ["-c:a", "pcm_s16le"]),
+    "mp3": ("mp3", ["-c:a", "libmp3lame", "-b:a", "320k"]),
+    "aac": ("m4a", ["-c:a", "aac", "-b:a", "256k"]),
+    "flac": ("flac", ["-c:a", "flac"]),
+}
+MATRIX_DURATIONS = [15, 60, 300, 1200]
+MATRIX_COVER_SIZES = [300, 1000, 3000]
+MATRIX_COVER_SOURCES = ["uploaded", "embedded"]
+MATRIX_BASE = {"codec": "mp3", "duration": 60, "cover_size": 1000, "cover_source": "uploaded"}
+MATRIX_RUNS = 3
+
 
 def collect_system_info() -> dict:
     """Gather machine info and save to system_info.json."""
@@ -167,11 +195,219 @@ def generate_cover_fixture() -> Path:
     return cover_path
 
 
+def generate_audio_fixture(duration_sec: int, codec: str) -> Path:
+    """
+    Generate a music-like fixture (tone over pink noise, so lossy encoders do
+    real work) in the given codec. Cached in benchmarks/fixtures/.
+    """
+    ext, codec_args = MATRIX_CODECS[codec]
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    filepath = FIXTURES_DIR / f"matrix_{duration_sec}s_{codec}.{ext}"
+    if filepath.exists():
+        return filepath
+
+    print(f"  Generating {duration_sec}s {codec} fixture...")
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration_sec}",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.2:duration={duration_sec}",
+        "-filter_complex", "amix=inputs=2:duration=first",
+        "-ar", "44100", "-ac", "2",
+        *codec_args,
+        str(filepath),
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+    return filepath
+
+
+def generate_jpeg_cover_fixture(size: int) -> Path:
+    """Generate a photo-like JPEG cover (gradient + grain) so file size and decode cost are realistic."""
+    import numpy as np
+    from PIL import Image
+
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    cover_path = FIXTURES_DIR / f"cover_{size}px.jpg"
+    if cover_path.exists():
+        return cover_path
+
+    rng = np.random.default_rng(size)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    pixels = np.empty((size, size, 3), dtype=np.float32)
+    pixels[..., 0] = ramp[None, :]
+    pixels[..., 1] = ramp[:, None]
+    pixels[..., 2] = 255 - ramp[None, :]
+    pixels += rng.normal(0, 24, pixels.shape)
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(str(cover_path), quality=92)
+    return cover_path
+
+
+def embed_cover(audio_path: Path, cover_path: Path) -> Path:
+    """Copy an audio fixture with the cover embedded in its tags (ID3 APIC / MP4 covr / FLAC picture)."""
+    from mutagen import File as MutagenFile
+    from mutagen.flac import FLAC, Picture
+    from mutagen.id3 import APIC
+    from mutagen.mp4 import MP4, MP4Cover
+
+    target = audio_path.with_name(f"{audio_path.stem}_{cover_path.stem}{audio_path.suffix}")
+    if target.exists():
+        return target
+
+    shutil.copyfile(audio_path, target)
+    data = cover_path.read_bytes()
+    audio = MutagenFile(str(target))
+
+    if isinstance(audio, MP4):
+        audio["covr"] = [MP4Cover(data, imageformat=MP4Cover.FORMAT_JPEG)]
+    elif isinstance(audio, FLAC):
+        picture = Picture()
+        picture.type = 3  # front cover
+        picture.mime = "image/jpeg"
+        picture.data = data
+        audio.add_picture(picture)
+    else:  # MP3 and WAV both carry ID3
+        if audio.tags is None:
+            audio.add_tags()
+        audio.tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=data))
+    audio.save()
+    return target
+
+
+def matrix_cases(durations: list[int], full: bool = False) -> list[dict]:
+    """
+    Fixture cases. By default each dimension is varied on its own around
+    MATRIX_BASE ("varied" names the dimension), so per-dimension groups are
+    controlled comparisons; full=True runs the cartesian product.
+    """
+    if full:
+        return [
+            {"codec": c, "duration": d, "cover_size": s, "cover_source": src, "varied": "all"}
+            for c, d, s, src in itertools.product(
+                MATRIX_CODECS, durations, MATRIX_COVER_SIZES, MATRIX_COVER_SOURCES
+            )
+        ]
+
+    base = dict(MATRIX_BASE)
+    if base["duration"] not in durations:
+        base["duration"] = durations[0]
+
+    cases = [{**base, "varied": "base"}]
+    dimensions = {
+        "codec": list(MATRIX_CODECS),
+        "duration": durations,
+        "cover_size": MATRIX_COVER_SIZES,
+        "cover_source": MATRIX_COVER_SOURCES,
+    }
+    for dimension, values in dimensions.items():
+        for value in values:
+            if value != base[dimension]:
+                cases.append({**base, dimension: value, "varied": dimension})
+    return cases
+
+
+def case_label(case: dict) -> str:
+    return f"{case['codec']}_{case['cover_size']}px_{case['cover_source']}"
+
+
+def run_matrix_benchmark(case: dict, run_label: str, profile_memory: bool = False) -> dict:
+    """
+    Run one fixture case the way the API does: the upload's metadata/cover
+    extraction (Mutagen) is timed inside the session, then generate_video().
+    """
+    duration = case["duration"]
+    audio_path = generate_audio_fixture(duration, case["codec"])
+    cover_path = generate_jpeg_cover_fixture(case["cover_size"])
+    if case["cover_source"] == "embedded":
+        audio_path = embed_cover(audio_path, cover_path)
+
+    # Work on a copy so extracted covers land in a scratch dir, like uploads/
+    work_dir = Path(tempfile.mkdtemp(prefix="sonivo_bench_"))
+    upload_path = work_dir / f"upload{audio_path.suffix}"
+    shutil.copyfile(audio_path, upload_path)
+    output_path = OUTPUTS_DIR / f"bench_{duration}s_{case_label(case)}_{run_label}.mp4"
+
+    session = BenchmarkSession(
+        segment_duration=float(duration),
+        audio_duration=float(duration),
+        label=f"{case_label(case)}_{run_label}",
+        save_results=True,
+        fixture={
+            **case,
+            "container": audio_path.suffix.lstrip("."),
+            "audio_mb": round(audio_path.stat().st_size / (1024 * 1024), 2),
+            "cover_mb": round(cover_path.stat().st_size / (1024 * 1024), 2),
+        },
+        profile_memory=profile_memory,
+        results_dir=MATRIX_RESULTS_DIR,
+    )
+
+    try:
+        with session:
+            with span("extract_metadata"):
+                metadata = extract_metadata(str(upload_path))
+            if case["cover_source"] == "embedded":
+                job_cover = metadata.get("cover_path")
+                if not job_cover:
+                    raise RuntimeError(f"embedded cover not extracted from {audio_path.name}")
+            else:
+                job_cover = str(cover_path)
+
+            generate_video(
+                audio_path=str(upload_path),
+                cover_path=job_cover,
+                artist="Benchmark",
+                title=f"Matrix {case_label(case)}",
+                start_sec=0,
+                end_sec=float(duration),
+                output_path=str(output_path),
+                benchmark_session=session,
+            )
+    finally:
+        output_path.unlink(missing_ok=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return session.metrics
+
+
+def run_matrix(cases: list[dict], runs: int, profile_memory: bool = False):
+    """Warm up once per case, then run each case `runs` times."""
+    total_runs = len(cases) * (WARMUP_RUNS + runs)
+    current_run = 0
+
+    for case in cases:
+        print(f"\n  ── {case['codec']} | {case['duration']}s | {case['cover_size']}px {case['cover_source']} ──")
+        for w in range(WARMUP_RUNS):
+            current_run += 1
+            print(f"    [{current_run}/{total_runs}] Warm-up {w+1}... ", end="", flush=True)
+            try:
+                m = run_matrix_benchmark(case, f"warmup_{w+1}", profile_memory)
+                print(f"✓ {m['total_job_time_seconds']:.1f}s")
+            except Exception as e:
+                print(f"✗ Error: {e}")
+            for f in [*MATRIX_RESULTS_DIR.glob(f"*_{case_label(case)}_warmup_*.json"),
+                      *(MATRIX_RESULTS_DIR / "traces").glob(f"*_{case_label(case)}_warmup_*.trace.json")]:
+                f.unlink()
+
+        for r in range(runs):
+            current_run += 1
+            print(f"    [{current_run}/{total_runs}] Run {r+1}/{runs}... ", end="", flush=True)
+            try:
+                m = run_matrix_benchmark(case, f"run_{r+1}", profile_memory)
+                print(
+                    f"✓ {m['total_job_time_seconds']:.1f}s | "
+                    f"Peak RAM {m['peak_memory_mb']:.0f}MB | "
+                    f"metadata {m.get('stages', {}).get('extract_metadata', {}).get('seconds', 0) * 1000:.0f}ms"
+                )
+            except Exception as e:
+                print(f"✗ Error: {e}")
+            time.sleep(1)
+
+
 def run_single_benchmark(
     audio_path: Path,
     cover_path: Path,
     duration: int,
     run_label: str,
+    profile_memory: bool = False,
 ) -> dict:
     """Run a single benchmark and return metrics."""
     output_filename = f"bench_{duration}s_{run_label}.mp4"
@@ -186,6 +422,7 @@ def run_single_benchmark(
         audio_duration=float(duration),
         label=run_label,
         save_results=True,
+        profile_memory=profile_memory,
     )
 
     with session:
@@ -208,12 +445,30 @@ def run_single_benchmark(
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Sonivo benchmark runner")
+    parser.add_argument("--matrix", action="store_true", help="Run the codec/duration/cover fixture matrix")
+    parser.add_argument("--full-matrix", action="store_true", help="Run every matrix combination (slow)")
+    parser.add_argument("--durations", default=None, help="Comma-separated durations in seconds")
+    parser.add_argument("--runs", type=int, default=None, help="Measured runs per case")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Attribute memory per stage (tracemalloc + /proc); slows runs down")
+    args = parser.parse_args()
+    matrix = args.matrix or args.full_matrix
+
+    durations = DURATIONS
+    if args.durations:
+        durations = [int(d) for d in args.durations.split(",") if d.strip()]
+    elif matrix:
+        durations = MATRIX_DURATIONS
+    runs = args.runs or (MATRIX_RUNS if matrix else MEASURED_RUNS)
+
     print("=" * 60)
-    print("Sonivo Benchmark Runner")
+    print("Sonivo Benchmark Runner" + (" (fixture matrix)" if matrix else ""))
     print("=" * 60)
 
     # Ensure directories exist
-    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results_dir = MATRIX_RESULTS_DIR if matrix else RESULTS_DIR
+    results_dir.mkdir(parents=True, exist_ok=True)
     OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
 
     # Step 1: Collect system info
@@ -231,15 +486,24 @@ def main():
     # Step 2: Generate fixtures
     print("\n[2/4] Preparing audio fixtures...")
     fixtures = {}
-    for dur in DURATIONS:
-        fixtures[dur] = generate_fixture(dur)
-    cover = generate_cover_fixture()
-    print(f"  ✓ Cover image ready: {cover.name}")
+    if matrix:
+        cases = matrix_cases(durations, full=args.full_matrix)
+        for case in cases:
+            audio = generate_audio_fixture(case["duration"], case["codec"])
+            cover_fixture = generate_jpeg_cover_fixture(case["cover_size"])
+            if case["cover_source"] == "embedded":
+                embed_cover(audio, cover_fixture)
+        print(f"  ✓ {len(cases)} matrix cases ready")
+    else:
+        for dur in durations:
+            fixtures[dur] = generate_fixture(dur)
+        cover = generate_cover_fixture()
+        print(f"  ✓ Cover image ready: {cover.name}")
 
     # Step 3: Clean old results
     print("\n[3/4] Cleaning previous results...")
     old_count = 0
-    for f in RESULTS_DIR.glob("*.json"):
+    for f in [*results_dir.glob("*.json"), *(results_dir / "traces").glob("*.trace.json")]:
         f.unlink()
         old_count += 1
     if old_count:
@@ -249,10 +513,13 @@ def main():
 
     # Step 4: Run benchmarks
     print("\n[4/4] Running benchmarks...")
-    total_runs = len(DURATIONS) * (WARMUP_RUNS + MEASURED_RUNS)
+    total_runs = 0 if matrix else len(durations) * (WARMUP_RUNS + runs)
     current_run = 0
 
-    for dur in DURATIONS:
+    if matrix:
+        run_matrix(cases, runs, args.profile_memory)
+
+    for dur in fixtures:
         audio_path = fixtures[dur]
         print(f"\n  ── Duration: {dur}s ──")
 
@@ -261,21 +528,22 @@ def main():
             current_run += 1
             print(f"    [{current_run}/{total_runs}] Warm-up {w+1}... ", end="", flush=True)
             try:
-                m = run_single_benchmark(audio_path, cover, dur, f"warmup_{w+1}")
+                m = run_single_benchmark(audio_path, cover, dur, f"warmup_{w+1}", args.profile_memory)
                 print(f"✓ {m['total_job_time_seconds']:.1f}s")
             except Exception as e:
                 print(f"✗ Error: {e}")
             # Delete warm-up result files (they were saved but we don't need them)
-            for f in RESULTS_DIR.glob(f"*_{dur}s_warmup_*.json"):
+            for f in [*RESULTS_DIR.glob(f"*_{dur}s_warmup_*.json"),
+                      *TRACES_DIR.glob(f"*_{dur}s_warmup_*.trace.json")]:
                 f.unlink()
 
         # Measured runs
-        for r in range(MEASURED_RUNS):
+        for r in range(runs):
             current_run += 1
             run_label = f"run_{r+1}"
-            print(f"    [{current_run}/{total_runs}] Run {r+1}/{MEASURED_RUNS}... ", end="", flush=True)
+            print(f"    [{current_run}/{total_runs}] Run {r+1}/{runs}... ", end="", flush=True)
             try:
-                m = run_single_benchmark(audio_path, cover, dur, run_label)
+                m = run_single_benchmark(audio_path, cover, dur, run_label, args.profile_memory)
                 print(
                     f"✓ {m['total_job_time_seconds']:.1f}s | "
                     f"CPU {m['avg_cpu_percent']:.0f}% | "
@@ -288,10 +556,10 @@ def main():
             time.sleep(1)
 
     # Summary
-    result_files = list(RESULTS_DIR.glob("*.json"))
+    result_files = list(results_dir.glob("*.json"))
     print(f"\n{'=' * 60}")
     print(f"Benchmark complete! {len(result_files)} result files saved.")
-    print(f"Results: {RESULTS_DIR}")
+    print(f"Results: {results_dir}")
     print(f"System info: {sys_info_path}")
     print(f"{'=' * 60}")
 
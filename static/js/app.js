@@ -23,9 +23,10 @@ const state = {
         audioBuffer: null,
         sourceNode: null,
         isPlaying: false,
+        jobId: null, // render in progress, cancelled if the page goes away
     },
     batch: {
-        tracks: [], // { fileId, filePath, artist, title, album, duration, coverUrl, coverPath, startSec, endSec, peaks }
+        tracks: [], // { fileId, filePath, artist, title, album, duration, coverUrl (thumbnail), coverPath, startSec, endSec, peaks }
         playingIdx: -1, // index of currently playing track, -1 if none
         playCheckInterval: null,
     },
@@ -68,6 +69,7 @@ const generateBtnSingle = $('generate-btn-single');
 const progressSingle = $('progress-single');
 const progressTextSingle = $('progress-text-single');
 const progressFillSingle = $('progress-fill-single');
+const cancelBtnSingle = $('cancel-btn-single');
 const resultSingle = $('result-single');
 const resultVideoSingle = $('result-video-single');
 const downloadLinkSingle = $('download-link-single');
@@ -377,6 +379,9 @@ function stopAudio() {
 generateBtnSingle.addEventListener('click', generateSingleVideo);
 
 async function generateSingleVideo() {
+    // Never leave an earlier render running in the background
+    if (state.single.jobId) cancelJob(state.single.jobId);
+
     const formData = new FormData();
     formData.append('file_id', state.single.fileId);
     formData.append('artist', artistSingle.value);
@@ -406,10 +411,17 @@ async function generateSingleVideo() {
             throw new Error(err.detail || 'Generation failed');
         }
         const { job_id } = await startRes.json();
+        state.single.jobId = job_id;
 
         // Poll progress until done
         const result = await pollProgress(job_id);
+        state.single.jobId = null;
 
+        if (result.status === 'cancelled') {
+            progressSingle.classList.add('hidden');
+            editorSingle.classList.remove('hidden');
+            return;
+        }
         if (result.status === 'error') {
             throw new Error(result.result?.error || 'Generation failed');
         }
@@ -428,6 +440,10 @@ async function generateSingleVideo() {
     }
 }
 
+function formatEta(seconds) {
+    return seconds < 90 ? `${Math.ceil(seconds)}s` : `${Math.round(seconds / 60)} min`;
+}
+
 function pollProgress(jobId) {
     return new Promise((resolve, reject) => {
         const interval = setInterval(async () => {
@@ -437,10 +453,13 @@ function pollProgress(jobId) {
 
                 if (data.progress >= 0) {
                     progressFillSingle.style.width = data.progress + '%';
-                    progressTextSingle.textContent = `Rendering... ${data.progress}%`;
+                    let text = data.queued ? 'Waiting for a render slot' : `Rendering... ${data.progress}%`;
+                    if (data.fps) text += ` · ${Math.round(data.fps)} fps`;
+                    if (data.eta_seconds != null) text += ` · ready in ~${formatEta(data.eta_seconds)}`;
+                    progressTextSingle.textContent = text;
                 }
 
-                if (data.status === 'done' || data.status === 'error') {
+                if (data.status === 'done' || data.status === 'error' || data.status === 'cancelled') {
                     clearInterval(interval);
                     resolve(data);
                 }
@@ -451,6 +470,21 @@ function pollProgress(jobId) {
     });
 }
 
+function cancelJob(jobId) {
+    // sendBeacon still goes out while the page is being unloaded
+    navigator.sendBeacon(`/api/cancel/${jobId}`);
+}
+
+cancelBtnSingle.addEventListener('click', () => {
+    if (!state.single.jobId) return;
+    cancelJob(state.single.jobId);
+    progressTextSingle.textContent = 'Cancelling...';
+});
+
+window.addEventListener('pagehide', () => {
+    if (state.single.jobId) cancelJob(state.single.jobId);
+});
+
 newVideoBtnSingle.addEventListener('click', () => {
     resultSingle.classList.add('hidden');
     uploadZoneSingle.classList.remove('hidden');
@@ -491,7 +525,7 @@ async function uploadBatchFiles(files) {
                 title: data.title,
                 album: data.album,
                 duration: data.duration,
-                coverUrl: data.cover_url,
+                coverUrl: data.thumbnail_url || data.cover_url,
                 coverPath: data.cover_path,
                 startSec: 0,
                 endSec: Math.min(30, data.duration),